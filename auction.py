@@ -4,46 +4,644 @@
 # for FPGA acceleration on the PYNQ platform
 # This is largely ported from Edmund Brekkes Matlab implementation
 
+import functools
+import inspect
+import time
 import numpy as np
+from collections import deque, namedtuple
+
+from backend import jit
+from observers import observerFor
+
+
+# Compressed per-track adjacency of a reward matrix (the same layout as a CSC matrix).
+# The feasible measurements of track j are measIdx[trackPtr[j]:trackPtr[j+1]] with the rewards in
+# rewards[trackPtr[j]:trackPtr[j+1]]. shape is (numMeas, numTracks) like the reward matrix.
+TrackAdjacency = namedtuple('TrackAdjacency', ['trackPtr', 'measIdx', 'rewards', 'shape'])
+
+# Feasible pairs the compiled auction scans, roughly, between looks at the clock when it has a time limit
+ANYTIME_CHUNK = 8192
+
+
+def forbiddenValue(dtype):
+    # The value that marks a forbidden pair in a dense reward matrix of dtype. -inf for floats, and the
+    # smallest value of the type for integer rewards (see fixedpoint.py)
+    if np.issubdtype(dtype, np.integer):
+        return np.iinfo(dtype).min
+    return -np.inf
+
+
+def trackAdjacency(rewardMatrix):
+    # Convert a reward matrix to a TrackAdjacency. Most pairs are forbidden by gating so this lets the
+    # solvers touch only the feasible measurements of a track, and the memory scales with those.
+    # For a dense matrix the feasible pairs are the ones that are not forbiddenValue.
+    # For a scipy.sparse matrix the stored entries are the feasible pairs.
+    # Integer rewards keep their type, anything else becomes float.
+    if isinstance(rewardMatrix, TrackAdjacency):
+        return rewardMatrix
+
+    if hasattr(rewardMatrix, 'tocsc'):
+        csc = rewardMatrix.tocsc()
+        rewards = csc.data if np.issubdtype(csc.data.dtype, np.integer) else csc.data.astype(float)
+        return TrackAdjacency(csc.indptr.astype(int), csc.indices.astype(int), rewards, csc.shape)
+
+    # A dense matrix is read as it is, whatever its memory order, float precision or writeability. Only the
+    # feasible rewards are copied (as float64 unless integer), see denseAdjacency
+    rewardMatrix = np.asarray(rewardMatrix)
+    if not (np.issubdtype(rewardMatrix.dtype, np.integer) or np.issubdtype(rewardMatrix.dtype, np.floating)):
+        rewardMatrix = rewardMatrix.astype(float)
+    return denseAdjacency(rewardMatrix)
+
+
+def denseAdjacency(rewardMatrix, trackPtr=None, measIdx=None, rewards=None):
+    # trackAdjacency of a dense integer or float matrix, written into trackPtr, measIdx and rewards if given
+    # (rewards and measIdx long enough for every feasible pair). A matrix laid out track-major (Fortran order
+    # or the transpose of a C order matrix) is read a track at a time, any other a measurement at a time, so
+    # the matrix is always read in memory order and only the writes jump around
+    numMeas, numTracks = rewardMatrix.shape
+    integer = np.issubdtype(rewardMatrix.dtype, np.integer)
+    forbidden = forbiddenValue(rewardMatrix.dtype)
+    trackMajor = abs(rewardMatrix.strides[0]) < abs(rewardMatrix.strides[1])
+    if trackPtr is None:
+        trackPtr = np.zeros(numTracks + 1, dtype=int)
+    if trackMajor:
+        countFeasibleTrackMajor(rewardMatrix, forbidden, trackPtr)
+    else:
+        countFeasible(rewardMatrix, forbidden, trackPtr)
+    count = trackPtr[numTracks]
+    if measIdx is None:
+        measIdx = np.empty(count, dtype=int)
+        rewards = np.empty(count, dtype=rewardMatrix.dtype if integer else float)
+    else:
+        measIdx = measIdx[:count]
+        rewards = rewards[:count]
+    if trackMajor:
+        fillFeasibleTrackMajor(rewardMatrix, forbidden, measIdx, rewards)
+    else:
+        fillFeasible(rewardMatrix, forbidden, trackPtr, measIdx, rewards)
+    return TrackAdjacency(trackPtr, measIdx, rewards, rewardMatrix.shape)
+
+
+@jit
+def countFeasible(rewardMatrix, forbidden, trackPtr):
+    # trackPtr of the feasible pairs, reading the matrix a measurement at a time
+    numMeas, numTracks = rewardMatrix.shape
+    trackPtr[:] = 0
+    for meas in range(numMeas):
+        for track in range(numTracks):
+            if rewardMatrix[meas, track] > forbidden:
+                trackPtr[track + 1] += 1
+    for track in range(numTracks):
+        trackPtr[track + 1] += trackPtr[track]
+
+
+@jit
+def fillFeasible(rewardMatrix, forbidden, trackPtr, measIdx, rewards):
+    # measIdx and rewards of the feasible pairs, reading the matrix a measurement at a time. Each track
+    # gets its measurements in order, like a track at a time. trackPtr[track] is where the next entry of
+    # track goes, so after the fill it has moved up one track and is shifted back
+    numMeas, numTracks = rewardMatrix.shape
+    for meas in range(numMeas):
+        for track in range(numTracks):
+            reward = rewardMatrix[meas, track]
+            if reward > forbidden:
+                measIdx[trackPtr[track]] = meas
+                rewards[trackPtr[track]] = reward
+                trackPtr[track] += 1
+    for track in range(numTracks, 0, -1):
+        trackPtr[track] = trackPtr[track - 1]
+    trackPtr[0] = 0
+
+
+@jit
+def countFeasibleTrackMajor(rewardMatrix, forbidden, trackPtr):
+    # countFeasible, reading the matrix a track at a time
+    numMeas, numTracks = rewardMatrix.shape
+    trackPtr[0] = 0
+    for track in range(numTracks):
+        count = 0
+        for meas in range(numMeas):
+            if rewardMatrix[meas, track] > forbidden:
+                count += 1
+        trackPtr[track + 1] = trackPtr[track] + count
+
+
+@jit
+def fillFeasibleTrackMajor(rewardMatrix, forbidden, measIdx, rewards):
+    # fillFeasible, reading the matrix a track at a time
+    numMeas, numTracks = rewardMatrix.shape
+    count = 0
+    for track in range(numTracks):
+        for meas in range(numMeas):
+            reward = rewardMatrix[meas, track]
+            if reward > forbidden:
+                measIdx[count] = meas
+                rewards[count] = reward
+                count += 1
+
+
+def trackOfEntries(adjacency):
+    # The track of each entry in the adjacency
+    return np.repeat(np.arange(adjacency.shape[1]), np.diff(adjacency.trackPtr))
+
+
+@jit
+def transposeKernel(trackPtr, measIdx, rewards, numMeas):
+    # Counting sort of the entries on measurement. Within a measurement the tracks stay in order
+    measPtr = np.zeros(numMeas + 1, dtype=np.int64)
+    for i in range(measIdx.shape[0]):
+        measPtr[measIdx[i] + 1] += 1
+    for meas in range(numMeas):
+        measPtr[meas + 1] += measPtr[meas]
+
+    fill = measPtr[:-1].copy()
+    trackIdx = np.empty(measIdx.shape[0], dtype=np.int64)
+    measRewards = np.empty_like(rewards)
+    for track in range(trackPtr.shape[0] - 1):
+        for i in range(trackPtr[track], trackPtr[track + 1]):
+            trackIdx[fill[measIdx[i]]] = track
+            measRewards[fill[measIdx[i]]] = rewards[i]
+            fill[measIdx[i]] += 1
+    return measPtr, trackIdx, measRewards
+
+
+def transposeAdjacency(adjacency):
+    # The adjacency the other way around, per measurement: the feasible tracks of measurement i are
+    # trackIdx[measPtr[i]:measPtr[i+1]]. It is a TrackAdjacency of the transposed reward matrix
+    measPtr, trackIdx, measRewards = transposeKernel(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards,
+                                                     adjacency.shape[0])
+    return TrackAdjacency(measPtr, trackIdx, measRewards, (adjacency.shape[1], adjacency.shape[0]))
+
+
+def assignedEntries(adjacency, assignments):
+    # Boolean mask over the entries in the adjacency that are part of the assignment
+    return adjacency.measIdx == assignments[trackOfEntries(adjacency)]
+
+
+def ownersOf(assignments, numMeas):
+    # The track that holds each measurement, -1 if it is unassigned
+    owners = np.full(numMeas, fill_value=-1, dtype=int)
+    assigned = np.where(assignments != -1)[0]
+    owners[assignments[assigned]] = assigned
+    return owners
+
+
+@jit
+def fillOwners(assignments, owners):
+    # ownersOf written into owners
+    owners[:] = -1
+    for track in range(assignments.shape[0]):
+        if assignments[track] != -1:
+            owners[assignments[track]] = track
+
+
+@jit
+def heldEntries(trackPtr, measIdx, assignments):
+    # The entry of each track that holds its measurement, -1 if the track is unassigned
+    held = np.full(assignments.shape[0], -1, dtype=np.int64)
+    for track in range(assignments.shape[0]):
+        if assignments[track] != -1:
+            for i in range(trackPtr[track], trackPtr[track + 1]):
+                if measIdx[i] == assignments[track]:
+                    held[track] = i
+                    break
+    return held
+
+
+@jit
+def heldRewards(trackPtr, measIdx, rewards, assignments, out):
+    # The rewards of the assigned pairs in track order, written to the start of out. Returns how many
+    count = 0
+    for track in range(assignments.shape[0]):
+        if assignments[track] != -1:
+            for i in range(trackPtr[track], trackPtr[track + 1]):
+                if measIdx[i] == assignments[track]:
+                    out[count] = rewards[i]
+                    count += 1
+                    break
+    return count
+
+
+def assignmentGain(adjacency, assignments, workspace=None):
+    # The "gain". That is the total reward for our chosen assignment.
+    # With a workspace.Workspace the rewards are gathered in its buffer, the sum is the same to the last bit
+    if workspace is not None:
+        out = workspace.gainBuffer(len(assignments))
+        count = heldRewards(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, assignments, out)
+        return np.sum(out[:count])
+    held = heldEntries(adjacency.trackPtr, adjacency.measIdx, assignments)
+    return np.sum(adjacency.rewards[held[held != -1]])
+
+
+def trackProfits(adjacency, prices):
+    # What each track would earn if it could pick freely at prices, staying unassigned is worth 0.
+    # Together with the prices these are the dual variables of the assignment problem
+    profits = np.zeros(adjacency.shape[1], dtype=np.result_type(adjacency.rewards.dtype, prices.dtype))
+    trackProfitsKernel(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, prices, profits)
+    return profits
+
+
+@jit
+def trackProfitsKernel(trackPtr, measIdx, rewards, prices, profits):
+    # The entries of a track are contiguous, profits starts out at 0
+    for track in range(profits.shape[0]):
+        for i in range(trackPtr[track], trackPtr[track + 1]):
+            profits[track] = max(profits[track], rewards[i] - prices[measIdx[i]])
+
+
+def dualBound(adjacency, prices):
+    # Any set of non-negative prices gives an upper bound on the optimal gain (the dual):
+    # the sum of the prices plus what each track would earn if it could pick freely at those prices
+    return np.sum(prices) + np.sum(trackProfits(adjacency, prices))
+
+
+def tightenPrices(adjacency, prices, assignments, sweeps=5):
+    # Prices from a larger epsilon, or from an earlier frame, overshoot. Lower the price of each assigned
+    # measurement to what the other tracks are willing to pay for it, that does not make any track less happy.
+    # Lowering one price raises the profit of its track, so a few sweeps catch most of the overshoot.
+    # prices is updated in place
+    held = heldEntries(adjacency.trackPtr, adjacency.measIdx, assignments)
+    profits = np.zeros(adjacency.shape[1])
+    willingness = np.zeros(adjacency.shape[0])
+    tightenKernel(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, prices, held, sweeps, profits, willingness)
+
+
+@jit
+def tightenKernel(trackPtr, measIdx, rewards, prices, held, sweeps, profits, willingness):
+    # The sweeps of tightenPrices. held is the held entry of each track or -1, see heldEntries.
+    # profits and willingness are scratch space
+    numTracks = held.shape[0]
+    for sweep in range(sweeps):
+        for track in range(numTracks):
+            i = held[track]
+            profits[track] = 0 if i == -1 else max(rewards[i] - prices[measIdx[i]], 0)
+
+        willingness[:] = 0
+        for track in range(numTracks):
+            for i in range(trackPtr[track], trackPtr[track + 1]):
+                if i != held[track]:
+                    willingness[measIdx[i]] = max(willingness[measIdx[i]], rewards[i] - profits[track])
+
+        lowered = False
+        for track in range(numTracks):
+            i = held[track]
+            if i != -1 and willingness[measIdx[i]] < prices[measIdx[i]]:
+                prices[measIdx[i]] = willingness[measIdx[i]]
+                lowered = True
+        if not lowered:
+            break
+
+
+def keepHappyAssignments(adjacency, prices, assignments, epsilon):
+    # Unassign the tracks that are not almost happy with their measurement, i.e. that can get more than
+    # epsilon extra net value elsewhere. Infeasible pairs and measurements held by more than one track
+    # are dropped as well. What is left is a valid starting point for the auction.
+    # assignments is updated in place
+    claimed = np.zeros(adjacency.shape[0], dtype=np.bool_)
+    keepHappyKernel(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, prices, assignments, epsilon, claimed)
+
+
+@jit
+def keepHappyKernel(trackPtr, measIdx, rewards, prices, assignments, epsilon, claimed):
+    # keepHappyAssignments, a track at a time. Of the happy tracks that hold the same measurement the first
+    # one keeps it. claimed is scratch space, all False
+    for track in range(assignments.shape[0]):
+        meas = assignments[track]
+        if meas == -1:
+            continue
+        maxValue = 0.0
+        heldValue = -np.inf
+        held = False
+        for i in range(trackPtr[track], trackPtr[track + 1]):
+            value = rewards[i] - prices[measIdx[i]]
+            maxValue = max(maxValue, value)
+            if measIdx[i] == meas:
+                heldValue = value
+                held = True
+        if held and heldValue >= maxValue - epsilon and not claimed[meas]:
+            claimed[meas] = True
+        else:
+            assignments[track] = -1
 
 
-def stepPrices(priceMatrix):
-    # Move prices from real -> stale
-    retMatrix = priceMatrix.copy()
-    nCols = priceMatrix.shape[0]
-    for i in range(nCols-1, 0, -1):
-        retMatrix[i-1] = priceMatrix[i]
-    return retMatrix
+def auctionResult(adjacency, assignments, k, prices, duals, workspace=None):
+    # What the auctions return: gain, assignments and n iterations, with duals also the prices and profits
+    gain = assignmentGain(adjacency, assignments, workspace)
+    if duals:
+        return gain, assignments, k, prices, trackProfits(adjacency, prices)
+    return gain, assignments, k
 
 
-def updatePrices(prices, chosenMeas, newPrice):
-    res = stepPrices(prices)
-    # Try to assign new price to meas (assign to 0-colum which is realPrice)
-    if res[-1][chosenMeas] >= newPrice:
-        return (res, False)
-    else:
-        res[-1][chosenMeas] = newPrice
-        return (res, True)
+@jit
+def bestTwo(trackPtr, measIdx, rewards, prices, track):
+    # The entry with the most net value for track, that net value and the next best net value.
+    # Ties go to the first entry, like np.argmax
+    start = trackPtr[track]
+    end = trackPtr[track + 1]
+    maxIdx = start
+    maxValue = rewards[start] - prices[measIdx[start]]
+    nextBest = -np.inf
+    for i in range(start + 1, end):
+        value = rewards[i] - prices[measIdx[i]]
+        if value > maxValue:
+            nextBest = maxValue
+            maxValue = value
+            maxIdx = i
+        elif value > nextBest:
+            nextBest = value
+    return maxIdx, maxValue, nextBest
+
+
+def candidateLists(adjacency, prices, candidates):
+    # The candidate lists of bestTwoCandidates, room for candidates entries per track. Every list starts out
+    # of date (bound inf), so it is only built when its track first bids. The net values are kept in the type
+    # reward - price has, int16 rewards would overflow on their own
+    numTracks = adjacency.shape[1]
+    return (np.empty((numTracks, candidates), dtype=np.int64), np.zeros(numTracks, dtype=np.int64),
+            np.full(numTracks, np.inf), np.empty(candidates, dtype=np.result_type(adjacency.rewards.dtype, prices.dtype)))
+
+
+@jit
+def refreshCandidates(trackPtr, measIdx, rewards, prices, track, candidates, floor):
+    # Rebuild the candidate list of track from all its entries, and return what bestTwo would. The list is
+    # kept as a min heap on net value while it is built, so its entry worth the least is at the top, and an
+    # entry only gets in if it is worth more than that one. Everything left out is worth no more than the top
+    # of the full list, so that is the bound. A little loose, but it needs no work for the entries left out.
+    # floor is a net value at least as many entries as fit in the list are worth, entries below it are
+    # skipped from the start. Every entry that gets in costs a sift, so that saves most of them
+    lists, counts, bounds, values = candidates
+    size = lists.shape[1]
+    count = 0
+    threshold = floor
+    start = trackPtr[track]
+    end = trackPtr[track + 1]
+    maxIdx = start
+    maxValue = -np.inf
+    nextBest = -np.inf
+    for i in range(start, end):
+        value = rewards[i] - prices[measIdx[i]]
+        if value > maxValue:
+            nextBest = maxValue
+            maxValue = value
+            maxIdx = i
+        elif value > nextBest:
+            nextBest = value
+        if value < threshold or (value == threshold and count == size):
+            continue
+
+        if count < size:
+            # Sift up from the end
+            pos = count
+            count += 1
+            while pos > 0 and values[(pos - 1) // 2] > value:
+                values[pos] = values[(pos - 1) // 2]
+                lists[track, pos] = lists[track, (pos - 1) // 2]
+                pos = (pos - 1) // 2
+        else:
+            # Replace the top and sift down
+            pos = 0
+            while 2 * pos + 1 < size:
+                child = 2 * pos + 1
+                if child + 1 < size and values[child + 1] < values[child]:
+                    child += 1
+                if not values[child] < value:
+                    break
+                values[pos] = values[child]
+                lists[track, pos] = lists[track, child]
+                pos = child
+        values[pos] = value
+        lists[track, pos] = i
+        if count == size:
+            threshold = values[0]
+
+    counts[track] = count
+    bounds[track] = threshold if end - start > size else -np.inf
+    return maxIdx, maxValue, nextBest
+
+
+@jit
+def bestTwoCandidates(trackPtr, measIdx, rewards, prices, track, candidates):
+    # bestTwo from the candidate list of track alone. Prices only rise, so the entries left out of the list
+    # are still worth at most its bound. While that is below the next best net value (floored at 0, as the
+    # auctions use it) the list has the same best entry and next best as the whole track, and it is used.
+    # Otherwise the list is rebuilt from the whole track, and as the entries of a full list are still worth
+    # at least the least of them, the new list has nothing worth less. Either way the auction takes the same
+    # steps as with bestTwo
+    lists, counts, bounds, values = candidates
+    count = counts[track]
+    floor = -np.inf
+    if count > 0:
+        maxIdx = lists[track, 0]
+        maxValue = rewards[maxIdx] - prices[measIdx[maxIdx]]
+        nextBest = -np.inf
+        minValue = maxValue
+        for c in range(1, count):
+            i = lists[track, c]
+            value = rewards[i] - prices[measIdx[i]]
+            minValue = min(minValue, value)
+            if value > maxValue or (value == maxValue and i < maxIdx):
+                nextBest = maxValue
+                maxValue = value
+                maxIdx = i
+            elif value > nextBest:
+                nextBest = value
+        bound = bounds[track]
+        if bound < max(nextBest, 0) or (bound <= 0 and not maxValue > 0):
+            return maxIdx, maxValue, nextBest
+        if count == lists.shape[1]:
+            floor = minValue
+
+    return refreshCandidates(trackPtr, measIdx, rewards, prices, track, candidates, floor)
+
+
+def unassignedQueue(assignments):
+    # The queue of unassigned tracks of the kernels: a ring buffer and its head and size
+    numTracks = len(assignments)
+    queue = np.empty(max(numTracks, 1), dtype=np.int64)
+    unassigned = np.where(assignments == -1)[0]
+    queue[:len(unassigned)] = unassigned
+    return queue, np.array([0, len(unassigned)], dtype=np.int64)
+
+
+@jit
+def fillQueue(assignments, queue, queueState):
+    # unassignedQueue written into queue and queueState
+    size = 0
+    for track in range(assignments.shape[0]):
+        if assignments[track] == -1:
+            queue[size] = track
+            size += 1
+    queueState[0] = 0
+    queueState[1] = size
+
+
+def queuedTracks(queue):
+    # The tracks in the queue of the kernels, in order
+    ring, queueState = queue
+    return ring[(queueState[0] + np.arange(queueState[1])) % len(ring)]
+
+
+def setQueue(queue, tracks):
+    # Make tracks the contents of the queue of the kernels
+    ring, queueState = queue
+    ring[:len(tracks)] = list(tracks)
+    queueState[0] = 0
+    queueState[1] = len(tracks)
+
+
+@jit
+def auctionImprovedKernel(trackPtr, measIdx, rewards, prices, assignments, owners, epsilon, queue, queueState,
+                          maxIterations, candidates=None):
+    # Compiled loop of auctionImproved, without the observer hooks. It takes exactly the same steps in the
+    # same order, with a ring buffer as the queue. It stops after maxIterations, and as prices, assignments,
+    # owners, the queue and its head and size in queueState are all updated in place it can be called again
+    # to go on where it stopped. With candidates (see candidateLists) the tracks bid with bestTwoCandidates
+    numTracks = assignments.shape[0]
+    head = queueState[0]
+    size = queueState[1]
+
+    k = 0
+    while size > 0 and k < maxIterations:
+        k += 1
+        trackCurrent = queue[head]
+        head = (head + 1) % numTracks
+        size -= 1
+
+        if trackPtr[trackCurrent] == trackPtr[trackCurrent + 1]:
+            continue
+        if candidates is None:
+            maxIdx, maxValue, nextBest = bestTwo(trackPtr, measIdx, rewards, prices, trackCurrent)
+        else:
+            maxIdx, maxValue, nextBest = bestTwoCandidates(trackPtr, measIdx, rewards, prices, trackCurrent,
+                                                           candidates)
+        if not maxValue > 0:
+            continue
+        chosenMeas = measIdx[maxIdx]
+
+        trackOld = owners[chosenMeas]
+        if trackOld != -1:
+            assignments[trackOld] = -1
+            queue[(head + size) % numTracks] = trackOld
+            size += 1
+        assignments[trackCurrent] = chosenMeas
+        owners[chosenMeas] = trackCurrent
+
+        prices[chosenMeas] = prices[chosenMeas] + maxValue - max(nextBest, 0) + epsilon
+
+    queueState[0] = head
+    queueState[1] = size
+    return k
+
+
+@jit
+def auctionPipelinedKernel(trackPtr, measIdx, rewards, prices, stalePrices, assignments, owners, epsilon, depth,
+                           candidates=None):
+    # Compiled loop of auctionPipelined, without the observer hooks. stalePrices are the prices as they were
+    # depth - 1 bids ago. The price updates of the last depth bids are kept in a ring buffer, and each bid
+    # the oldest one is applied to stalePrices. prices, stalePrices, assignments and owners are updated in place.
+    # With candidates (see candidateLists) the tracks bid with bestTwoCandidates. The stale prices only rise
+    # too, an update only becomes visible if it raised the price
+    numTracks = assignments.shape[0]
+    queue = np.empty(max(numTracks, 1), dtype=np.int64)
+    head = 0
+    size = 0
+    for track in range(numTracks):
+        if assignments[track] == -1:
+            queue[size] = track
+            size += 1
+
+    historyMeas = np.empty(depth, dtype=np.int64)
+    historyPrice = np.empty(depth, dtype=prices.dtype)
+    bids = 0
+
+    k = 0
+    while size > 0:
+        k += 1
+        trackCurrent = queue[head]
+        head = (head + 1) % numTracks
+        size -= 1
+
+        if trackPtr[trackCurrent] == trackPtr[trackCurrent + 1]:
+            continue
+        if candidates is None:
+            maxIdx, maxValue, nextBest = bestTwo(trackPtr, measIdx, rewards, stalePrices, trackCurrent)
+        else:
+            maxIdx, maxValue, nextBest = bestTwoCandidates(trackPtr, measIdx, rewards, stalePrices, trackCurrent,
+                                                           candidates)
+        if not maxValue > 0:
+            continue
+        chosenMeas = measIdx[maxIdx]
+        newPrice = stalePrices[chosenMeas] + maxValue - max(nextBest, 0) + epsilon
 
+        update = not prices[chosenMeas] >= newPrice
+        if update:
+            prices[chosenMeas] = newPrice
+
+        # A rejected bid still takes its place in the history. The update of bid number bids - depth + 1
+        # becomes visible
+        bids += 1
+        historyMeas[(bids - 1) % depth] = chosenMeas if update else -1
+        historyPrice[(bids - 1) % depth] = newPrice
+        oldest = bids % depth
+        if bids >= depth and historyMeas[oldest] != -1:
+            stalePrices[historyMeas[oldest]] = historyPrice[oldest]
+
+        if not update:
+            queue[(head + size) % numTracks] = trackCurrent
+            size += 1
+            continue
 
+        trackOld = owners[chosenMeas]
+        if trackOld != -1:
+            assignments[trackOld] = -1
+            queue[(head + size) % numTracks] = trackOld
+            size += 1
+        assignments[trackCurrent] = chosenMeas
+        owners[chosenMeas] = trackCurrent
 
-def auctionPipelined(rewardMatrix, depth=1, debug=True):
+    return k
+
+
+def auctionPipelined(rewardMatrix, depth=1, debug=True, epsilon=0.01, prices=None, assignments=None, observer=None,
+                     duals=False, candidates=None):
     # Seek to reduce the number of calculations
     # auctionImproved is an improvement over the Matlab implementation from Edmund.
+    # Models a pipeline of depth: each track bids with the prices as they were depth - 1 bids ago, and the bid
+    # is rejected if the real price has already reached it. See pipeline.py for a cycle level model.
+    # prices and assignments can be passed to warm start the auction. They are updated in place.
+    # rewardMatrix can be dense, scipy.sparse or a TrackAdjacency.
+    # observer gets the events of the auction, see observers.py. debug=True prints them
+    # duals=True also returns the final prices and the profits of the tracks, to check the result with
+    # certificate.verifyCertificate
+    # candidates is the number of measurements each track keeps in a candidate list to bid among, see
+    # bestTwoCandidates. The result is the same as without, only found faster on dense problems
+
+    observer = observerFor(observer, debug)
+
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas = adjacency.shape[0]
+    numTracks = adjacency.shape[1]
 
-    if debug:
-        print(f"========================================")
-        print(f"Beginning Improved Auction Method")
+    # Intialize data structures
+    if prices is None:
+        prices = np.zeros(numMeas)
+    stalePrices = prices.copy()
 
-    numMeas = rewardMatrix.shape[0]
-    numTracks = rewardMatrix.shape[1]
-    epsilon = 0.01
+    if assignments is None:
+        assignments = np.full(numTracks, fill_value=-1, dtype=int)
+    owners = ownersOf(assignments, numMeas)
 
-    # Intialize data structures
-    prices = np.zeros((depth, numMeas))
+    if observer is None:
+        lists = None if candidates is None else candidateLists(adjacency, prices, candidates)
+        k = auctionPipelinedKernel(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, prices, stalePrices,
+                                   assignments, owners, epsilon, depth, lists)
+        return auctionResult(adjacency, assignments, k, prices, duals)
+
+    observer.phaseStart("auctionPipelined")
+    unassigned = deque(np.where(assignments == -1)[0])
 
-    unassigned = list(range(numTracks))
-    assignments = np.full(numTracks, fill_value=-1, dtype=np.int)
+    # The (measurement, price) updates of the last depth bids, -1 for a rejected bid
+    history = deque()
 
     k = 0
     while len(unassigned) > 0:
@@ -54,109 +652,154 @@ def auctionPipelined(rewardMatrix, depth=1, debug=True):
         # 4. Update the price on that measurement
 
         k = k + 1
-        if debug:
-            print(f"k={k}")
-            print(f"assignments={assignments}")
-            print(f"unassigned={unassigned}")
-            print(f"prices={prices}")
 
         # Step 1 - pick first unassigned target
-        trackCurrent = unassigned.pop(0)
-
-        if debug:
-            print(f"current track={trackCurrent}")
+        trackCurrent = unassigned.popleft()
 
         # Step 2 - Find the measurement with most net value. Net value is reward - price
-        stalePrices = prices[0].copy()
-
-        possibleMeas = np.where(rewardMatrix[:, trackCurrent] > -np.inf)
-        reward = rewardMatrix[possibleMeas, np.full_like(possibleMeas, fill_value=trackCurrent)]
+        start = adjacency.trackPtr[trackCurrent]
+        end = adjacency.trackPtr[trackCurrent + 1]
+        possibleMeas = adjacency.measIdx[start:end]
+        reward = adjacency.rewards[start:end]
         price = stalePrices[possibleMeas]
         netValues = reward - price
-        netValuesSorted = np.sort(netValues)[0]
-        maxValue = netValuesSorted[-1]
-        if maxValue > 0:
-            maxIdx = np.where(netValues == maxValue)
-            chosenMeas = possibleMeas[0][maxIdx[1]]
-            if debug:
-                print(f"pick measurement {chosenMeas} with net value {maxValue}")
-        else:
+        if len(netValues) == 0 or not np.max(netValues) > 0:
             # If we cant find any measurement with value for this track.
             # just skip to next iteration. This means also that this track will stay unassigned
             # The prices will only rise so there is not possible to find a measurement that it can afford
-            if debug:
-                print(f"No measurements with net value")
+            observer.message(f"No measurement with net value for track {trackCurrent}")
+            observer.iterationEnd(k, assignments, prices)
             continue
-
-
+        maxIdx = np.argmax(netValues)
+        maxValue = netValues[maxIdx]
+        chosenMeas = possibleMeas[maxIdx]
 
         # Step 4 - Update the price
         # The prices is updated to the maximum value currentTrack is willing to pay given the current prices
         # That is equal to the difference between the two highets net values this track can get
-        # We already have the highest net value = maxValue. And we have the netValues sorted in netValuesSorted
-        if len(netValuesSorted) > 1:
-            nextBest = netValuesSorted[-2]
+        # We already have the highest net value = maxValue. The next best is the max of the others, no need to sort
+        # Staying unassigned is worth 0 so the next best can not be lower than that, and we can mask out the
+        # best with 0 (that also works for integer rewards)
+        if len(netValues) > 1:
+            netValues[maxIdx] = 0
+            nextBest = max(np.max(netValues), 0)
         else:
             nextBest = 0
 
         newPrice = stalePrices[chosenMeas] + maxValue - nextBest + epsilon
-        (prices, update) = updatePrices(prices, chosenMeas, newPrice)
+        observer.bid(trackCurrent, chosenMeas, newPrice)
+
+        # The bid is rejected if the real price has already reached it
+        update = not prices[chosenMeas] >= newPrice
+        observer.priceUpdate(chosenMeas, newPrice, update, prices[chosenMeas])
+        if update:
+            prices[chosenMeas] = newPrice
+
+        # The update from depth - 1 bids ago becomes visible in the stale prices
+        history.append((chosenMeas if update else -1, newPrice))
+        if len(history) == depth:
+            oldMeas, oldPrice = history.popleft()
+            if oldMeas != -1:
+                stalePrices[oldMeas] = oldPrice
 
         if update:
             # We successfully updated the price
-            trackOld = np.where(assignments == chosenMeas)
+            trackOld = owners[chosenMeas]
 
             # Unassign it
-            for t in trackOld[0]:
-                assignments[t] = -1
-                unassigned.append(t)
-                if debug:
-                    print(f"track {t} was unassigned")
+            if trackOld != -1:
+                assignments[trackOld] = -1
+                unassigned.append(trackOld)
+                observer.evicted(trackOld, chosenMeas)
 
             # Assign preferred measurement of current track to current assignment
             assignments[trackCurrent] = chosenMeas
-            if debug:
-                print(f"new price = {newPrice}")
-                print(f"=============================================")
-
+            owners[chosenMeas] = trackCurrent
         else:
-            if debug:
-                print(f"Failed to update price = {newPrice} due to actual={prices[-1][chosenMeas]}")
-                print("==============================================")
-
             unassigned.append(trackCurrent)
 
+        observer.iterationEnd(k, assignments, prices)
+
     # Lastly we calcualate the "gain". That is the total reward for our chosen assignment
-    gain = 0
-    for track, meas in enumerate(assignments):
-        if meas != -1:
-            gain += rewardMatrix[meas][track]
+    result = auctionResult(adjacency, assignments, k, prices, duals)
+    observer.phaseEnd("auctionPipelined")
 
     # Return gain and assignments and n iterations
-    return gain, assignments, k
+    return result
 
 
-def auctionImproved(rewardMatrix, debug=True):
+def auctionImproved(rewardMatrix, debug=True, epsilon=0.01, prices=None, assignments=None, observer=None,
+                    duals=False, maxIterations=None, timeLimit=None, workspace=None, candidates=None, queue=None):
     # auctionImproved is an improvement over the Matlab implementation from Edmund.
     # Seek to reduce the number of calculations
-
-    if debug:
-        print(f"========================================")
-        print(f"Beginning Improved Auction Method")
-
-
-    numMeas = rewardMatrix.shape[0]
-    numTracks = rewardMatrix.shape[1]
-    epsilon = 0.01
+    # prices and assignments can be passed to warm start the auction. They are updated in place.
+    # rewardMatrix can be dense, scipy.sparse or a TrackAdjacency.
+    # observer gets the events of the auction, see observers.py. debug=True prints them
+    # duals=True also returns the final prices and the profits of the tracks, to check the result with
+    # certificate.verifyCertificate
+    # maxIterations and timeLimit (seconds) stop the auction early, see auctionAnytime
+    # queue is the queue of tracks waiting to bid (a ring buffer and its head and size, see unassignedQueue) to
+    # go on with, instead of one of all the unassigned tracks. It is updated in place
+    # workspace is a workspace.Workspace to take the prices, assignments and all other arrays from instead of
+    # allocating them, see there
+    # candidates is the number of measurements each track keeps in a candidate list to bid among, see
+    # bestTwoCandidates. The result is the same as without, only found faster on dense problems. The observer
+    # path always scans every measurement, it takes the same steps either way
+
+    observer = observerFor(observer, debug)
+
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas = adjacency.shape[0]
+    numTracks = adjacency.shape[1]
 
     # Intialize data structures
-    prices = np.zeros(numMeas)
-
-    unassigned = list(range(numTracks))
-    assignments = np.full(numTracks, fill_value=-1, dtype=np.int)
+    if workspace is not None:
+        prices, assignments, owners, ring, queueState = workspace.auctionBuffers(numMeas, numTracks, prices,
+                                                                                 assignments)
+        fillOwners(assignments, owners)
+    else:
+        if prices is None:
+            prices = np.zeros(numMeas)
+
+        if assignments is None:
+            assignments = np.full(numTracks, fill_value=-1, dtype=int)
+        owners = ownersOf(assignments, numMeas)
+
+    deadline = np.inf if timeLimit is None else time.perf_counter() + timeLimit
+    if maxIterations is None:
+        maxIterations = np.iinfo(np.int64).max
+
+    if observer is None:
+        # With a time limit the kernel runs a chunk of iterations at a time, and the clock is checked in between
+        chunk = maxIterations
+        if timeLimit is not None:
+            chunk = max(ANYTIME_CHUNK * numTracks // max(len(adjacency.measIdx), 1), 1)
+        if queue is not None:
+            ring, queueState = queue
+        elif workspace is not None:
+            fillQueue(assignments, ring, queueState)
+        else:
+            ring, queueState = unassignedQueue(assignments)
+        lists = None if candidates is None else candidateLists(adjacency, prices, candidates)
+        k = 0
+        while queueState[1] > 0 and k < maxIterations and time.perf_counter() < deadline:
+            k += auctionImprovedKernel(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, prices,
+                                       assignments, owners, epsilon, ring, queueState, min(chunk, maxIterations - k),
+                                       lists)
+        return auctionResult(adjacency, assignments, k, prices, duals, workspace)
+
+    observer.phaseStart("auctionImproved")
+    if queue is not None:
+        unassigned = deque(queuedTracks(queue))
+    else:
+        unassigned = deque(np.where(assignments == -1)[0])
 
     k = 0
     while len(unassigned) > 0:
+        if k == maxIterations or time.perf_counter() >= deadline:
+            observer.message(f"Stopped after {k} iterations with {len(unassigned)} tracks left to bid")
+            break
+
         # Each loop iteration the following things happen
         # 1. Pick an unassigned track
         # 2. Find the measurement with most net value for that track (if it exists)
@@ -164,179 +807,882 @@ def auctionImproved(rewardMatrix, debug=True):
         # 4. Update the price on that measurement
 
         k = k + 1
-        if debug:
-            print(f"k={k}")
-            print(f"assignmetns={assignments}")
-            print(f"unassigned={unassigned}")
-            print(f"prices={prices}")
 
         # Step 1 - pick first unassigned target
-        trackCurrent = unassigned.pop(0)
-
-        if debug:
-            print(f"current track={trackCurrent}")
-
+        trackCurrent = unassigned.popleft()
 
         # Step 2 - Find the measurement with most net value. Net value is reward - price
-        possibleMeas = np.where(rewardMatrix[:,trackCurrent]  > -np.inf)
-        if len(possibleMeas) == 0:
-            if debug:
-                print("No measurement with net value")
-            continue
-        reward = rewardMatrix[possibleMeas, np.full_like(possibleMeas, fill_value=trackCurrent)]
+        start = adjacency.trackPtr[trackCurrent]
+        end = adjacency.trackPtr[trackCurrent + 1]
+        possibleMeas = adjacency.measIdx[start:end]
+        reward = adjacency.rewards[start:end]
         price = prices[possibleMeas]
         netValues = reward - price
-        netValuesSorted = np.sort(netValues)
-        maxValue = netValuesSorted[0][-1]
-        if maxValue > 0:
-            maxIdx = np.where(netValues == maxValue)
-            chosenMeas = possibleMeas[0][maxIdx[1]]
-            if debug:
-                print(f"pick measurement {chosenMeas} with net value {maxValue}")
-        else:
+        if len(netValues) == 0 or not np.max(netValues) > 0:
             # If we cant find any measurement with value for this track.
             # just skip to next iteration. This means also that this track will stay unassigned
             # The prices will only rise so there is not possible to find a measurement that it can afford
-            if debug:
-                print(f"No measurements with net value")
+            observer.message(f"No measurement with net value for track {trackCurrent}")
+            observer.iterationEnd(k, assignments, prices)
             continue
+        maxIdx = np.argmax(netValues)
+        maxValue = netValues[maxIdx]
+        chosenMeas = possibleMeas[maxIdx]
 
         # Step 3: Find the track that currently is assigned to the chosen measurement and un-assign it
-        trackOld = np.where(assignments == chosenMeas)
+        trackOld = owners[chosenMeas]
 
         # Unassign it
-        for t in trackOld[0]:
-            assignments[t] = -1
-            unassigned.append(t)
-            if debug:
-                print(f"track {t} was unassigned")
+        if trackOld != -1:
+            assignments[trackOld] = -1
+            unassigned.append(trackOld)
+            observer.evicted(trackOld, chosenMeas)
 
         # Assign preferred measurement of current track to current assignment
         assignments[trackCurrent] = chosenMeas
+        owners[chosenMeas] = trackCurrent
 
         # Step 4 - Update the price
         # The prices is updated to the maximum value currentTrack is willing to pay given the current prices
         # That is equal to the difference between the two highets net values this track can get
-        # We already have the highest net value = maxValue. And we have the netValues sorted in netValuesSorted
-        if len(netValuesSorted) > 1:
-            nextBest = netValuesSorted[-2]
+        # We already have the highest net value = maxValue. The next best is the max of the others, no need to sort
+        # Staying unassigned is worth 0 so the next best can not be lower than that, and we can mask out the
+        # best with 0 (that also works for integer rewards)
+        if len(netValues) > 1:
+            netValues[maxIdx] = 0
+            nextBest = max(np.max(netValues), 0)
         else:
             nextBest = 0
 
-        newPrice = maxValue - nextBest + epsilon
+        newPrice = prices[chosenMeas] + maxValue - nextBest + epsilon
         prices[chosenMeas] = newPrice
+        observer.bid(trackCurrent, chosenMeas, newPrice)
+        observer.iterationEnd(k, assignments, prices)
 
-
-        if debug:
-            print(f"new price = {newPrice}")
-            print(f"=============================================")
+    if queue is not None:
+        setQueue(queue, unassigned)
 
     # Lastly we calcualate the "gain". That is the total reward for our chosen assignment
-
-    gain = 0
-    for track, meas in enumerate(assignments):
-        if meas != -1:
-            gain += rewardMatrix[meas][track]
+    result = auctionResult(adjacency, assignments, k, prices, duals, workspace)
+    observer.phaseEnd("auctionImproved")
 
     # Return gain and assignments
+    return result
+
+
+def auctionAnytime(rewardMatrix, timeLimit=None, maxIterations=None, debug=True, epsilon=0.01, prices=None,
+                   assignments=None, observer=None, queue=None):
+    # auctionImproved with a budget, for frames with a hard latency limit. The auction stops after timeLimit
+    # seconds or maxIterations iterations, whichever comes first. The assignment so far is always feasible:
+    # every measurement has at most one track and every assigned track is within epsilon of happy. Tracks
+    # still waiting to bid are left unassigned.
+    # Pass the prices, assignments and queue back in to go on where it stopped, they are updated in place.
+    # The queue holds the tracks still waiting to bid. A track with nothing to bid for leaves it for good, so
+    # it does not use up the budget of every frame, and the auction has converged when the queue is empty.
+    # timeLimit bounds the bidding, not the whole call. The clock is looked at every ANYTIME_CHUNK feasible
+    # pairs or so, so the bidding can run over by that much, and the gain takes a pass over the feasible pairs
+    # of the assigned tracks after it. On the 2000x2000 problem of runAnytime (400000 pairs) a frame takes
+    # about timeLimit + 0.5ms, so pass a timeLimit that leaves room for that.
+    # Returns gain, assignments, k, whether the auction converged, the prices and the queue
+    adjacency = trackAdjacency(rewardMatrix)
+    if prices is None:
+        prices = np.zeros(adjacency.shape[0])
+    if assignments is None:
+        assignments = np.full(adjacency.shape[1], fill_value=-1, dtype=int)
+    if queue is None:
+        queue = unassignedQueue(assignments)
+
+    gain, assignments, k = auctionImproved(adjacency, debug=debug, epsilon=epsilon, prices=prices,
+                                           assignments=assignments, observer=observer, maxIterations=maxIterations,
+                                           timeLimit=timeLimit, queue=queue)
+    return gain, assignments, k, queue[1][1] == 0, prices, queue
+
+
+def auctionJacobi(rewardMatrix, debug=True, epsilon=0.01, observer=None):
+    # Jacobi flavour of auctionImproved. Instead of letting one track bid per iteration (Gauss-Seidel)
+    # every unassigned track computes its bid at the same time, and the bids are resolved in bulk.
+    # One iteration here is thus one full bidding round, done with whole-array numpy operations.
+    # rewardMatrix can be dense, scipy.sparse or a TrackAdjacency. The rounds work on whole columns, so
+    # the last two are expanded to a dense matrix with the forbidden pairs at -inf.
+    # observer gets the events of the auction, see observers.py. debug=True prints them
+
+    observer = observerFor(observer, debug)
+    if observer is not None:
+        observer.phaseStart("auctionJacobi")
+
+    if isinstance(rewardMatrix, TrackAdjacency) or hasattr(rewardMatrix, 'tocsc'):
+        adjacency = trackAdjacency(rewardMatrix)
+        rewardMatrix = np.full(adjacency.shape, -np.inf)
+        rewardMatrix[adjacency.measIdx, trackOfEntries(adjacency)] = adjacency.rewards
+
+    numMeas = rewardMatrix.shape[0]
+    numTracks = rewardMatrix.shape[1]
+
+    # Intialize data structures
+    prices = np.zeros(numMeas)
+    owners = np.full(numMeas, fill_value=-1, dtype=int)
+
+    # Without measurements no track can bid, and argmax has no axis to work along
+    unassigned = np.arange(numTracks if numMeas > 0 else 0)
+    assignments = np.full(numTracks, fill_value=-1, dtype=int)
+
+    k = 0
+    while unassigned.size > 0:
+        # Each loop iteration the following things happen
+        # 1. All unassigned tracks find their best and second best measurement
+        # 2. Tracks without any measurement with net value drop out for good
+        # 3. Each measurement is given to the highest bidder, previous owners are unassigned
+        # 4. The prices of all measurements that received a bid are updated
+
+        k = k + 1
+
+        # Step 1 - Net values for all unassigned tracks at once. Forbidden pairs stay at -inf
+        netValues = rewardMatrix[:, unassigned] - prices[:, np.newaxis]
+        cols = np.arange(unassigned.size)
+        bestMeas = np.argmax(netValues, axis=0)
+        maxValues = netValues[bestMeas, cols]
+
+        # The second best is found by masking out the best. Staying unassigned is worth 0, so that is
+        # the lowest second best a track can have
+        netValues[bestMeas, cols] = -np.inf
+        if numMeas > 1:
+            nextBest = np.maximum(np.max(netValues, axis=0), 0)
+        else:
+            nextBest = np.zeros(unassigned.size)
+
+        # Step 2 - The prices will only rise so a track without net value will never find a measurement
+        bidding = maxValues > 0
+        bidders = unassigned[bidding]
+        if bidders.size == 0:
+            break
+        bidMeas = bestMeas[bidding]
+        bids = prices[bidMeas] + maxValues[bidding] - nextBest[bidding] + epsilon
+        if observer is not None:
+            for track, meas, bid in zip(bidders, bidMeas, bids):
+                observer.bid(track, meas, bid)
+
+        # Step 3 - Sort bids on measurement and then descending bid, the first bid for each measurement wins
+        order = np.lexsort((-bids, bidMeas))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = bidMeas[order][1:] != bidMeas[order][:-1]
+        winners = order[first]
+        losers = order[~first]
+
+        wonMeas = bidMeas[winners]
+        trackOld = owners[wonMeas]
+        if observer is not None:
+            for track, meas in zip(trackOld, wonMeas):
+                if track != -1:
+                    observer.evicted(track, meas)
+        trackOld = trackOld[trackOld != -1]
+        assignments[trackOld] = -1
+
+        assignments[bidders[winners]] = wonMeas
+        owners[wonMeas] = bidders[winners]
+
+        # Step 4 - Update the prices to the winning bids
+        prices[wonMeas] = bids[winners]
+        if observer is not None:
+            observer.iterationEnd(k, assignments, prices)
+
+        unassigned = np.concatenate((bidders[losers], trackOld))
+
+    # Lastly we calcualate the "gain". That is the total reward for our chosen assignment
+    assigned = np.where(assignments != -1)[0]
+    gain = np.sum(rewardMatrix[assignments[assigned], assigned])
+    if observer is not None:
+        observer.phaseEnd("auctionJacobi")
+
+    # Return gain and assignments and n iterations
     return gain, assignments, k
 
 
-def auctionMethodExtended(rewardMatrix, debug=True):
+def auctionBatch(rewardMatrices, debug=True, epsilon=0.01, batchSize=256, observer=None):
+    # Solve many small problems at once, see auctionBatchPadded. The problems are sorted on size and
+    # solved batchSize at a time so that little work is spent on padding.
+    # Returns the gains, the assignments (one array per problem) and the iterations of each problem
+    # observer gets the phases and the bidding rounds of each batch, see observers.py. debug=True prints them
+
+    observer = observerFor(observer, debug)
+    numProblems = len(rewardMatrices)
+    gains = np.zeros(numProblems)
+    assignments = [None] * numProblems
+    iterations = np.zeros(numProblems, dtype=int)
+
+    order = np.argsort([np.size(mat) for mat in rewardMatrices], kind='stable')
+    for start in range(0, numProblems, batchSize):
+        batch = order[start:start + batchSize]
+        gainsBatch, assignmentsBatch, iterationsBatch = auctionBatchPadded(
+            [rewardMatrices[p] for p in batch], debug=False, epsilon=epsilon, observer=observer)
+        gains[batch] = gainsBatch
+        iterations[batch] = iterationsBatch
+        for p, ass in zip(batch, assignmentsBatch):
+            assignments[p] = ass
+
+    return gains, assignments, iterations
+
+
+def auctionBatchPadded(rewardMatrices, debug=True, epsilon=0.01, observer=None):
+    # Each problem on its own is too small to win anything from numpy, so the problems are padded with
+    # -inf into one (problems, numMeas, numTracks) array and the Jacobi bidding rounds of auctionJacobi
+    # are done for all problems at the same time.
+    # Returns the gains, the assignments (one array per problem) and the iterations of each problem
+
+    observer = observerFor(observer, debug)
+    if observer is not None:
+        observer.phaseStart("auctionBatchPadded")
+
+    numProblems = len(rewardMatrices)
+    shapes = np.array([mat.shape for mat in rewardMatrices], dtype=int).reshape(numProblems, 2)
+    numMeas = max(np.max(shapes[:, 0], initial=0), 1)
+    numTracks = max(np.max(shapes[:, 1], initial=0), 1)
+
+    rewards = np.full((numProblems, numMeas, numTracks), fill_value=-np.inf)
+    for p, mat in enumerate(rewardMatrices):
+        rewards[p, :mat.shape[0], :mat.shape[1]] = mat
+
+    # Intialize data structures
+    prices = np.zeros((numProblems, numMeas))
+    owners = np.full((numProblems, numMeas), fill_value=-1, dtype=int)
+    assignments = np.full((numProblems, numTracks), fill_value=-1, dtype=int)
+
+    # Tracks that still bid. The padding never does
+    unassigned = np.arange(numTracks)[np.newaxis, :] < shapes[:, 1, np.newaxis]
+    iterations = np.zeros(numProblems, dtype=int)
+
+    while True:
+        # Only the problems that still have unassigned tracks take part in the round
+        problems = np.where(np.any(unassigned, axis=1))[0]
+        if problems.size == 0:
+            break
+        iterations[problems] += 1
+        if observer is not None:
+            observer.message(f"{problems.size} problems left")
+
+        # Step 1 - Best and second best net values of every track in the remaining problems
+        netValues = rewards[problems] - prices[problems, :, np.newaxis]
+        bestMeas = np.argmax(netValues, axis=1)
+        maxValues = np.take_along_axis(netValues, bestMeas[:, np.newaxis, :], axis=1)[:, 0, :]
+        np.put_along_axis(netValues, bestMeas[:, np.newaxis, :], -np.inf, axis=1)
+        nextBest = np.maximum(np.max(netValues, axis=1), 0)
+
+        # Step 2 - Tracks without net value drop out for good
+        active = unassigned[problems]
+        bidding = active & (maxValues > 0)
+        unassigned[problems] = bidding
+        bidProblem, bidTrack = np.nonzero(bidding)
+        if bidProblem.size == 0:
+            continue
+        bidMeas = bestMeas[bidProblem, bidTrack]
+        bidProblem = problems[bidProblem]
+        bids = prices[bidProblem, bidMeas] + maxValues[bidding] - nextBest[bidding] + epsilon
+
+        # Step 3 - The highest bid for each measurement in each problem wins
+        order = np.lexsort((-bids, bidMeas, bidProblem))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = (bidProblem[order][1:] != bidProblem[order][:-1]) | (bidMeas[order][1:] != bidMeas[order][:-1])
+        winners = order[first]
+
+        winProblem = bidProblem[winners]
+        winMeas = bidMeas[winners]
+        winTrack = bidTrack[winners]
+
+        trackOld = owners[winProblem, winMeas]
+        evicted = trackOld != -1
+        assignments[winProblem[evicted], trackOld[evicted]] = -1
+        unassigned[winProblem[evicted], trackOld[evicted]] = True
+
+        assignments[winProblem, winTrack] = winMeas
+        owners[winProblem, winMeas] = winTrack
+        unassigned[winProblem, winTrack] = False
+
+        # Step 4 - Update the prices to the winning bids
+        prices[winProblem, winMeas] = bids[winners]
+        if observer is not None:
+            observer.iterationEnd(np.max(iterations), assignments, prices)
+
+    # Lastly we calcualate the "gain" of each problem
+    assignedProblem, assignedTrack = np.nonzero(assignments != -1)
+    gains = np.zeros(numProblems)
+    np.add.at(gains, assignedProblem, rewards[assignedProblem, assignments[assignedProblem, assignedTrack],
+                                              assignedTrack])
+    if observer is not None:
+        observer.phaseEnd("auctionBatchPadded")
+
+    return gains, [assignments[p, :shapes[p, 1]] for p in range(numProblems)], iterations
+
+
+def reverseAuctionUnassigned(rewardMatrix, prices, assignments, epsilon, debug=True, observer=None):
+    # A measurement that is unassigned but still has a positive price breaks the optimality of the
+    # forward auction. This happens when we warm start from the prices of an earlier auction.
+    # Here such measurements bid for tracks instead (reverse auction) until they are either assigned or
+    # their price has dropped to 0. prices and assignments are updated in place.
+    # Without an observer the compiled reverseAuctionKernel does the bidding.
+    # observer gets the events of the auction, see observers.py. debug=True prints them
+
+    observer = observerFor(observer, debug)
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas = adjacency.shape[0]
+    numTracks = adjacency.shape[1]
+
+    owners = ownersOf(assignments, numMeas)
+    released = np.where((owners == -1) & (prices > 0))[0]
+    if len(released) == 0:
+        return 0
+
+    # The measurements bid, so we need the adjacency the other way around as well
+    measPtr, trackIdx, measRewards, _ = transposeAdjacency(adjacency)
+
+    # The profit of a track is its net value, and 0 for an unassigned track
+    held = heldEntries(adjacency.trackPtr, adjacency.measIdx, assignments)
+    assigned = np.where(held != -1)[0]
+    profits = np.zeros(numTracks)
+    profits[assigned] = adjacency.rewards[held[assigned]] - prices[adjacency.measIdx[held[assigned]]]
+
+    if observer is None:
+        queue = np.empty(numMeas, dtype=np.int64)
+        queue[:len(released)] = released
+        return reverseAuctionKernel(measPtr, trackIdx, measRewards, prices, assignments, owners, profits, epsilon,
+                                    queue, len(released))
+
+    unassigned = deque(released)
+
+    k = 0
+    while len(unassigned) > 0:
+        k = k + 1
+        measCurrent = unassigned.popleft()
+
+        # Find the track that gives the most value for this measurement. Value is reward - profit
+        start = measPtr[measCurrent]
+        end = measPtr[measCurrent + 1]
+        possibleTracks = trackIdx[start:end]
+        values = measRewards[start:end] - profits[possibleTracks]
+        if len(values) == 0 or np.max(values) < epsilon:
+            # No track wants this measurement, so it is free
+            prices[measCurrent] = 0
+            if observer is not None:
+                observer.released(measCurrent)
+            continue
+
+        maxIdx = np.argmax(values)
+        chosenTrack = possibleTracks[maxIdx]
+        reward = measRewards[start + maxIdx]
+        if len(values) > 1:
+            values[maxIdx] = -np.inf
+            nextBest = max(np.max(values), 0)
+        else:
+            nextBest = 0
+
+        # Lower the price to where the next best track would be almost as happy with it
+        newPrice = max(nextBest - epsilon, 0)
+
+        measOld = assignments[chosenTrack]
+        if measOld != -1:
+            owners[measOld] = -1
+            if prices[measOld] > 0:
+                unassigned.append(measOld)
+
+        assignments[chosenTrack] = measCurrent
+        owners[measCurrent] = chosenTrack
+        prices[measCurrent] = newPrice
+        profits[chosenTrack] = reward - newPrice
+        if observer is not None:
+            observer.bid(chosenTrack, measCurrent, newPrice)
+
+    return k
+
+
+@jit
+def reverseAuctionKernel(measPtr, trackIdx, measRewards, prices, assignments, owners, profits, epsilon, queue, size):
+    # Compiled loop of reverseAuctionUnassigned, without the observer hooks. The same steps in the same order,
+    # with a ring buffer of size measurements as the queue. A measurement is only queued while it has no
+    # track, so it is never in the queue twice. Returns the number of iterations
+    numMeas = prices.shape[0]
+    head = 0
+    k = 0
+    while size > 0:
+        k += 1
+        measCurrent = queue[head]
+        head = (head + 1) % numMeas
+        size -= 1
+
+        # The track that gives the most value for this measurement, and the next best. Value is reward - profit
+        start = measPtr[measCurrent]
+        end = measPtr[measCurrent + 1]
+        maxIdx = start
+        maxValue = -np.inf
+        nextBest = -np.inf
+        for i in range(start, end):
+            value = measRewards[i] - profits[trackIdx[i]]
+            if value > maxValue:
+                nextBest = maxValue
+                maxValue = value
+                maxIdx = i
+            elif value > nextBest:
+                nextBest = value
+        if start == end or maxValue < epsilon:
+            # No track wants this measurement, so it is free
+            prices[measCurrent] = 0
+            continue
+
+        chosenTrack = trackIdx[maxIdx]
+        newPrice = max(max(nextBest, 0) - epsilon, 0)
+
+        measOld = assignments[chosenTrack]
+        if measOld != -1:
+            owners[measOld] = -1
+            if prices[measOld] > 0:
+                queue[(head + size) % numMeas] = measOld
+                size += 1
+
+        assignments[chosenTrack] = measCurrent
+        owners[measCurrent] = chosenTrack
+        prices[measCurrent] = newPrice
+        profits[chosenTrack] = measRewards[maxIdx] - newPrice
+    return k
+
+
+@jit
+def auctionSide(ptr, idx, rewards, values, otherValues, mine, theirs, epsilon, queue, queueState, queued):
+    # One phase of auctionForwardReverse, for one side. Forward the tracks bid for measurements, with ptr, idx
+    # and rewards the TrackAdjacency, values the profits of the tracks, otherValues the prices, mine the
+    # assignments and theirs the owners. Reverse the measurements bid for tracks, with everything the other
+    # way around. The nodes in queue bid until a new pair is assigned or the queue is empty. A bid leaves
+    # the bidder within epsilon of its best value and sets the value of what it won so the two add up to
+    # their reward. queue is a ring buffer with the head and size in queueState, queued marks what is in it.
+    # Returns the number of iterations
+    numNodes = mine.shape[0]
+    head = queueState[0]
+    size = queueState[1]
+
+    k = 0
+    added = False
+    while size > 0 and not added:
+        k += 1
+        bidder = queue[head]
+        head = (head + 1) % numNodes
+        size -= 1
+        queued[bidder] = False
+        if mine[bidder] != -1:
+            # Assigned by a bid of the other side since it was queued
+            continue
+
+        if ptr[bidder] == ptr[bidder + 1]:
+            values[bidder] = 0
+            continue
+        maxIdx, maxValue, nextBest = bestTwo(ptr, idx, rewards, otherValues, bidder)
+        if not maxValue > 0:
+            # Nothing has net value for it, it is happy unassigned
+            values[bidder] = 0
+            continue
+        chosen = idx[maxIdx]
+
+        old = theirs[chosen]
+        if old != -1:
+            mine[old] = -1
+            if values[old] > 0 and not queued[old]:
+                queue[(head + size) % numNodes] = old
+                size += 1
+                queued[old] = True
+        else:
+            added = True
+        mine[bidder] = chosen
+        theirs[chosen] = bidder
+
+        values[bidder] = max(max(nextBest, 0) - epsilon, 0)
+        otherValues[chosen] = rewards[maxIdx] - values[bidder]
+
+    queueState[0] = head
+    queueState[1] = size
+    return k
+
+
+@jit
+def auctionForwardReverseKernel(trackPtr, measIdx, rewards, measPtr, trackIdx, measRewards, prices, profits,
+                                assignments, owners, epsilon, trackQueue, trackState, trackQueued, measQueue,
+                                measState, measQueued, side):
+    # The turns of auctionForwardReverse, starting with side (0 forward, 1 reverse). Returns the iterations
+    k = 0
+    while trackState[1] > 0 or measState[1] > 0:
+        if side == 0:
+            k += auctionSide(trackPtr, measIdx, rewards, profits, prices, assignments, owners, epsilon,
+                             trackQueue, trackState, trackQueued)
+        else:
+            k += auctionSide(measPtr, trackIdx, measRewards, prices, profits, owners, assignments, epsilon,
+                             measQueue, measState, measQueued)
+        side = 1 - side
+    return k
+
+
+def auctionSideObserved(ptr, idx, rewards, values, otherValues, mine, theirs, epsilon, queue, queueState, queued,
+                        forward, observer, k):
+    # auctionSide with the observer hooks, the same steps in the same order. The observer always sees the
+    # assignments of the tracks and the prices of the measurements. k is the iterations so far, the new total
+    # is returned
+    numNodes = mine.shape[0]
+    added = False
+    while queueState[1] > 0 and not added:
+        k += 1
+        bidder = queue[queueState[0]]
+        queueState[0] = (queueState[0] + 1) % numNodes
+        queueState[1] -= 1
+        queued[bidder] = False
+        if mine[bidder] != -1:
+            continue
+
+        if ptr[bidder] == ptr[bidder + 1]:
+            values[bidder] = 0
+            continue
+        maxIdx, maxValue, nextBest = bestTwo.py_func(ptr, idx, rewards, otherValues, bidder)
+        if not maxValue > 0:
+            values[bidder] = 0
+            if not forward:
+                observer.released(bidder)
+            observer.iterationEnd(k, theirs if not forward else mine, values if not forward else otherValues)
+            continue
+        chosen = idx[maxIdx]
+
+        old = theirs[chosen]
+        if old != -1:
+            mine[old] = -1
+            if forward:
+                observer.evicted(old, chosen)
+            if values[old] > 0 and not queued[old]:
+                queue[(queueState[0] + queueState[1]) % numNodes] = old
+                queueState[1] += 1
+                queued[old] = True
+        else:
+            added = True
+        mine[bidder] = chosen
+        theirs[chosen] = bidder
+
+        values[bidder] = max(max(nextBest, 0) - epsilon, 0)
+        otherValues[chosen] = rewards[maxIdx] - values[bidder]
+        if forward:
+            observer.bid(bidder, chosen, otherValues[chosen])
+            observer.iterationEnd(k, mine, otherValues)
+        else:
+            observer.bid(chosen, bidder, values[bidder])
+            observer.iterationEnd(k, theirs, values)
+    return k
+
+
+def sideQueue(assignments, values):
+    # The queue of auctionSide: the unassigned nodes with a positive value, they may still be able to do better
+    waiting = (assignments == -1) & (values > 0)
+    queue = np.empty(max(len(assignments), 1), dtype=np.int64)
+    bidders = np.where(waiting)[0]
+    queue[:len(bidders)] = bidders
+    return queue, np.array([0, len(bidders)], dtype=np.int64), waiting
+
+
+def auctionForwardReverse(rewardMatrix, debug=True, epsilon=0.01, prices=None, assignments=None, observer=None,
+                          duals=False):
+    # Forward-reverse auction. Besides the prices of the measurements it keeps the profits of the tracks, and
+    # both sides bid: tracks for measurements at the prices (forward, like auctionImproved) and measurements
+    # for tracks at the profits (reverse, like reverseAuctionUnassigned). Either way the bidder ends up within
+    # epsilon of its best value, and all values stay non-negative, so the result is epsilon-CS and its gain is
+    # within epsilon per assigned pair of the optimum, without padding the problem to square.
+    # On a rectangular problem the side with fewer nodes bids, the other side has plenty to choose from and
+    # the prices do not have to climb through a long price war. On a cold start only that side bids.
+    # With prices (and assignments) to warm start from, the tracks that are not happy bid forward and the
+    # unassigned measurements with a price left bid reverse. The sides take turns: a turn ends when it has
+    # assigned a new pair or has no bidders left. Assigned pairs only grow and neither side puts bidders in
+    # the queue of the other, so there are at most min(numMeas, numTracks) + 2 turns.
+    # prices and assignments are updated in place.
+    # Returns gain, assignments and n iterations (and prices and profits with duals=True, see auctionImproved)
+    # observer gets the events of the auction, see observers.py. debug=True prints them
+    observer = observerFor(observer, debug)
+    if observer is not None:
+        observer.phaseStart("auctionForwardReverse")
+
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas = adjacency.shape[0]
+    numTracks = adjacency.shape[1]
+    reverse = None
+
+    if prices is None and assignments is None:
+        # Cold start. The side that bids starts out with the most it could get, the other side at 0
+        prices = np.zeros(numMeas)
+        assignments = np.full(numTracks, fill_value=-1, dtype=int)
+        profits = np.zeros(numTracks)
+        if numMeas < numTracks:
+            reverse = transposeAdjacency(adjacency)
+            prices[:] = trackProfits(reverse, profits)
+        else:
+            profits[:] = trackProfits(adjacency, prices)
+    else:
+        if prices is None:
+            prices = np.zeros(numMeas)
+        if assignments is None:
+            assignments = np.full(numTracks, fill_value=-1, dtype=int)
+        # The tracks that are not within epsilon of happy bid again. The others keep the net value of their
+        # measurement as their profit, the unassigned ones get the most they could get
+        keepHappyAssignments(adjacency, prices, assignments, epsilon)
+        profits = trackProfits(adjacency, prices)
+        held = heldEntries(adjacency.trackPtr, adjacency.measIdx, assignments)
+        assigned = held != -1
+        profits[assigned] = adjacency.rewards[held[assigned]] - prices[assignments[assigned]]
+    owners = ownersOf(assignments, numMeas)
+
+    trackQueue, trackState, trackQueued = sideQueue(assignments, profits)
+    measQueue, measState, measQueued = sideQueue(owners, prices)
+    if reverse is None:
+        # Only the measurements in the queue now will ever bid, the tracks never put any there. Without them
+        # the adjacency per measurement is not needed
+        if measState[1] > 0:
+            reverse = transposeAdjacency(adjacency)
+        else:
+            reverse = TrackAdjacency(np.zeros(numMeas + 1, dtype=int), np.empty(0, dtype=int),
+                                     adjacency.rewards[:0], (numTracks, numMeas))
+
+    # Start with the side with the most bidders, on a cold start that is the only side with any
+    side = 0 if trackState[1] >= measState[1] else 1
+    if observer is None:
+        k = auctionForwardReverseKernel(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, reverse.trackPtr,
+                                        reverse.measIdx, reverse.rewards, prices, profits, assignments, owners,
+                                        epsilon, trackQueue, trackState, trackQueued, measQueue, measState,
+                                        measQueued, side)
+    else:
+        sides = [(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, profits, prices, assignments, owners,
+                  epsilon, trackQueue, trackState, trackQueued),
+                 (reverse.trackPtr, reverse.measIdx, reverse.rewards, prices, profits, owners, assignments,
+                  epsilon, measQueue, measState, measQueued)]
+        k = 0
+        while trackState[1] > 0 or measState[1] > 0:
+            k = auctionSideObserved(*sides[side], side == 0, observer, k)
+            side = 1 - side
+
+    result = auctionResult(adjacency, assignments, k, prices, duals)
+    if observer is not None:
+        observer.phaseEnd("auctionForwardReverse")
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def stoppable(solver):
+    # Whether the solver takes maxIterations. Looking at the signature is slow next to a small solve
+    return "maxIterations" in inspect.signature(solver).parameters
+
+
+def auctionEpsilonScaling(rewardMatrix, solver=auctionImproved, tolerance=0.01, scaling=5, epsilonStart=None,
+                          trialBids=8, debug=True, observer=None, **kwargs):
+    # Epsilon scaling. A fixed small epsilon makes price wars between near tied tracks slow to settle.
+    # Instead we start out with a large epsilon and shrink it geometrically. Each phase is warm started
+    # from the prices and assignments of the previous one.
+    # The final epsilon is chosen so that the gain is within tolerance of the optimal gain.
+    # epsilonStart defaults to a 25th of the largest reward.
+    # Most price wars are short though, and then the phases only add work. So the final epsilon gets a trial
+    # of trialBids bids per track first, and we only scale if the auction has not settled by then. A solver
+    # without maxIterations (auctionPipelined, auctionForwardReverse) can not be stopped, so it always scales,
+    # as does trialBids=None.
+    # solver is auctionImproved or auctionPipelined, kwargs are passed on to it (e.g. depth).
+    # Returns gain, assignments, total iterations and the iterations of each phase
+    # observer gets the phases and the events of the solvers, see observers.py. debug=True prints them
+
+    observer = observerFor(observer, debug)
+
+    # Convert once, instead of in every phase
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas = adjacency.shape[0]
+    numTracks = adjacency.shape[1]
+
+    prices = np.zeros(numMeas)
+    assignments = np.full(numTracks, fill_value=-1, dtype=int)
+
+    if adjacency.rewards.size == 0:
+        return 0, assignments, 0, []
+
+    # With epsilon-complementary slackness the gain is within epsilon per assigned track of the optimum
+    epsilonFinal = tolerance / max(min(numMeas, numTracks), 1)
+
+    phaseIterations = []
+    if trialBids and stoppable(solver):
+        if observer is not None:
+            observer.phaseStart(f"epsilon={epsilonFinal} (trial)")
+        gain, _, k = solver(adjacency, debug=False, epsilon=epsilonFinal, prices=prices, assignments=assignments,
+                            observer=observer, maxIterations=trialBids * numTracks, **kwargs)
+        phaseIterations.append(k)
+        if observer is not None:
+            observer.phaseEnd(f"epsilon={epsilonFinal} (trial)")
+
+        # Settled, this is the fixed epsilon auction. Otherwise scale, warm started from where the trial stopped
+        if k < trialBids * numTracks:
+            return gain, assignments, k, phaseIterations
+
+    if epsilonStart is None:
+        epsilonStart = np.max(np.abs(adjacency.rewards)) / 25
+    epsilon = max(epsilonStart, epsilonFinal)
+
+    while True:
+        if observer is not None:
+            observer.phaseStart(f"epsilon={epsilon}")
+
+        _, _, k = solver(adjacency, debug=False, epsilon=epsilon, prices=prices, assignments=assignments,
+                         observer=observer, **kwargs)
+
+        # Measurements that lost their track during the warm start can be left with a positive price.
+        # Releasing them in every phase lets the prices fall in steps of the current epsilon
+        k = k + reverseAuctionUnassigned(adjacency, prices, assignments, epsilon, debug=False, observer=observer)
+        phaseIterations.append(k)
+        if observer is not None:
+            observer.phaseEnd(f"epsilon={epsilon}")
+
+        if epsilon <= epsilonFinal:
+            break
+        epsilon = max(epsilon / scaling, epsilonFinal)
+
+        # Bids made with a large epsilon overshoot
+        tightenPrices(adjacency, prices, assignments)
+
+        # If our gain is within tolerance of the dual bound we are done, no matter how large epsilon still is
+        if dualBound(adjacency, prices) - assignmentGain(adjacency, assignments) <= tolerance:
+            if observer is not None:
+                observer.message(f"gain within tolerance of the dual bound")
+            break
+
+        # Warm start - keep the assignments of the tracks that are still almost happy with the new epsilon
+        keepHappyAssignments(adjacency, prices, assignments, epsilon)
+
+    # Lastly we calcualate the "gain". That is the total reward for our chosen assignment
+    gain = assignmentGain(adjacency, assignments)
+
+    return gain, assignments, sum(phaseIterations), phaseIterations
+
+
+def remapWarmStart(prices, assignments, measOrigin, trackOrigin):
+    # Carry prices and assignments over to a frame where the measurements or tracks have changed.
+    # measOrigin[i] is the index in the previous frame of measurement i in the new frame, -1 if it is new.
+    # trackOrigin is the same for the tracks. New measurements start at price 0 and new tracks unassigned
+    measOrigin = np.asarray(measOrigin, dtype=int)
+    trackOrigin = np.asarray(trackOrigin, dtype=int)
+
+    measKnown = np.where(measOrigin != -1)[0]
+    newPrices = np.zeros(len(measOrigin))
+    newPrices[measKnown] = prices[measOrigin[measKnown]]
+
+    # Index -1 (gone or unassigned) maps to -1
+    measNew = np.full(len(prices) + 1, fill_value=-1, dtype=int)
+    measNew[measOrigin[measKnown]] = measKnown
+
+    trackKnown = np.where(trackOrigin != -1)[0]
+    newAssignments = np.full(len(trackOrigin), fill_value=-1, dtype=int)
+    newAssignments[trackKnown] = measNew[assignments[trackOrigin[trackKnown]]]
+
+    return newPrices, newAssignments
+
+
+def auctionWarmStart(rewardMatrix, prices=None, assignments=None, solver=auctionImproved, epsilon=0.01, debug=True,
+                     observer=None, **kwargs):
+    # Solve one frame of a tracking loop, warm started from the prices and assignments of the frame before.
+    # Consecutive frames are alike so most tracks keep their measurement and only a few have to bid.
+    # Use remapWarmStart first if the tracks or measurements have changed.
+    # The prices and assignments passed in are not modified.
+    # solver is auctionImproved or auctionPipelined, kwargs are passed on to it (e.g. depth).
+    # Returns gain, assignments, n iterations and the final prices to pass on to the next frame
+    # observer gets the events of the solvers, see observers.py. debug=True prints them
+
+    observer = observerFor(observer, debug)
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas = adjacency.shape[0]
+    numTracks = adjacency.shape[1]
+
+    if prices is None:
+        prices = np.zeros(numMeas)
+    else:
+        prices = np.array(prices, dtype=float)
+
+    if assignments is None:
+        assignments = np.full(numTracks, fill_value=-1, dtype=int)
+    else:
+        assignments = np.array(assignments, dtype=int)
+
+    # Drop pairs that are no longer feasible. Then, as the rewards have changed since the prices were set,
+    # lower overshooting prices and keep the tracks that are still almost happy
+    keepHappyAssignments(adjacency, prices, assignments, np.inf)
+    tightenPrices(adjacency, prices, assignments)
+    keepHappyAssignments(adjacency, prices, assignments, epsilon)
+
+    _, _, k = solver(adjacency, debug=False, epsilon=epsilon, prices=prices, assignments=assignments,
+                     observer=observer, **kwargs)
+
+    # Measurements that have lost their track keep their old price, release those
+    k = k + reverseAuctionUnassigned(adjacency, prices, assignments, epsilon, debug=False, observer=observer)
+
+    gain = assignmentGain(adjacency, assignments)
+    return gain, assignments, k, prices
+
+
+def auctionMethodExtended(rewardMatrix, debug=True, observer=None):
     ###
     # INPUTS:
     # rewardMatrix    A nxm numpu array containing the costMatrix for the assignment problem
+    #                 Can also be scipy.sparse or a TrackAdjacency
     # OUTPUTS:
     # assignments
     # assignmentsTrack
-    numMeas = rewardMatrix.shape[0]
-    numTracks = rewardMatrix.shape[1]
-
-    if debug:
-        print(f"========================================")
-        print(f"Beginning Auction Method")
+    # observer gets the events of the auction, see observers.py. debug=True prints them
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas = adjacency.shape[0]
+    numTracks = adjacency.shape[1]
 
+    observer = observerFor(observer, debug)
+    if observer is not None:
+        observer.phaseStart("auctionMethodExtended")
 
 
     epsilon = 0.01
     prices = np.zeros(numMeas)
-    unassigned = list(range(numTracks))
-    assignments = np.full(numTracks, fill_value=-1, dtype=np.int)
+    unassigned = deque(range(numTracks))
+    assignments = np.full(numTracks, fill_value=-1, dtype=int)
+    owners = np.full(numMeas, fill_value=-1, dtype=int)
 
 
     k = 0
     while len(unassigned) > 0:
         k = k + 1
-        if debug:
-            print(f"k={k}")
-            print(f"unassigned={unassigned}")
 
         # Step 1 - pick first unassigned target so we can find a measurement for it
-        unassignedOld = unassigned
-        trackCurrent = unassigned.pop(0)
-
-        if debug:
-            print(f"track={trackCurrent}")
-
-        # Step 2 - Find tentative assignment for each track
-        assignmentsTentative = np.full((numTracks), fill_value=np.nan, dtype=np.int)
-        for i in range(numTracks):
-            possibleMeasurements = np.where(rewardMatrix[:, i] > -np.inf) # Find all measurements for the given target that doesnt have infinite price
-            if len(possibleMeasurements[0]):
-                assignmentsTentative[i] = -1
-                continue
-            # Calculate the net value for each measurement to that track
-            a = rewardMatrix[possibleMeasurements, np.full_like(possibleMeasurements, fill_value=i)]
-            p = prices[possibleMeasurements]
-            net_value = a-p
-
-            # Find the measurement with highest net value
-            max = np.max(net_value)
-            if max > 0:
-
-                maxIdx = np.where(net_value==max)[1][0]
-                # Pick that as a tentative assigment
-                assignmentsTentative[i] = possibleMeasurements[0][maxIdx]
-            else:
-                assignmentsTentative[i] = -1
-
-        # Step 4 - find all tracks sharing preferred measurement with our trackCurrent
-        trackCurrentPreferredMeasurement = assignmentsTentative[trackCurrent]
-        if trackCurrentPreferredMeasurement == -1:
+        trackCurrent = unassigned.popleft()
+
+        # Step 2 - Find tentative assignment for the track
+        # Only the tentative assignment of trackCurrent is ever used, and the prices change between
+        # iterations, so it is computed here for that track alone from its feasible measurements
+        start = adjacency.trackPtr[trackCurrent]
+        end = adjacency.trackPtr[trackCurrent + 1]
+        possibleMeasurements = adjacency.measIdx[start:end]
+        netValues = adjacency.rewards[start:end] - prices[possibleMeasurements]
+        if len(netValues) == 0 or not np.max(netValues) > 0:
+            # No measurement with net value, the track stays unassigned
+            if observer is not None:
+                observer.iterationEnd(k, assignments, prices)
             continue
-        trackConflicts = np.where(assignments == trackCurrentPreferredMeasurement)
-        if debug:
-            print(f"preferred meas={trackCurrentPreferredMeasurement}")
-        # Remove the current track from the conflicts
-        trackConflicts = np.delete(trackConflicts, np.where(trackConflicts == trackCurrent))
-
-        # Loop through all the conflicting tracks
-        # If some of the conflicting tracks has already been assigned. Unassign them and add them to
-        # the unassigned list. This is presumably done because if a conflicting track is assigned
-        # That means it is assigned to the same measurement. But it feels very backwards to do it this way
-        # Basically this takes the measurement from the guy who had it before
-        for i in range(np.size(trackConflicts)):
-            # If The conflicting track is already assigned
-            if(np.size(np.where(np.array(unassigned) == trackConflicts[i])) == 0):
-                #print(f"Steal meas from track={trackConflicts[i]}")
-                assignments[trackConflicts[i]] = -1
-                unassigned.append(trackConflicts[i])
-
+        # Find the measurement with highest net value. Ties go to the first one
+        maxIdx = np.argmax(netValues)
+        trackCurrentPreferredMeasurement = possibleMeasurements[maxIdx]
 
+        # Step 4 - find the track holding the preferred measurement of trackCurrent
+        # If it is assigned, unassign it and add it to the unassigned list
+        # Basically this takes the measurement from the guy who had it before
+        trackConflict = owners[trackCurrentPreferredMeasurement]
+        if trackConflict != -1:
+            assignments[trackConflict] = -1
+            unassigned.append(trackConflict)
+            if observer is not None:
+                observer.evicted(trackConflict, trackCurrentPreferredMeasurement)
 
         # Assign preferred measurement of current track to current assignment
         assignments[trackCurrent] = trackCurrentPreferredMeasurement
+        owners[trackCurrentPreferredMeasurement] = trackCurrent
 
 
-        # Step 5 - Find all measurements feasible for currentTrack and their value
-        possibleMeasurements = np.where(rewardMatrix[:,trackCurrent] > -np.inf)
-        a = rewardMatrix[possibleMeasurements, trackCurrent] - prices[possibleMeasurements]
-
-        # Find 2 best measurements for trackCurrent
-        sorted = np.sort(a[0])
-        best = sorted[-1]
-        if len(sorted) > 1:
-            nextBest = sorted[-2]
+        # Step 5 - Find 2 best measurements for trackCurrent
+        # Staying unassigned is worth 0, so the next best can not be lower than that. Otherwise the price
+        # overshoots what the track is willing to pay and the result is not within epsilon of optimal
+        best = netValues[maxIdx]
+        if len(netValues) > 1:
+            netValues[maxIdx] = 0
+            nextBest = max(np.max(netValues), 0)
         else:
             nextBest = 0
         # calculate the gain from choosing best over next best
@@ -344,16 +1690,13 @@ def auctionMethodExtended(rewardMatrix, debug=True):
 
         prices[trackCurrentPreferredMeasurement] = prices[trackCurrentPreferredMeasurement] + gain + epsilon
 
-        if debug:
-            print(f"prices={prices}")
-            print(f"assignmetns={assignments}")
-            print(f"rewardMatric=\n{rewardMatrix}")
-            print(f"=============================================")
+        if observer is not None:
+            observer.bid(trackCurrent, trackCurrentPreferredMeasurement, prices[trackCurrentPreferredMeasurement])
+            observer.iterationEnd(k, assignments, prices)
 
-    gain = 0
-    for track, meas in enumerate(assignments):
-        if meas != -1:
-            gain += rewardMatrix[meas][track]
+    gain = assignmentGain(adjacency, assignments)
+    if observer is not None:
+        observer.phaseEnd("auctionMethodExtended")
     return gain, assignments, k
 
 
@@ -0,0 +1,23 @@
+# Purpose: Select the backend for the compiled kernels at import time.
+# If numba is installed the kernels are compiled with it, and the compiled code is cached on disk
+# so that it is only compiled once and not on every run. Without numba, or with AUCTION_BACKEND=python,
+# jit does nothing and the kernels run as plain Python.
+
+import os
+
+BACKEND = os.environ.get("AUCTION_BACKEND", "numba")
+
+if BACKEND == "numba":
+    try:
+        import numba
+    except ImportError:
+        BACKEND = "python"
+
+
+def jit(func):
+    # Compile func with numba if that is the backend. The plain Python function is always
+    # available as func.py_func so the results of the two can be compared
+    if BACKEND == "numba":
+        return numba.njit(cache=True)(func)
+    func.py_func = func
+    return func
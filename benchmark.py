@@ -0,0 +1,202 @@
+# Purpose: Benchmark suite for the solvers, with a baseline file to catch regressions.
+# Sweeps the matrix size, the gating density, the reward distribution and epsilon, and records for each
+# solver the wall time, the iterations k, the peak memory and whether the gain agrees with assign2D.
+#
+# python benchmark.py run [baseline.json] [quick|full]
+#     Run the suite and write the results to baseline.json (default benchmark.json). quick is the default.
+# python benchmark.py compare baseline.json [results.json] [threshold]
+#     Compare results.json (or a fresh run of the same grid if it is not given) against baseline.json.
+#     Time, iterations and memory more than threshold (default 0.5, i.e. 50%) worse are regressions, and
+#     so is a gain that agreed in the baseline and no longer does. Exits with 1 if there are regressions.
+#     Timings vary by 20-40% from run to run, iterations and memory do not vary at all.
+
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.sparse
+
+import backend
+from auction import auctionImproved, auctionMethodExtended, auctionPipelined, trackAdjacency
+from decomposition import assign2DOptional
+
+GRIDS = {
+    "quick": {"sizes": [10, 100, 1000], "densities": [1.0, 0.05], "rewards": ["uniform", "ties"],
+              "epsilons": [0.01]},
+    "full": {"sizes": [10, 50, 100, 500, 1000, 2000, 5000], "densities": [1.0, 0.1, 0.01],
+             "rewards": ["uniform", "ties", "exponential"], "epsilons": [0.01, 0.001]},
+}
+
+# Cases with more feasible pairs than this are skipped
+MAX_ENTRIES = 5e6
+
+# (name, solver, kwargs, largest size, takes epsilon). assign2D is the reference for the gain
+SOLVERS = [
+    ("assign2D", assign2DOptional, {}, 2000, False),
+    ("improved", auctionImproved, {}, 5000, True),
+    ("pipelined2", auctionPipelined, {"depth": 2}, 5000, True),
+    ("pipelined4", auctionPipelined, {"depth": 4}, 5000, True),
+    ("pipelined8", auctionPipelined, {"depth": 8}, 5000, True),
+    ("extended", auctionMethodExtended, {}, 100, False),
+]
+
+# Timings shorter than this are too noisy to flag
+MIN_SECONDS = 5e-3
+
+
+def makeProblem(size, density, rewards, seed=0):
+    # A size x size reward matrix as a TrackAdjacency. Each pair is feasible with probability density.
+    # uniform: rewards in [1, 10). ties: integers in [0, 20) plus a tiny bit of noise, which gives long
+    # price wars. exponential: mostly small rewards and a few large ones
+    rng = np.random.default_rng(seed)
+    if rewards == "uniform":
+        sample = lambda n: rng.uniform(1, 10, size=n)
+    elif rewards == "ties":
+        sample = lambda n: rng.integers(0, 20, size=n) + rng.random(n) * 1e-3
+    elif rewards == "exponential":
+        sample = lambda n: rng.exponential(2, size=n)
+    else:
+        raise ValueError(f"unknown reward distribution {rewards}")
+
+    mat = scipy.sparse.random(size, size, density=density, format='csc', random_state=rng, data_rvs=sample)
+    return trackAdjacency(mat)
+
+
+def timeSolver(solver, adjacency, kwargs):
+    # Best wall time of a few runs (only one if it is slow) and the result of the last one
+    times = []
+    while True:
+        t = time.perf_counter()
+        result = solver(adjacency, debug=False, **kwargs)
+        times.append(time.perf_counter() - t)
+        if sum(times) > 0.2 or len(times) == 5:
+            return min(times), result
+
+
+def peakMemory(solver, adjacency, kwargs):
+    # Peak bytes allocated by a solve, the adjacency itself is not counted
+    tracemalloc.start()
+    solver(adjacency, debug=False, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def runSuite(grid="quick"):
+    # Run every solver on every case of the grid. Returns a list of result dicts
+    grid = GRIDS[grid]
+
+    # The first call compiles the kernels, or loads them from the cache
+    warmup = makeProblem(10, 0.5, "uniform")
+    for name, solver, kwargs, maxSize, takesEpsilon in SOLVERS:
+        solver(warmup, debug=False, **kwargs)
+
+    results = []
+    for size in grid["sizes"]:
+        for density in grid["densities"]:
+            if size * size * density > MAX_ENTRIES:
+                continue
+            for rewards in grid["rewards"]:
+                adjacency = makeProblem(size, density, rewards)
+                refGain = None
+                for name, solver, kwargs, maxSize, takesEpsilon in SOLVERS:
+                    if size > maxSize:
+                        continue
+                    for epsilon in grid["epsilons"] if takesEpsilon else [None]:
+                        solverKwargs = dict(kwargs)
+                        if epsilon is not None:
+                            solverKwargs["epsilon"] = epsilon
+                        seconds, result = timeSolver(solver, adjacency, solverKwargs)
+                        gain = float(result[0])
+                        if name == "assign2D":
+                            refGain = gain
+
+                        # With epsilon complementary slackness the gain is within epsilon per track of the optimum
+                        bound = (epsilon if epsilon is not None else 0.01) * size + 1e-9
+                        record = {
+                            "solver": name,
+                            "size": size,
+                            "density": density,
+                            "rewards": rewards,
+                            "epsilon": epsilon,
+                            "seconds": seconds,
+                            "iterations": int(result[2]),
+                            "peakBytes": peakMemory(solver, adjacency, solverKwargs),
+                            "gain": gain,
+                            "refGain": refGain,
+                            "agrees": None if refGain is None else bool(abs(refGain - gain) <= bound),
+                        }
+                        results.append(record)
+                        print(f"{name:10} size={size:5} density={density:<5} rewards={rewards:11} "
+                              f"epsilon={epsilon} time={seconds:.4f}s k={record['iterations']} "
+                              f"peak={record['peakBytes']} agrees={record['agrees']}")
+    return results
+
+
+def caseKey(record):
+    return (record["solver"], record["size"], record["density"], record["rewards"], record["epsilon"])
+
+
+def compareResults(baseline, results, threshold=0.5):
+    # The regressions of results against baseline, as a list of strings
+    base = {caseKey(record): record for record in baseline}
+    regressions = []
+    for record in results:
+        old = base.get(caseKey(record))
+        if old is None:
+            continue
+        case = " ".join(str(x) for x in caseKey(record))
+        if record["seconds"] > max(old["seconds"], MIN_SECONDS) * (1 + threshold):
+            regressions.append(f"{case}: time {old['seconds']:.4f}s -> {record['seconds']:.4f}s")
+        if record["iterations"] > old["iterations"] * (1 + threshold):
+            regressions.append(f"{case}: iterations {old['iterations']} -> {record['iterations']}")
+        if record["peakBytes"] > old["peakBytes"] * (1 + threshold):
+            regressions.append(f"{case}: peak memory {old['peakBytes']} -> {record['peakBytes']}")
+        if old["agrees"] and not record["agrees"]:
+            regressions.append(f"{case}: gain {record['gain']} no longer agrees with {record['refGain']}")
+    return regressions
+
+
+def saveResults(path, results, grid):
+    meta = {
+        "grid": grid,
+        "backend": backend.BACKEND,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+
+
+def loadResults(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "run":
+        path = sys.argv[2] if len(sys.argv) > 2 else "benchmark.json"
+        grid = sys.argv[3] if len(sys.argv) > 3 else "quick"
+        saveResults(path, runSuite(grid), grid)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "compare":
+        baseline = loadResults(sys.argv[2])
+        if len(sys.argv) > 3:
+            results = loadResults(sys.argv[3])["results"]
+        else:
+            results = runSuite(baseline["meta"]["grid"])
+        threshold = float(sys.argv[4]) if len(sys.argv) > 4 else 0.5
+        regressions = compareResults(baseline["results"], results, threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions against {sys.argv[2]}")
+        if len(regressions) > 0:
+            exit(1)
+    else:
+        print(f"usage: python benchmark.py run [baseline.json] [quick|full]")
+        print(f"       python benchmark.py compare baseline.json [results.json] [threshold]")
+        exit(-1)
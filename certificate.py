@@ -0,0 +1,103 @@
+# Purpose: Check the result of an auction from its prices, instead of solving the problem again.
+# The prices p of the measurements and the profits q of the tracks (q_j = max(0, max_i r_ij - p_i)) are a
+# feasible dual solution, so sum(p) + sum(q) is an upper bound on the optimal gain. The gain of the
+# assignment is a lower bound. If the two are within tolerance the assignment is certified within tolerance
+# of the optimum, whatever solver produced it. The check is one compiled pass over the feasible pairs, O(nnz).
+# The auction also leaves the prices epsilon complementary slack (epsilon-CS): every assigned track is
+# within epsilon of its profit, unassigned tracks have no profit and unassigned measurements have price 0.
+# With epsilon-CS the gap is at most numTracks * epsilon.
+
+from collections import namedtuple
+
+import numpy as np
+
+from auction import auctionImproved, trackAdjacency
+from backend import jit
+from decomposition import assign2DOptional
+
+# certified     the gap is within tolerance and the assignment is feasible
+# gap           upper bound on how far gain is from the optimal gain
+# gain          gain of the assignment, the lower bound
+# dual          sum of the prices and profits, the upper bound
+# slack         the largest epsilon-CS violation, epsilon-CS holds for every epsilon >= slack
+# feasible      every assigned pair is feasible and no measurement is assigned twice
+Certificate = namedtuple('Certificate', ['certified', 'gap', 'gain', 'dual', 'slack', 'feasible'])
+
+# Relative rounding error allowed in the gap, the sums of the gain and the dual do not round the same way
+ROUNDING = 1e-9
+
+
+@jit
+def certificateKernel(trackPtr, measIdx, rewards, prices, profits, assignments):
+    # One pass over the feasible pairs. A given profit that is below what the track could earn is raised to
+    # it, so the dual is always valid. Returns the gain, the sum of the profits, the largest epsilon-CS
+    # violation and whether the assignment is feasible
+    numMeas = prices.shape[0]
+    taken = np.zeros(numMeas, dtype=np.bool_)
+    gain = 0.0
+    profitSum = 0.0
+    slack = 0.0
+    feasible = True
+    for track in range(assignments.shape[0]):
+        meas = assignments[track]
+        profit = max(profits[track], 0)
+        heldValue = 0.0
+        held = False
+        for i in range(trackPtr[track], trackPtr[track + 1]):
+            value = rewards[i] - prices[measIdx[i]]
+            profit = max(profit, value)
+            if measIdx[i] == meas:
+                held = True
+                heldValue = value
+                gain += rewards[i]
+        profitSum += profit
+
+        if meas == -1:
+            slack = max(slack, profit)
+        elif not held or taken[meas]:
+            feasible = False
+        else:
+            taken[meas] = True
+            slack = max(slack, profit - heldValue)
+
+    for meas in range(numMeas):
+        if prices[meas] < 0:
+            feasible = False
+        elif not taken[meas]:
+            slack = max(slack, prices[meas])
+
+    return gain, profitSum, slack, feasible
+
+
+def verifyCertificate(rewardMatrix, assignments, prices, profits=None, tolerance=None, epsilon=0.01):
+    # Certify assignments with the prices and the profits, the profits default to the smallest valid ones.
+    # tolerance defaults to the epsilon-CS bound numTracks * epsilon, plus a little for rounding.
+    # Returns a Certificate
+    adjacency = trackAdjacency(rewardMatrix)
+    numTracks = adjacency.shape[1]
+    if profits is None:
+        profits = np.zeros(numTracks)
+    if tolerance is None:
+        tolerance = numTracks * epsilon
+
+    gain, profitSum, slack, feasible = certificateKernel(adjacency.trackPtr, adjacency.measIdx, adjacency.rewards,
+                                                         prices, profits, np.asarray(assignments))
+    dual = np.sum(prices) + profitSum
+    gap = dual - gain
+    certified = feasible and gap <= tolerance + ROUNDING * max(abs(dual), 1)
+    return Certificate(bool(certified), gap, gain, dual, slack, bool(feasible))
+
+
+def auctionCertified(rewardMatrix, solver=auctionImproved, fallback=assign2DOptional, tolerance=None, epsilon=0.01,
+                     debug=True, observer=None, **kwargs):
+    # Solve with solver and certify the result. Only if the certificate fails is the problem solved again
+    # with the exact fallback solver.
+    # solver is auctionImproved or auctionPipelined, kwargs are passed on to it (e.g. depth).
+    # Returns gain, assignments, n iterations and the Certificate of the auction result
+    adjacency = trackAdjacency(rewardMatrix)
+    gain, assignments, k, prices, profits = solver(adjacency, debug=debug, epsilon=epsilon, observer=observer,
+                                                   duals=True, **kwargs)
+    certificate = verifyCertificate(adjacency, assignments, prices, profits, tolerance=tolerance, epsilon=epsilon)
+    if not certificate.certified:
+        gain, assignments, _ = fallback(adjacency, debug=debug)
+    return gain, assignments, k, certificate
@@ -0,0 +1,115 @@
+# Purpose: Binary reward datasets that open in milliseconds and load problems lazily.
+# A .mat file of reward matrices is converted once with convertRewards, and the cleanup of cleanMatrix
+# (sign flip, +inf to -inf) is done at conversion time. The binary file is
+#     header   magic "RWDS", version (uint32) and the number of problems (uint64)
+#     index    offset in bytes, rows and columns of every problem (int64)
+#     data     the float64 matrices, C order, each starting on a 64 byte boundary
+# RewardDataset maps the file with np.memmap. A problem is a read-only view of the mapped pages, nothing
+# is read or copied until its values are used, and worker processes that open the same file share the
+# pages of the OS page cache. A RewardDataset pickles as its path, so it can be passed to a process pool.
+
+import os
+import sys
+
+import numpy as np
+import scipy.io
+
+MAGIC = b"RWDS"
+VERSION = 1
+HEADER_BYTES = 16
+ALIGNMENT = 64
+
+
+def cleanMatrix(mat):
+    # If we have negative values they are costs, flip the sign. mat is never modified: a float matrix that
+    # needs no cleanup is returned as it is (float32 and read-only included), otherwise one copy is made
+    if np.any(mat < 0):
+        res = np.negative(mat, dtype=float)
+    elif not np.issubdtype(mat.dtype, np.floating) or np.any(mat == np.inf):
+        res = mat.astype(float)
+    else:
+        return mat
+
+    res[res == np.inf] = -np.inf
+    #res[np.where(res[:] == -np.inf)] = 0
+    return res
+
+
+def writeRewards(path, mats):
+    # Write the reward matrices mats (already cleaned) to the binary file path. The file is written under
+    # another name and then renamed, so a process that opens path never sees half a file
+    offsets = np.empty(len(mats), dtype=np.int64)
+    offset = HEADER_BYTES + 3 * 8 * len(mats)
+    for idx, mat in enumerate(mats):
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        offsets[idx] = offset
+        offset += 8 * mat.size
+
+    index = np.empty((len(mats), 3), dtype=np.int64)
+    index[:, 0] = offsets
+    index[:, 1:] = np.reshape([mat.shape for mat in mats], (-1, 2))
+
+    tmpPath = f"{path}.{os.getpid()}.tmp"
+    with open(tmpPath, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint32(VERSION).tobytes())
+        f.write(np.uint64(len(mats)).tobytes())
+        f.write(index.tobytes())
+        for mat, offset in zip(mats, offsets):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.ascontiguousarray(mat, dtype=np.float64).tobytes())
+    os.replace(tmpPath, path)
+
+
+def convertRewards(matPath='rewards/rewards.mat', path='rewards/nmRewards.bin', key='nmRewards'):
+    # Convert the reward matrices under key in the .mat file matPath, cleaned with cleanMatrix
+    mats = scipy.io.loadmat(matPath)[key][0]
+    writeRewards(path, [cleanMatrix(mat) for mat in mats])
+
+
+class RewardDataset:
+    # The problems of a binary reward file, see the top of this file. Index it or iterate over it to get the
+    # problems as read-only arrays
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        if len(self.data) < HEADER_BYTES or bytes(self.data[:4]) != MAGIC:
+            raise ValueError(f"{path} is not a reward dataset")
+        version = self.data[4:8].view(np.uint32)[0]
+        if version != VERSION:
+            raise ValueError(f"{path} has version {version}, expected {VERSION}")
+        count = int(self.data[8:16].view(np.uint64)[0])
+        self.index = self.data[HEADER_BYTES:HEADER_BYTES + 3 * 8 * count].view(np.int64).reshape(count, 3)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, idx):
+        offset, rows, cols = self.index[idx]
+        return self.data[offset:offset + 8 * rows * cols].view(np.float64).reshape(rows, cols)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+def openRewards(path='rewards/nmRewards.bin', matPath='rewards/rewards.mat', key='nmRewards'):
+    # Open the binary dataset, converting matPath first if the binary file is missing or older
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(matPath):
+        convertRewards(matPath, path, key)
+    return RewardDataset(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) in (3, 4):
+        convertRewards(sys.argv[1], sys.argv[2], *sys.argv[3:])
+    else:
+        print(f"usage: python dataset.py rewards.mat rewards.bin [key]")
+        exit(-1)
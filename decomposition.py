@@ -0,0 +1,165 @@
+# Purpose: Split a gated reward matrix into independent sub-problems before solving it.
+# Gating leaves the bipartite graph of tracks and measurements with a finite reward split into
+# many connected components. A track can only ever get a measurement of its own component, so each
+# component is solved on its own. Components with one track or one measurement are solved in closed
+# form, the rest are spread over a process pool.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+
+from auction import TrackAdjacency, assignmentGain, auctionImproved, trackAdjacency, trackOfEntries
+from observers import observerFor
+import stonesoup_auction
+
+
+def components(adjacency):
+    # Label the connected components of the bipartite graph. Returns the number of components and the
+    # component of each measurement and of each track. Measurements and tracks without any feasible
+    # pair end up alone in a component
+    numMeas, numTracks = adjacency.shape
+    graph = scipy.sparse.csr_matrix((np.ones(len(adjacency.measIdx)),
+                                     (adjacency.measIdx, numMeas + trackOfEntries(adjacency))),
+                                    shape=(numMeas + numTracks, numMeas + numTracks))
+    numComponents, labels = scipy.sparse.csgraph.connected_components(graph, directed=False)
+    return numComponents, labels[:numMeas], labels[numMeas:]
+
+
+def splitComponents(adjacency, measLabels, trackLabels, numComponents):
+    # Build a TrackAdjacency for each component. Returns a list of (meas, tracks, subAdjacency) where
+    # meas and tracks are the global indices of the rows and columns of the sub-problem
+    measOrder = np.argsort(measLabels, kind='stable')
+    trackOrder = np.argsort(trackLabels, kind='stable')
+    measPtr = np.searchsorted(measLabels[measOrder], np.arange(numComponents + 1))
+    trackPtr = np.searchsorted(trackLabels[trackOrder], np.arange(numComponents + 1))
+
+    # Index of each measurement inside its own component
+    localMeas = np.empty(adjacency.shape[0], dtype=int)
+    localMeas[measOrder] = np.arange(adjacency.shape[0]) - measPtr[measLabels[measOrder]]
+
+    # The entries are already ordered by track, a stable sort by component keeps that order inside
+    # each component so the entries of a component are one contiguous block
+    degrees = np.diff(adjacency.trackPtr)
+    entryOrder = np.argsort(trackLabels[trackOfEntries(adjacency)], kind='stable')
+    entryPtr = np.zeros(numComponents + 1, dtype=int)
+    entryPtr[1:] = np.cumsum(np.bincount(trackLabels, weights=degrees, minlength=numComponents)).astype(int)
+    measIdx = localMeas[adjacency.measIdx[entryOrder]]
+    rewards = adjacency.rewards[entryOrder]
+
+    subProblems = []
+    for c in range(numComponents):
+        meas = measOrder[measPtr[c]:measPtr[c + 1]]
+        tracks = trackOrder[trackPtr[c]:trackPtr[c + 1]]
+        subTrackPtr = np.zeros(len(tracks) + 1, dtype=int)
+        subTrackPtr[1:] = np.cumsum(degrees[tracks])
+        start = entryPtr[c]
+        end = entryPtr[c + 1]
+        subProblems.append((meas, tracks, TrackAdjacency(subTrackPtr, measIdx[start:end], rewards[start:end],
+                                                         (len(meas), len(tracks)))))
+    return subProblems
+
+
+def solveTrivial(adjacency, assignments, trivialTracks):
+    # Closed form solution of the components with a single track or a single measurement.
+    # With one track it takes its best measurement, with one measurement the track that gives the most
+    # for it gets it. Either way only if the reward is positive, staying unassigned is worth 0.
+    # assignments is updated in place
+    trackOf = trackOfEntries(adjacency)
+    entries = np.where(trivialTracks[trackOf] & (adjacency.rewards > 0))[0]
+    if len(entries) == 0:
+        return
+
+    # Best entry of each single track component, then best entry of each single measurement component.
+    # Sorting by reward first and then by group puts the best entry of each group last
+    for groupOf in [trackOf, adjacency.measIdx]:
+        group = groupOf[entries]
+        order = np.lexsort((adjacency.rewards[entries], group))
+        last = np.append(group[order][1:] != group[order][:-1], True)
+        entries = entries[order[last]]
+    assignments[trackOf[entries]] = adjacency.measIdx[entries]
+
+
+def solveComponent(task):
+    # Solve one component, this is what runs in the worker processes
+    solver, adjacency, kwargs = task
+    result = solver(adjacency, debug=False, **kwargs)
+    return result[1], result[2]
+
+
+def assign2DOptional(rewardMatrix, debug=True):
+    # Solve with assign2D, but with the same problem as the auctions: tracks may stay unassigned, which
+    # is worth 0. Every track gets its own dummy measurement with reward 0, so the problem is always
+    # feasible and every track is assigned to either a real or its dummy measurement.
+    # Returns (gain, assignments, 0) like the auctions, the iteration count is not known.
+    # Must be a module level function to be used with a process pool
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas, numTracks = adjacency.shape
+
+    mat = np.full((numMeas + numTracks, numTracks), -np.inf)
+    mat[adjacency.measIdx, trackOfEntries(adjacency)] = adjacency.rewards
+    mat[numMeas + np.arange(numTracks), np.arange(numTracks)] = 0
+
+    gain, col4row, row4col = stonesoup_auction.assign2D(mat, True)
+    assignments = np.where(row4col < numMeas, row4col, -1)
+    return assignmentGain(adjacency, assignments), assignments, 0
+
+
+def auctionDecomposed(rewardMatrix, solver=auctionImproved, workers=None, pool=None, debug=True, observer=None,
+                      **kwargs):
+    # Solve every connected component of rewardMatrix on its own and stitch the results together.
+    # solver is called as solver(subAdjacency, debug=False, **kwargs) and must return
+    # (gain, assignments, k, ...) like the auctions. It must be a module level function to be sent to
+    # the workers, e.g. auctionImproved or assign2DOptional.
+    # The components are solved in a ProcessPoolExecutor with workers processes, os.cpu_count() if None.
+    # Pass an existing pool to reuse it between frames. With workers=1 everything is solved in this process.
+    # Returns (gain, assignments, k, numComponents). k is the sum of the iterations of the sub-problems.
+    # observer only gets the phase and a summary of the components, the sub-problems are solved without one
+    observer = observerFor(observer, debug)
+    if observer is not None:
+        observer.phaseStart("auctionDecomposed")
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas, numTracks = adjacency.shape
+
+    numComponents, measLabels, trackLabels = components(adjacency)
+    measCount = np.bincount(measLabels, minlength=numComponents)
+    trackCount = np.bincount(trackLabels, minlength=numComponents)
+    trivial = (measCount <= 1) | (trackCount <= 1)
+
+    assignments = np.full(numTracks, fill_value=-1, dtype=int)
+    solveTrivial(adjacency, assignments, trivial[trackLabels])
+
+    # Only the components that are not trivial are split out
+    keep = np.where(~trivial)[0]
+    relabel = np.full(numComponents, len(keep))
+    relabel[keep] = np.arange(len(keep))
+    subProblems = splitComponents(adjacency, relabel[measLabels], relabel[trackLabels], len(keep) + 1)[:-1]
+
+    if observer is not None:
+        observer.message(f"{numComponents} components, {len(subProblems)} solved with {solver.__name__}")
+        observer.message(f"largest component: {max(trackCount, default=0)} tracks "
+                         f"{max(measCount, default=0)} measurements")
+
+    tasks = [(solver, subAdjacency, kwargs) for meas, tracks, subAdjacency in subProblems]
+    if workers is None:
+        workers = os.cpu_count()
+
+    if pool is not None:
+        results = pool.map(solveComponent, tasks, chunksize=max(1, len(tasks) // (4 * workers)))
+    elif workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(solveComponent, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    else:
+        results = map(solveComponent, tasks)
+
+    k = 0
+    for (meas, tracks, subAdjacency), (subAssignments, subK) in zip(subProblems, results):
+        assigned = subAssignments != -1
+        assignments[tracks[assigned]] = meas[subAssignments[assigned]]
+        k = k + subK
+
+    if observer is not None:
+        observer.phaseEnd("auctionDecomposed")
+    return assignmentGain(adjacency, assignments), assignments, k, numComponents
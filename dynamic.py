@@ -0,0 +1,278 @@
+# Purpose: An auction that keeps its state between scans, for live tracking where tracks are born and die
+# and measurements come and go one at a time.
+# DynamicAuction holds the feasible pairs, the prices and the assignments. Every change only puts the
+# tracks it affects back in the queue, and solve runs the auction for those tracks alone, so the cost of
+# an update is in proportion to the change and not to the whole problem.
+# Between solves the state is kept epsilon complementary slack (epsilon-CS), which is what makes the
+# result as good as solving from scratch: every assigned track is within epsilon of happy, no unassigned
+# track has a measurement with net value and unassigned measurements have price 0. A measurement that
+# loses its track, or is new, is released: it bids for a track itself like in reverseAuctionUnassigned.
+# Tracks and measurements are known by ids that are handed out when they are added and never reused.
+
+from collections import deque
+
+import numpy as np
+
+from auction import auctionImproved, trackAdjacency, trackOfEntries
+from observers import observerFor
+
+
+class DynamicAuction:
+
+    def __init__(self, rewardMatrix=None, epsilon=0.01, debug=True, observer=None):
+        # Start from rewardMatrix (dense, scipy.sparse or a TrackAdjacency) if given. Its rows get the
+        # measurement ids 0..numMeas-1 and its columns the track ids 0..numTracks-1, and it is solved right
+        # away with auctionImproved.
+        # observer gets the events of the auction, see observers.py. debug=True prints them
+        self.epsilon = epsilon
+        self.observer = observerFor(observer, debug)
+
+        self.trackRewards = {}    # track id -> {measurement id: reward}
+        self.measTracks = {}      # measurement id -> set of the track ids it is feasible for
+        self.prices = {}          # measurement id -> price
+        self.assignments = {}     # track id -> measurement id, -1 if unassigned
+        self.owners = {}          # measurement id -> track id, -1 if unassigned
+        self.queue = deque()
+        self.queued = set()
+        self.nextTrackId = 0
+        self.nextMeasId = 0
+
+        if rewardMatrix is not None:
+            self.load(rewardMatrix)
+
+    def load(self, rewardMatrix):
+        # Add all of rewardMatrix and solve it with the compiled auction
+        adjacency = trackAdjacency(rewardMatrix)
+        numMeas, numTracks = adjacency.shape
+        measIds = [self.newMeasurement() for meas in range(numMeas)]
+        trackIds = [self.newTrack() for track in range(numTracks)]
+
+        trackOf = trackOfEntries(adjacency)
+        for track, meas, reward in zip(trackOf, adjacency.measIdx, adjacency.rewards):
+            self.trackRewards[trackIds[track]][measIds[meas]] = reward
+            self.measTracks[measIds[meas]].add(trackIds[track])
+
+        prices = np.zeros(numMeas)
+        _, assignments, _ = auctionImproved(adjacency, debug=False, epsilon=self.epsilon, prices=prices)
+        for meas in range(numMeas):
+            self.prices[measIds[meas]] = prices[meas]
+        for track in np.where(assignments != -1)[0]:
+            self.assignments[trackIds[track]] = measIds[assignments[track]]
+            self.owners[measIds[assignments[track]]] = trackIds[track]
+        return measIds, trackIds
+
+    def addTrack(self, rewards):
+        # Add a track with rewards, {measurement id: reward} of its feasible measurements.
+        # Returns the id of the track
+        track = self.newTrack()
+        for meas, reward in rewards.items():
+            self.setReward(track, meas, reward)
+        self.enqueue(track)
+        return track
+
+    def removeTrack(self, track):
+        # Remove a track. Its measurement, if it had one, is released
+        meas = self.assignments.pop(track)
+        for other in self.trackRewards.pop(track):
+            self.measTracks[other].discard(track)
+        self.queued.discard(track)
+        if meas != -1:
+            self.owners[meas] = -1
+            self.release(meas)
+
+    def addMeasurement(self, rewards):
+        # Add a measurement with rewards, {track id: reward} of the tracks it is feasible for.
+        # Returns the id of the measurement
+        meas = self.newMeasurement()
+        for track, reward in rewards.items():
+            self.setReward(track, meas, reward)
+        self.release(meas)
+        return meas
+
+    def removeMeasurement(self, meas):
+        # Remove a measurement. Its track, if it had one, bids again
+        track = self.owners.pop(meas)
+        for other in self.measTracks.pop(meas):
+            del self.trackRewards[other][meas]
+        del self.prices[meas]
+        if track != -1:
+            self.assignments[track] = -1
+            self.enqueue(track)
+
+    def updateRewards(self, rewards):
+        # Change rewards, {(track id, measurement id): reward}. A reward of -inf makes the pair forbidden.
+        # Only the tracks whose rewards changed are checked
+        for (track, meas), reward in rewards.items():
+            if self.assignments[track] == meas:
+                # The track may no longer want its measurement. Let it bid again from scratch
+                self.assignments[track] = -1
+                self.owners[meas] = -1
+                self.setReward(track, meas, reward)
+                self.enqueue(track)
+                self.release(meas)
+            else:
+                self.setReward(track, meas, reward)
+                dropped = self.check(track)
+                if dropped != -1:
+                    self.release(dropped)
+
+    def newTrack(self):
+        track = self.nextTrackId
+        self.nextTrackId += 1
+        self.trackRewards[track] = {}
+        self.assignments[track] = -1
+        return track
+
+    def newMeasurement(self):
+        meas = self.nextMeasId
+        self.nextMeasId += 1
+        self.measTracks[meas] = set()
+        self.prices[meas] = 0
+        self.owners[meas] = -1
+        return meas
+
+    def setReward(self, track, meas, reward):
+        if reward > -np.inf:
+            self.trackRewards[track][meas] = reward
+            self.measTracks[meas].add(track)
+        else:
+            self.trackRewards[track].pop(meas, None)
+            self.measTracks[meas].discard(track)
+
+    def enqueue(self, track):
+        if track not in self.queued:
+            self.queued.add(track)
+            self.queue.append(track)
+
+    def bestTwo(self, track):
+        # The measurement with the most net value for track, that net value and the next best, at least 0
+        chosenMeas = -1
+        maxValue = -np.inf
+        nextBest = 0
+        for meas, reward in self.trackRewards[track].items():
+            value = reward - self.prices[meas]
+            if value > maxValue:
+                nextBest = max(maxValue, nextBest)
+                maxValue = value
+                chosenMeas = meas
+            elif value > nextBest:
+                nextBest = value
+        return chosenMeas, maxValue, nextBest
+
+    def check(self, track):
+        # Put track back in the queue if it is no longer within epsilon of happy. An assigned track drops its
+        # measurement first, that measurement is returned (-1 if none) and must be released
+        chosenMeas, maxValue, nextBest = self.bestTwo(track)
+        meas = self.assignments[track]
+        if meas == -1:
+            if maxValue > 0:
+                self.enqueue(track)
+        elif self.trackRewards[track][meas] - self.prices[meas] < maxValue - self.epsilon:
+            self.assignments[track] = -1
+            self.owners[meas] = -1
+            self.enqueue(track)
+            return meas
+        return -1
+
+    def profit(self, track):
+        # The net value of the measurement of track, 0 if it is unassigned
+        meas = self.assignments[track]
+        if meas == -1:
+            return 0
+        return self.trackRewards[track][meas] - self.prices[meas]
+
+    def release(self, meas):
+        # meas has no track, and its price is out of date or it is new. Like reverseAuctionUnassigned it bids
+        # for the track that gets the most out of it, at a price where the next best track is almost as
+        # happy with it, or drops its price to 0 if no track wants it. That way no other track has to bid
+        # again. A track that takes it leaves its old measurement, which is released in turn. Tracks waiting
+        # in the queue do not take part, they bid in solve
+        pending = [meas]
+        while len(pending) > 0:
+            meas = pending.pop()
+            chosenTrack = -1
+            maxValue = -np.inf
+            nextBest = 0
+            for track in self.measTracks[meas]:
+                if track in self.queued:
+                    # Its profit is not known until it has bid, it may want something else more
+                    continue
+                value = self.trackRewards[track][meas] - self.profit(track)
+                if value > maxValue:
+                    nextBest = max(maxValue, nextBest)
+                    maxValue = value
+                    chosenTrack = track
+                elif value > nextBest:
+                    nextBest = value
+
+            if not maxValue >= self.epsilon:
+                # No track wants this measurement, so it is free
+                self.prices[meas] = 0
+                if self.observer is not None:
+                    self.observer.released(meas)
+                continue
+
+            measOld = self.assignments[chosenTrack]
+            if measOld != -1:
+                self.owners[measOld] = -1
+                if self.prices[measOld] > 0:
+                    pending.append(measOld)
+            self.assignments[chosenTrack] = meas
+            self.owners[meas] = chosenTrack
+            self.prices[meas] = max(nextBest - self.epsilon, 0)
+            if self.observer is not None:
+                self.observer.bid(chosenTrack, meas, self.prices[meas])
+
+    def solve(self):
+        # Run the auction for the tracks in the queue. Returns the number of iterations
+        observer = self.observer
+        if observer is not None:
+            observer.phaseStart("DynamicAuction")
+
+        k = 0
+        while len(self.queue) > 0:
+            k = k + 1
+            trackCurrent = self.queue.popleft()
+            self.queued.discard(trackCurrent)
+            if trackCurrent not in self.assignments or self.assignments[trackCurrent] != -1:
+                # Removed, or assigned again, since it was queued
+                continue
+
+            chosenMeas, maxValue, nextBest = self.bestTwo(trackCurrent)
+            if not maxValue > 0:
+                # Stays unassigned until something changes for it
+                continue
+
+            trackOld = self.owners[chosenMeas]
+            if trackOld != -1:
+                self.assignments[trackOld] = -1
+                self.enqueue(trackOld)
+                if observer is not None:
+                    observer.evicted(trackOld, chosenMeas)
+            self.assignments[trackCurrent] = chosenMeas
+            self.owners[chosenMeas] = trackCurrent
+
+            self.prices[chosenMeas] = self.prices[chosenMeas] + maxValue - nextBest + self.epsilon
+            if observer is not None:
+                observer.bid(trackCurrent, chosenMeas, self.prices[chosenMeas])
+                observer.iterationEnd(k, self.assignments, self.prices)
+
+        if observer is not None:
+            observer.phaseEnd("DynamicAuction")
+        return k
+
+    def gain(self):
+        # The total reward of the assignments
+        return sum(self.trackRewards[track][meas] for track, meas in self.assignments.items() if meas != -1)
+
+    def rewardMatrix(self):
+        # The current problem as a dense reward matrix with -inf for forbidden pairs, for checking.
+        # Returns the matrix, the measurement ids of its rows and the track ids of its columns
+        measIds = sorted(self.measTracks)
+        trackIds = sorted(self.trackRewards)
+        row = {meas: idx for idx, meas in enumerate(measIds)}
+        mat = np.full((len(measIds), len(trackIds)), -np.inf)
+        for col, track in enumerate(trackIds):
+            for meas, reward in self.trackRewards[track].items():
+                mat[row[meas], col] = reward
+        return mat, measIds, trackIds
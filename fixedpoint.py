@@ -0,0 +1,63 @@
+# Purpose: Integer (fixed point) rewards, with the arithmetic the FPGA will use.
+# The rewards are scaled and rounded to int16 or int32, and forbidden pairs get forbiddenValue of the
+# type, the smallest integer. The auctions then run with integer prices and an integer epsilon.
+# An int16 reward is a quarter of a float64 one, and the adjacency keeps the measurement indices as int32,
+# so there is a lot less memory to stream through on big problems.
+
+import numpy as np
+
+from auction import TrackAdjacency, assignmentGain, auctionImproved, forbiddenValue, trackAdjacency
+
+
+def quantizationScale(rewards, dtype=np.int16):
+    # The largest scale that fits all the (feasible) rewards in dtype. The smallest value of dtype is left
+    # free for forbiddenValue
+    maxReward = np.max(np.abs(rewards), initial=0)
+    if maxReward == 0:
+        return 1.0
+    return np.iinfo(dtype).max / maxReward
+
+
+def quantizeRewards(rewardMatrix, dtype=np.int16, scale=None):
+    # Quantize a dense reward matrix. A reward r becomes round(r * scale), scale defaults to
+    # quantizationScale. Forbidden pairs (-inf) become forbiddenValue(dtype).
+    # Returns the integer matrix and the scale
+    rewardMatrix = np.asarray(rewardMatrix, dtype=float)
+    feasible = rewardMatrix > -np.inf
+    if scale is None:
+        scale = quantizationScale(rewardMatrix[feasible], dtype)
+
+    quantized = np.full(rewardMatrix.shape, fill_value=forbiddenValue(dtype), dtype=dtype)
+    quantized[feasible] = np.rint(rewardMatrix[feasible] * scale)
+    return quantized, scale
+
+
+def quantizedAdjacency(rewardMatrix, dtype=np.int16, scale=None):
+    # Like quantizeRewards, but straight to a TrackAdjacency with int32 measurement indices.
+    # rewardMatrix can be dense, scipy.sparse or a TrackAdjacency.
+    # Returns the TrackAdjacency and the scale
+    adjacency = trackAdjacency(rewardMatrix)
+    if scale is None:
+        scale = quantizationScale(adjacency.rewards, dtype)
+
+    measIdx = adjacency.measIdx.astype(np.int32 if adjacency.shape[0] <= np.iinfo(np.int32).max else int)
+    rewards = np.rint(adjacency.rewards * scale).astype(dtype)
+    return TrackAdjacency(adjacency.trackPtr, measIdx, rewards, adjacency.shape), scale
+
+
+def auctionQuantized(rewardMatrix, solver=auctionImproved, dtype=np.int16, scale=None, epsilon=1, debug=True,
+                     observer=None, **kwargs):
+    # Solve with quantized rewards, integer prices and an integer epsilon (in units of 1 / scale).
+    # solver is auctionImproved or auctionPipelined, kwargs are passed on to it (e.g. depth).
+    # The quantized gain is within numTracks * epsilon of the quantized optimum. Rounding adds up to half a
+    # unit per track on top, so in reward units the gain is within numTracks * (epsilon + 1) / scale of the
+    # optimal gain.
+    # Returns the gain of the assignments in the original rewards, assignments, k and the scale
+    adjacency = trackAdjacency(rewardMatrix)
+    quantized, scale = quantizedAdjacency(adjacency, dtype=dtype, scale=scale)
+
+    prices = np.zeros(adjacency.shape[0], dtype=np.int64)
+    _, assignments, k = solver(quantized, debug=debug, epsilon=int(epsilon), prices=prices, observer=observer,
+                               **kwargs)
+
+    return assignmentGain(adjacency, assignments), assignments, k, scale
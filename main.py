@@ -1,8 +1,24 @@
 from auction import *
+import backend
+import certificate
+import dataset
+import decomposition
+import dynamic
+import fixedpoint
+import murty
+import observers
+import parallel
+import pipeline
+import scenario
 import stonesoup_auction
 import numpy as np
-import scipy.io
+import os
+import scipy.sparse
 import sys
+import tempfile
+import time
+import tracemalloc
+import workspace
 
 def main():
     print("Hello World!")
@@ -38,11 +54,24 @@ def main():
     print("===============")
 
 
-def verifyAss(ssAss, erlingAss):
-    for i in range(len(ssAss)):
-        if ssAss[i] != erlingAss[i]:
-            return False
-    return True
+    gain, ass, iterations = auctionJacobi(C, debug=False)
+    print("Jacobi done")
+    print(f"gain={gain}\nass={ass}\niter={iterations}")
+    print("===============")
+
+
+def verifyAss(mat, ssAss, erlingAss, epsilon=0.01):
+    # The auctions are only epsilon optimal, so a near tie can go either way and the assignments need not be
+    # the same. erlingAss must be feasible (every measurement at most once, no forbidden pair) with a gain
+    # within numTracks * epsilon of that of ssAss
+    assigned = erlingAss[erlingAss != -1]
+    if len(np.unique(assigned)) != len(assigned):
+        return False
+    gains = []
+    for ass in [ssAss, erlingAss]:
+        tracks = np.where(ass != -1)[0]
+        gains.append(np.sum(mat[ass[tracks], tracks]))
+    return abs(gains[0] - gains[1]) <= mat.shape[1] * epsilon
 
 def verifyGain(ssGain, erlingGain, threshold=0.1):
     if abs(ssGain - erlingGain) > threshold:
@@ -50,21 +79,8 @@ def verifyGain(ssGain, erlingGain, threshold=0.1):
     else:
         return True
 
-def cleanMatrix(mat):
-    # If we have negative values
-    res = mat.copy()
-    if np.where(mat[:] < 0)[0].shape[0] > 0:
-        res = res * -1
-
-    res[np.where(res[:] == np.inf)] = -np.inf
-    #res[np.where(res[:] == -np.inf)] = 0
-    return res
-
 def runNmRewards():
-    rewMats = scipy.io.loadmat('rewards/rewards.mat')
-    rewMats = rewMats['nmRewards'][0]
-
-    mats = [cleanMatrix(mat) for mat in rewMats]
+    mats = dataset.openRewards()
 
     for idx, mat in enumerate(mats):
         print(f"Problem-{idx}")
@@ -73,19 +89,774 @@ def runNmRewards():
         gainImp, assImp, iterImp = auctionImproved(mat, debug=False)
 
         gainPipe, assPipe, iterPipe = auctionPipelined(mat, depth=1, debug=False)
-        if not (verifyAss(row4col,assExt) and
-                verifyAss(row4col,assImp) and
-                verifyAss(row4col,assPipe) and
+        gainJac, assJac, iterJac = auctionJacobi(mat, debug=False)
+        if not (verifyAss(mat, row4col, assExt) and
+                verifyAss(mat, row4col, assImp) and
+                verifyAss(mat, row4col, assPipe) and
+                verifyAss(mat, row4col, assJac) and
                 verifyGain(gain, gainExt) and
                 verifyGain(gain, gainImp) and
-                verifyGain(gain, gainPipe)):
+                verifyGain(gain, gainPipe) and
+                verifyGain(gain, gainJac)):
+            assert(False)
+
+
+def runBatch():
+    # Solve all of nmRewards in one batch and compare against solving them one at a time
+    mats = dataset.openRewards()
+
+    t = time.perf_counter()
+    for mat in mats:
+        auctionImproved(mat, debug=False)
+    tLoop = time.perf_counter() - t
+
+    t = time.perf_counter()
+    gains, assignments, iterations = auctionBatch(mats, debug=False)
+    tBatch = time.perf_counter() - t
+
+    for idx, mat in enumerate(mats):
+        gain, col4row, row4col = stonesoup_auction.assign2D(mat, True)
+        if not verifyGain(gain, gains[idx]):
             assert(False)
 
+    print(f"one at a time: {len(mats) / tLoop:.0f} problems/s")
+    print(f"batch:         {len(mats) / tBatch:.0f} problems/s")
+
+
+def runIterationCost():
+    # The time per iteration should only depend on the number of candidates per track, not on numTracks.
+    # Every track gets the same number of gated candidates, and the problems are passed as sparse
+    # matrices so that building them does not grow with numTracks * numMeas either
+    rng = np.random.default_rng(0)
+    candidates = 10
+    for numTracks in [250, 500, 1000, 2000, 4000, 8000]:
+        numMeas = numTracks
+        rows = rng.integers(0, numMeas, size=numTracks * candidates)
+        cols = np.repeat(np.arange(numTracks), candidates)
+        rewards = rng.uniform(1, 10, size=numTracks * candidates)
+        mat = scipy.sparse.csc_matrix((rewards, (rows, cols)), shape=(numMeas, numTracks))
+
+        for name, solver in [("improved", auctionImproved), ("pipelined", auctionPipelined)]:
+            t = time.perf_counter()
+            gain, ass, k = solver(mat, debug=False)
+            t = time.perf_counter() - t
+            print(f"{name:10} numTracks={numTracks:5} k={k:6} time/iter={1e6 * t / k:.1f}us")
+
+
+def runBackend():
+    # Compare the kernels against the plain Python code. The results must be identical.
+    # An observer that does nothing is enough to make the auctions run their Python loops
+    print(f"backend={backend.BACKEND}")
+    mats = dataset.openRewards()
+
+    compiled = stonesoup_auction.assign2DBasic
+    solvers = [("assign2D", lambda mat, observer=None: stonesoup_auction.assign2D(mat, True)),
+               ("improved", lambda mat, observer=None: auctionImproved(mat, debug=False, observer=observer)),
+               ("pipelined", lambda mat, observer=None: auctionPipelined(mat, depth=2, debug=False,
+                                                                          observer=observer))]
+    for name, solver in solvers:
+        # The first call compiles, or loads the kernels from the cache
+        solver(mats[0])
+        t = time.perf_counter()
+        resCompiled = [solver(mat) for mat in mats]
+        tCompiled = time.perf_counter() - t
+
+        stonesoup_auction.assign2DBasic = stonesoup_auction.assign2DBasicVectorized
+        t = time.perf_counter()
+        resPython = [solver(mat, observers.Observer()) for mat in mats]
+        tPython = time.perf_counter() - t
+        stonesoup_auction.assign2DBasic = compiled
+
+        for a, b in zip(resCompiled, resPython):
+            if not (a[0] == b[0] and np.array_equal(a[1], b[1]) and np.array_equal(a[2], b[2])):
+                assert(False)
+        print(f"{name:10} compiled={tCompiled:.3f}s python={tPython:.3f}s")
+
+
+def runAssign2D():
+    # Time the scalar and the vectorized assign2DBasic on dense square problems. The plain Python
+    # scalar loops are only run up to 500, beyond that they take too long
+    rng = np.random.default_rng(0)
+    versions = [("loops", stonesoup_auction.assign2DBasicLoops.py_func),
+                ("vectorized", stonesoup_auction.assign2DBasicVectorized)]
+    if backend.BACKEND == "numba":
+        versions.append(("compiled", stonesoup_auction.assign2DBasicLoops))
+        stonesoup_auction.assign2DBasicLoops(np.ones((2, 2)))
+
+    basic = stonesoup_auction.assign2DBasic
+    for n in [100, 250, 500, 1000, 2000]:
+        mat = rng.uniform(1, 10, size=(n, n))
+        results = []
+        for name, version in versions:
+            if name == "loops" and n > 500:
+                continue
+            stonesoup_auction.assign2DBasic = version
+            t = time.perf_counter()
+            results.append(stonesoup_auction.assign2D(mat, True))
+            t = time.perf_counter() - t
+            print(f"n={n:5} {name:10} time={t:.3f}s")
+        stonesoup_auction.assign2DBasic = basic
+
+        for gain, col4row, row4col in results[1:]:
+            if not (gain == results[0][0] and np.array_equal(col4row, results[0][1])):
+                assert(False)
+
+
+def runDecomposition():
+    # A scene of many separate clusters of tracks and measurements, plus tracks and measurements that
+    # gate with nothing. Compare solving it as one problem against solving each component on its own
+    rng = np.random.default_rng(0)
+    numClusters = 400
+    rows = []
+    cols = []
+    numMeas = 0
+    numTracks = 0
+    for cluster in range(numClusters):
+        clusterMeas = rng.integers(1, 15)
+        clusterTracks = rng.integers(1, 15)
+        meas, tracks = np.nonzero(rng.random((clusterMeas, clusterTracks)) < 0.5)
+        rows.append(meas + numMeas)
+        cols.append(tracks + numTracks)
+        numMeas += clusterMeas + rng.integers(0, 3)
+        numTracks += clusterTracks + rng.integers(0, 3)
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    rewards = rng.uniform(-1, 10, size=len(rows))
+    mat = scipy.sparse.csc_matrix((rewards, (rows, cols)), shape=(numMeas, numTracks))
+    print(f"numMeas={numMeas} numTracks={numTracks}")
+
+    for name, solver in [("improved", auctionImproved), ("assign2D", decomposition.assign2DOptional)]:
+        t = time.perf_counter()
+        gain, ass, k = solver(mat, debug=False)
+        tWhole = time.perf_counter() - t
+        for workers in [1, None]:
+            t = time.perf_counter()
+            gainDec, assDec, kDec, numComponents = decomposition.auctionDecomposed(mat, solver=solver,
+                                                                                   workers=workers, debug=False)
+            tDec = time.perf_counter() - t
+            if not verifyGain(gain, gainDec, threshold=0.01 * min(numMeas, numTracks)):
+                assert(False)
+            print(f"{name:10} whole={tWhole:.3f}s decomposed(workers={workers})={tDec:.3f}s "
+                  f"components={numComponents}")
+
+
+def runObservers(path=None):
+    # Count the events of the auctions on rewards.mat and write them to path, observers.json in the temp
+    # directory if None. Also time the auctions without any observer, with an observer that does nothing and
+    # with Counters
+    mats = dataset.openRewards()
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), "observers.json")
+
+    counters = observers.Counters()
+    for mat in mats:
+        auctionEpsilonScaling(mat, debug=False, observer=counters)
+    counters.toJSON(path)
+    print(f"events written to {path}")
+    summary = counters.summary()
+    del summary["phases"]
+    print(summary)
+
+    for name, solver in [("improved", auctionImproved), ("pipelined", auctionPipelined)]:
+        # The first call compiles, or loads the kernels from the cache
+        solver(mats[0], debug=False)
+        for observerName, observer in [("none", lambda: None), ("nothing", observers.Observer),
+                                       ("counters", observers.Counters)]:
+            t = time.perf_counter()
+            for mat in mats:
+                solver(mat, debug=False, observer=observer())
+            t = time.perf_counter() - t
+            print(f"{name:10} observer={observerName:9} time={t:.3f}s")
+
+
+def runPipeline():
+    # Size the hardware pipeline on the rewards.mat workloads. For each depth: the total cycles to solve
+    # all problems, the bids issued per cycle, how many bids were rejected because they read stale prices
+    # and how stale they were
+    mats = dataset.openRewards()
+    epsilon = 0.01
+
+    # More bids than read + compute + write can never be in flight
+    for latencies in [(1, 2, 1), (2, 4, 2)]:
+        print(f"latencies (read, compute, write)={latencies}")
+        for depth in [1, 2, 4, 8]:
+            if depth > sum(latencies):
+                continue
+            cycles = 0
+            issued = 0
+            rejected = 0
+            bids = 0
+            staleness = 0
+            for mat in mats:
+                gain, ass, k, stats = pipeline.simulatePipeline(mat, depth=depth, latencies=latencies,
+                                                                epsilon=epsilon)
+                gainRef, col4row, row4col = stonesoup_auction.assign2D(mat, True)
+                if not verifyGain(gainRef, gain, threshold=epsilon * min(mat.shape) + 1e-9):
+                    assert(False)
+                cycles += stats.cycles
+                issued += stats.issued
+                rejected += stats.rejected
+                bids += stats.accepted + stats.rejected
+                staleness += stats.meanStaleness * stats.issued
+            print(f"depth={depth} cycles={cycles} bids/cycle={issued / cycles:.3f} "
+                  f"rejected={rejected / bids:.3f} staleness={staleness / issued:.2f}")
+
+def runQuantized():
+    # Solve rewards.mat with int16 and int32 rewards and compare the gains with the float gains of assign2D.
+    # The error bound is numTracks * (epsilon + 1) / scale, see auctionQuantized
+    mats = dataset.openRewards()
+    refGains = [stonesoup_auction.assign2D(mat, True)[0] for mat in mats]
+
+    floatBytes = 0
+    for mat in mats:
+        adjacency = trackAdjacency(mat)
+        floatBytes += adjacency.measIdx.nbytes + adjacency.rewards.nbytes
+
+    for dtype in [np.int16, np.int32]:
+        for name, solver, kwargs in [("improved", auctionImproved, {}), ("pipelined", auctionPipelined, {"depth": 2})]:
+            errors = []
+            bounds = []
+            quantizedBytes = 0
+            t = time.perf_counter()
+            for mat, refGain in zip(mats, refGains):
+                gain, ass, k, scale = fixedpoint.auctionQuantized(mat, solver=solver, dtype=dtype, debug=False,
+                                                                 **kwargs)
+                errors.append(refGain - gain)
+                bounds.append(mat.shape[1] * 2 / scale)
+            t = time.perf_counter() - t
+            for mat in mats:
+                adjacency, scale = fixedpoint.quantizedAdjacency(mat, dtype=dtype)
+                quantizedBytes += adjacency.measIdx.nbytes + adjacency.rewards.nbytes
+
+            errors = np.array(errors)
+            if np.any(np.abs(errors) > np.array(bounds) + 1e-9):
+                assert(False)
+            print(f"{np.dtype(dtype).name:6} {name:10} time={t:.3f}s max error={np.max(np.abs(errors)):.2e} "
+                  f"mean error={np.mean(errors):.2e} bytes={quantizedBytes} (float {floatBytes})")
+
+
+def runScenario():
+    # Stream the frames of a synthetic scenario with thousands of targets. Each frame is checked against
+    # assign2D like runNmRewards, and solved both from scratch and warm started from the frame before
+    numFrames = 20
+    prevFrame = None
+    prices = None
+    assignments = None
+    tCold = 0
+    tWarm = 0
+    iterCold = 0
+    iterWarm = 0
+    for idx, frame in enumerate(scenario.scenarioFrames(numTargets=2000, numFrames=numFrames, seed=0)):
+        gain, ass, k, numComponents = decomposition.auctionDecomposed(frame.rewards, debug=False,
+                                                                      solver=decomposition.assign2DOptional)
+
+        t = time.perf_counter()
+        gainCold, assCold, k = auctionImproved(frame.rewards, debug=False)
+        tCold += time.perf_counter() - t
+        iterCold += k
+
+        if prevFrame is not None:
+            measOrigin = scenario.measurementOrigin(prevFrame.measTargets, frame.measTargets)
+            trackOrigin = scenario.trackOrigin(prevFrame.trackIds, frame.trackIds)
+            prices, assignments = remapWarmStart(prices, assignments, measOrigin, trackOrigin)
+        t = time.perf_counter()
+        gainWarm, assignments, k, prices = auctionWarmStart(frame.rewards, prices, assignments, debug=False)
+        tWarm += time.perf_counter() - t
+        iterWarm += k
+        prevFrame = frame
+
+        # Within epsilon per track of the optimum
+        threshold = 0.01 * frame.rewards.shape[1] + 1e-9
+        if not (verifyGain(gain, gainCold, threshold=threshold) and
+                verifyGain(gain, gainWarm, threshold=threshold)):
+            assert(False)
+
+        correct = np.mean(frame.measTargets[assCold[assCold != -1]] != -1)
+        print(f"frame={idx} shape={frame.rewards.shape} pairs={frame.rewards.nnz} components={numComponents} "
+              f"gain={gain:.3f} assigned={np.count_nonzero(assCold != -1)} to targets={correct:.3f}")
+
+    print(f"cold start: iter={iterCold} time={tCold:.3f}s")
+    print(f"warm start: iter={iterWarm} time={tWarm:.3f}s")
+
+
+def runCertificate():
+    # Check every auction result with its dual certificate instead of solving again with assign2D.
+    # The certified gains must agree with assign2D, and a spoiled assignment must not be certified
+    mats = dataset.openRewards()
+
+    tSolve = 0
+    tCertify = 0
+    tAssign2D = 0
+    numFallbacks = 0
+    for mat in mats:
+        t = time.perf_counter()
+        gain, ass, k, prices, profits = auctionImproved(mat, debug=False, duals=True)
+        tSolve += time.perf_counter() - t
+
+        t = time.perf_counter()
+        cert = certificate.verifyCertificate(mat, ass, prices, profits)
+        tCertify += time.perf_counter() - t
+        if not cert.certified:
+            numFallbacks += 1
+
+        t = time.perf_counter()
+        refGain, refAss, _ = decomposition.assign2DOptional(mat, debug=False)
+        tAssign2D += time.perf_counter() - t
+
+        if not (verifyGain(refGain, gain, threshold=cert.gap + 1e-9) and refGain <= cert.dual + 1e-9):
+            assert(False)
+
+        # Drop the most valuable pair, that leaves a gap the prices can not explain
+        if np.any(ass != -1):
+            spoiled = ass.copy()
+            spoiled[np.argmax(np.where(ass != -1, mat[ass, np.arange(len(ass))], -np.inf))] = -1
+            if certificate.verifyCertificate(mat, spoiled, prices, tolerance=1e-3).certified:
+                assert(False)
+
+    print(f"{len(mats)} problems, {len(mats) - numFallbacks} certified, {numFallbacks} need the fallback")
+    print(f"auctionImproved   time={tSolve:.3f}s")
+    print(f"certificate       time={tCertify:.3f}s")
+    print(f"assign2DOptional  time={tAssign2D:.3f}s")
+
+    # On a large scene the certificate costs next to nothing, solving again does not
+    frame = next(scenario.scenarioFrames(numTargets=3000, numFrames=1, seed=0, spacing=15))
+    adjacency = trackAdjacency(frame.rewards)
+    gain, ass, k, prices, profits = auctionImproved(adjacency, debug=False, duals=True)
+    t = time.perf_counter()
+    cert = certificate.verifyCertificate(adjacency, ass, prices, profits)
+    tCertify = time.perf_counter() - t
+    if not verifyGain(gain, certificate.auctionCertified(adjacency, debug=False)[0], threshold=0):
+        assert(False)
+    t = time.perf_counter()
+    refGain, refAss, _ = decomposition.assign2DOptional(adjacency, debug=False)
+    tAssign2D = time.perf_counter() - t
+    if not (cert.certified and verifyGain(refGain, gain, threshold=cert.gap)):
+        assert(False)
+    print(f"scene {adjacency.shape}: gap={cert.gap:.3f} certificate time={tCertify * 1e3:.2f}ms "
+          f"assign2DOptional time={tAssign2D * 1e3:.0f}ms")
+
+
+def runAnytime():
+    # Near tied rewards give long price wars. Give each frame a time budget and go on from where the last
+    # frame stopped, until the auction has converged. Compare against solving without a budget
+    rng = np.random.default_rng(0)
+    n = 2000
+    mat = rng.integers(0, 20, size=(n, n)) + rng.random((n, n)) * 1e-3
+    mat[rng.random((n, n)) < 0.9] = -np.inf
+    adjacency = trackAdjacency(mat)
+
+    # Load the compiled kernels first, that takes a few ms
+    auctionAnytime(adjacency, timeLimit=1, maxIterations=1, debug=False)
+    auctionImproved(adjacency, debug=False)
+
+    t = time.perf_counter()
+    gainFull, assFull, iterFull = auctionImproved(adjacency, debug=False)
+    tFull = time.perf_counter() - t
+    print(f"no budget: time={tFull * 1e3:.1f}ms k={iterFull} gain={gainFull:.3f}")
+
+    for timeLimit in [0.001, 0.005, 0.02]:
+        prices = None
+        ass = None
+        queue = None
+        latencies = []
+        converged = False
+        while not converged:
+            t = time.perf_counter()
+            gain, ass, k, converged, prices, queue = auctionAnytime(adjacency, timeLimit=timeLimit, debug=False,
+                                                                    prices=prices, assignments=ass, queue=queue)
+            latencies.append(time.perf_counter() - t)
+            if len(latencies) == 1:
+                firstGain = gain
+                firstAssigned = np.count_nonzero(ass != -1)
+
+        if not verifyGain(gainFull, gain, threshold=0.01 * n):
+            assert(False)
+        print(f"timeLimit={timeLimit * 1e3:.0f}ms frames={len(latencies)} "
+              f"median latency={np.median(latencies) * 1e3:.2f}ms max latency={max(latencies) * 1e3:.2f}ms "
+              f"first frame gain={firstGain:.3f} assigned={firstAssigned} final gain={gain:.3f}")
+
+
+def runParallel():
+    # The block parallel auction with more and more workers, against assign2D
+    rng = np.random.default_rng(0)
+    print(f"{os.cpu_count()} cores")
+    for n, density in [(2000, 0.2), (4000, 0.05)]:
+        mat = rng.uniform(1, 10, size=(n, n))
+        mat[rng.random((n, n)) > density] = -np.inf
+        adjacency = trackAdjacency(mat)
+        refGain, refAss, _ = decomposition.assign2DOptional(adjacency, debug=False)
+
+        parallel.auctionParallel(adjacency, workers=1, debug=False)
+        for workers in sorted({1, 2, 4, os.cpu_count()}):
+            t = time.perf_counter()
+            gain, ass, k = parallel.auctionParallel(adjacency, workers=workers, debug=False)
+            t = time.perf_counter() - t
+            if not verifyGain(refGain, gain, threshold=0.01 * n):
+                assert(False)
+            print(f"n={n:5} workers={workers:2} time={t:.3f}s rounds={k} gain={gain:.3f} assign2D={refGain:.3f}")
+
+
+def runDynamic():
+    # Tracks and measurements come and go and rewards change, one at a time. Every change is solved
+    # incrementally and checked against assign2D now and then, and compared with solving from scratch
+    rng = np.random.default_rng(0)
+    n = 3000
+    density = 5 / n
+    mat = rng.uniform(1, 10, size=(n, n))
+    mat[rng.random((n, n)) > density] = -np.inf
+    solver = dynamic.DynamicAuction(mat, debug=False)
+
+    def randomPairs(ids):
+        # About as many feasible pairs as the tracks and measurements of mat have
+        return {int(i): rng.uniform(1, 10) for i in rng.choice(ids, size=min(5, len(ids)), replace=False)}
+
+    tDynamic = 0
+    tFull = 0
+    iterDynamic = 0
+    for change in range(200):
+        tracks = list(solver.trackRewards)
+        meas = list(solver.measTracks)
+        t = time.perf_counter()
+        kind = change % 5
+        if kind == 0:
+            solver.addTrack(randomPairs(meas))
+        elif kind == 1:
+            solver.removeTrack(tracks[rng.integers(len(tracks))])
+        elif kind == 2:
+            solver.addMeasurement(randomPairs(tracks))
+        elif kind == 3:
+            solver.removeMeasurement(meas[rng.integers(len(meas))])
+        else:
+            track = tracks[rng.integers(len(tracks))]
+            solver.updateRewards({(track, m): reward + rng.normal(0, 2)
+                                  for m, reward in solver.trackRewards[track].items()})
+        iterDynamic += solver.solve()
+        tDynamic += time.perf_counter() - t
+
+        if change % 20 == 0:
+            current, measIds, trackIds = solver.rewardMatrix()
+            t = time.perf_counter()
+            auctionImproved(current, debug=False)
+            tFull += time.perf_counter() - t
+            refGain, refAss, _ = decomposition.assign2DOptional(current, debug=False)
+            if not verifyGain(refGain, solver.gain(), threshold=0.01 * len(trackIds) + 1e-9):
+                assert(False)
+            print(f"change={change} tracks={len(trackIds)} measurements={len(measIds)} gain={solver.gain():.3f} "
+                  f"assign2D={refGain:.3f}")
+
+    print(f"incremental: {tDynamic / 200 * 1e3:.3f}ms per change, iter={iterDynamic}")
+    print(f"from scratch: {tFull / 10 * 1e3:.3f}ms per solve")
+
+
+def runWorkspace():
+    # Solve the same shaped problems over and over, with and without a workspace. The bytes are the largest
+    # numpy allocation of a solve that tracemalloc sees, after everything has been compiled
+    rng = np.random.default_rng(0)
+    n = 500
+    mats = []
+    for frame in range(20):
+        mat = rng.uniform(1, 10, size=(n, n))
+        mat[rng.random((n, n)) > 0.05] = -np.inf
+        mats.append(mat)
+    space = workspace.Workspace(n, n)
+    col4row = np.empty(n, dtype=np.int64)
+    row4col = np.empty(n, dtype=np.int64)
+
+    solvers = [("auctionImproved", lambda mat: auctionImproved(mat, debug=False)),
+               ("workspace auction", lambda mat: space.auction(mat, debug=False, out=col4row)),
+               ("assign2D", lambda mat: stonesoup_auction.assign2D(mat, True)),
+               ("workspace assign2D", lambda mat: space.assign2D(mat, True, out=(col4row, row4col)))]
+    for name, solver in solvers:
+        gains = [solver(mat)[0] for mat in mats]
+        tracemalloc.start()
+        peak = 0
+        t = time.perf_counter()
+        for mat, gain in zip(mats, gains):
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            if solver(mat)[0] != gain:
+                assert(False)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - start)
+        t = time.perf_counter() - t
+        tracemalloc.stop()
+        print(f"{name:20} time={t / len(mats) * 1e3:.3f}ms allocated={peak} bytes per solve")
+
+
+def runForwardReverse():
+    # Forward only against forward-reverse and assign2D, from many more measurements than tracks to many more
+    # tracks than measurements. Every track and measurement has about 20 feasible pairs
+    rng = np.random.default_rng(0)
+    for numMeas, numTracks in [(8000, 500), (4000, 1000), (2000, 2000), (1000, 4000), (500, 8000)]:
+        mat = rng.uniform(1, 10, size=(numMeas, numTracks))
+        mat[rng.random(mat.shape) > 20 / min(mat.shape)] = -np.inf
+        adjacency = trackAdjacency(mat)
+        auctionImproved(adjacency, debug=False)
+        auctionForwardReverse(adjacency, debug=False)
+
+        t = time.perf_counter()
+        gainRef, col4row, row4col = stonesoup_auction.assign2D(mat, True)
+        tRef = time.perf_counter() - t
+        t = time.perf_counter()
+        gainImp, assImp, iterImp = auctionImproved(adjacency, debug=False)
+        tImp = time.perf_counter() - t
+        t = time.perf_counter()
+        gainFR, assFR, iterFR = auctionForwardReverse(adjacency, debug=False)
+        tFR = time.perf_counter() - t
+
+        threshold = 0.01 * min(mat.shape)
+        if not (verifyGain(gainRef, gainImp, threshold) and verifyGain(gainRef, gainFR, threshold)):
+            assert(False)
+        print(f"{numMeas}x{numTracks}: assign2D={tRef * 1e3:.1f}ms "
+              f"auctionImproved={tImp * 1e3:.2f}ms k={iterImp} "
+              f"auctionForwardReverse={tFR * 1e3:.2f}ms k={iterFR}")
+
+
+def runMurty():
+    # The k best assignments of a 200x200 problem, dense and with 10% of the pairs feasible. Every child is
+    # solved from the duals of its parent, against solving it from zero duals for a few of them
+    rng = np.random.default_rng(0)
+    for density in [1.0, 0.1]:
+        mat = rng.uniform(1, 10, size=(200, 200))
+        mat[rng.random(mat.shape) > density] = -np.inf
+        murty.murtyKBest(mat[:5, :5], k=3, debug=False)
+
+        t = time.perf_counter()
+        gains, assignments, solved = murty.murtyKBest(mat, k=100, debug=False)
+        tWarm = time.perf_counter() - t
+        t = time.perf_counter()
+        gainsCold, _, solvedCold = murty.murtyKBest(mat, k=3, warmStart=False, debug=False)
+        tCold = time.perf_counter() - t
+
+        gainRef, _, _ = decomposition.assign2DOptional(mat)
+        if not (np.isclose(gains[0], gainRef) and np.allclose(gains[:3], gainsCold)
+                and np.all(np.diff(gains) <= 1e-9)):
+            assert(False)
+        print(f"density {density}: k=100 in {tWarm:.2f}s, {solved} sub-problems, "
+              f"{tWarm / solved * 1e6:.1f}us each. From zero duals {tCold / solvedCold * 1e6:.0f}us each")
+
+
+def runCandidates():
+    # auctionImproved and auctionPipelined with and without candidate lists on dense problems. The steps, and
+    # so the results, are the same, only the bids are cheaper. With epsilon scaling to a tolerance below 1 on
+    # integer rewards the gain is that of assign2D
+    rng = np.random.default_rng(0)
+    for n in [1000, 2000]:
+        mat = rng.uniform(0, 1000, size=(n, n))
+        adjacency = trackAdjacency(mat)
+        gainRef, _, _ = stonesoup_auction.assign2D(mat, True)
+        auctionImproved(mat[:5, :5], debug=False)
+        auctionImproved(mat[:5, :5], debug=False, candidates=2)
+        for epsilon in [1.0, 0.1]:
+            t = time.perf_counter()
+            gain, assignments, k = auctionImproved(adjacency, debug=False, epsilon=epsilon)
+            line = f"{n}x{n} epsilon={epsilon}: k={k} all={(time.perf_counter() - t) * 1e3:.0f}ms"
+            if not verifyGain(gainRef, gain, epsilon * n):
+                assert(False)
+            for candidates in [16, 32]:
+                t = time.perf_counter()
+                gainCand, assCand, kCand = auctionImproved(adjacency, debug=False, epsilon=epsilon,
+                                                           candidates=candidates)
+                line += f" K={candidates}: {(time.perf_counter() - t) * 1e3:.0f}ms"
+                if not (gainCand == gain and np.array_equal(assCand, assignments) and kCand == k):
+                    assert(False)
+            print(line)
+
+        gain, _, _ = auctionPipelined(adjacency, depth=4, debug=False)
+        gainCand, _, _ = auctionPipelined(adjacency, depth=4, debug=False, candidates=16)
+        if gainCand != gain:
+            assert(False)
+
+    # int16 rewards, where reward - price does not fit the type of the rewards
+    quantized, _ = fixedpoint.quantizedAdjacency(rng.uniform(-10, 10, size=(1000, 1000)), dtype=np.int16)
+    results = [auctionImproved(quantized, debug=False, epsilon=1, prices=np.zeros(1000, dtype=np.int64),
+                               candidates=candidates) for candidates in [None, 16]]
+    if not (results[0][0] == results[1][0] and np.array_equal(results[0][1], results[1][1])
+            and results[0][2] == results[1][2]):
+        assert(False)
+    print(f"1000x1000 int16 rewards: K=16 takes the same {results[1][2]} bids as without candidate lists")
+
+    mat = np.round(rng.uniform(0, 1000, size=(200, 200)))
+    gain, _, _, _ = auctionEpsilonScaling(mat, tolerance=0.5, debug=False, candidates=16)
+    gainRef, _, _ = stonesoup_auction.assign2D(mat, True)
+    if gain != gainRef:
+        assert(False)
+    print(f"200x200 integer rewards, epsilon scaling with K=16: gain {gain} equal to assign2D")
+
+
+def runLayout():
+    # The memory layout of dense matrices of 1000 and more. trackAdjacency reads a matrix in its own memory
+    # order, and float32 or read-only input is not copied first (the peak memory is the adjacency alone).
+    # assign2D makes its one copy column major, as the shortest path search scans it a column at a time
+    rng = np.random.default_rng(0)
+    for n in [1000, 2000, 4000]:
+        mat = rng.uniform(1, 10, size=(n, n))
+        mat[rng.random(mat.shape) > 0.5] = -np.inf
+        readOnly = mat.copy()
+        readOnly.flags.writeable = False
+        line = f"{n}x{n} ({mat.nbytes / 2**20:.0f}MB) trackAdjacency:"
+        for name, variant in [("C", mat), ("Fortran", np.asfortranarray(mat)), ("float32", mat.astype(np.float32)),
+                              ("read-only", readOnly)]:
+            trackAdjacency(variant[:5, :5])
+            elapsed = np.inf
+            for repeat in range(3):
+                t = time.perf_counter()
+                trackAdjacency(variant)
+                elapsed = min(elapsed, time.perf_counter() - t)
+            tracemalloc.start()
+            adjacency = trackAdjacency(variant)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            line += f" {name} {elapsed * 1e3:.0f}ms peak {peak / 2**20:.0f}MB,"
+            if not np.array_equal(adjacency.measIdx, np.nonzero(np.isfinite(mat.T))[1]):
+                assert(False)
+        print(line)
+
+    for n in [1000, 2000]:
+        mat = rng.uniform(1, 10, size=(n, n))
+        gainRef, _, _ = stonesoup_auction.assign2D(mat, True)
+        for variant in [np.asfortranarray(mat), mat.astype(np.float32)]:
+            gain, _, _ = stonesoup_auction.assign2D(variant, True)
+            if not verifyGain(gainRef, gain, 1e-3 * n):
+                assert(False)
+
+        # The same shifted cost in both orders, the search scans the columns
+        cost = np.ascontiguousarray(10 - mat)
+        times = []
+        for variant in [cost, np.asfortranarray(cost)]:
+            stonesoup_auction.assign2DBasic(variant[:5, :5], None)
+            t = time.perf_counter()
+            stonesoup_auction.assign2DBasic(variant, None)
+            times.append(time.perf_counter() - t)
+        print(f"{n}x{n} assign2DBasic: C order {times[0] * 1e3:.0f}ms, column major {times[1] * 1e3:.0f}ms")
+
+
+def runEpsilonScaling():
+    # Compare epsilon scaling against a fixed epsilon with the same optimality guarantee
+    mats = dataset.openRewards()
+
+    # Near tied integer rewards give long price wars
+    rng = np.random.default_rng(0)
+    synthetic = []
+    for n in [50, 100, 200]:
+        mat = rng.integers(0, 20, size=(n, n)) + rng.random((n, n)) * 1e-3
+        mat[rng.random((n, n)) < 0.5] = -np.inf
+        synthetic.append(mat)
+
+    tolerance = 0.01
+    for name, problems in [("nmRewards", mats), ("synthetic", synthetic)]:
+        tFixed = 0
+        tScaled = 0
+        iterFixed = 0
+        iterScaled = 0
+
+        # Load the compiled kernels for this kind of matrix first, so that only the solving is timed
+        auctionImproved(problems[0], debug=False)
+        auctionEpsilonScaling(problems[0], tolerance=tolerance, trialBids=None, debug=False)
+
+        for mat in problems:
+            epsilon = tolerance / max(min(mat.shape), 1)
+            t = time.perf_counter()
+            gainFixed, assFixed, k = auctionImproved(mat, debug=False, epsilon=epsilon)
+            tFixed += time.perf_counter() - t
+            iterFixed += k
+
+            t = time.perf_counter()
+            gainScaled, assScaled, k, phases = auctionEpsilonScaling(mat, tolerance=tolerance, debug=False)
+            tScaled += time.perf_counter() - t
+            iterScaled += k
+
+            if not verifyGain(gainFixed, gainScaled, threshold=tolerance):
+                assert(False)
+
+        print(f"{name}: {len(problems)} problems")
+        print(f"fixed epsilon:   iter={iterFixed} time={tFixed:.3f}s")
+        print(f"epsilon scaling: iter={iterScaled} time={tScaled:.3f}s")
+
+
+def runWarmStart():
+    # A slowly changing scene. Each frame the rewards drift a little, and every 5th frame
+    # one track dies and a new one is born. Compare solving each frame from scratch against
+    # warm starting it from the frame before.
+    rng = np.random.default_rng(0)
+    numMeas = 300
+    numTracks = 300
+    density = 0.1
+    base = rng.uniform(1, 10, size=(numMeas, numTracks))
+    base[rng.random((numMeas, numTracks)) > density] = -np.inf
+
+    prices = None
+    assignments = None
+    iterCold = 0
+    iterWarm = 0
+    for frame in range(20):
+        if frame > 0 and frame % 5 == 0:
+            # The first track dies and a new one is appended at the end
+            newTrack = rng.uniform(1, 10, size=(numMeas, 1))
+            newTrack[rng.random((numMeas, 1)) > density] = -np.inf
+            base = np.hstack((base[:, 1:], newTrack))
+            trackOrigin = np.append(np.arange(1, numTracks), -1)
+            prices, assignments = remapWarmStart(prices, assignments, np.arange(numMeas), trackOrigin)
+
+        mat = base + rng.normal(0, 0.05, size=base.shape)
+
+        gainCold, assCold, k = auctionImproved(mat, debug=False)
+        iterCold += k
+        gainWarm, assignments, k, prices = auctionWarmStart(mat, prices, assignments, debug=False)
+        iterWarm += k
+
+        # Both are within epsilon per track of the optimum
+        if not verifyGain(gainCold, gainWarm, threshold=2 * 0.01 * numTracks):
+            assert(False)
+        print(f"frame={frame} cold={gainCold:.3f} warm={gainWarm:.3f} k={k}")
+
+    print(f"cold start: iter={iterCold}")
+    print(f"warm start: iter={iterWarm}")
+
 
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
+    if len(sys.argv) >= 2:
         if sys.argv[1] == "runNmRewards":
             runNmRewards()
+        elif sys.argv[1] == "runEpsilonScaling":
+            runEpsilonScaling()
+        elif sys.argv[1] == "runWarmStart":
+            runWarmStart()
+        elif sys.argv[1] == "runBatch":
+            runBatch()
+        elif sys.argv[1] == "runIterationCost":
+            runIterationCost()
+        elif sys.argv[1] == "runBackend":
+            runBackend()
+        elif sys.argv[1] == "runAssign2D":
+            runAssign2D()
+        elif sys.argv[1] == "runDecomposition":
+            runDecomposition()
+        elif sys.argv[1] == "runObservers":
+            runObservers(*sys.argv[2:3])
+        elif sys.argv[1] == "runPipeline":
+            runPipeline()
+        elif sys.argv[1] == "runQuantized":
+            runQuantized()
+        elif sys.argv[1] == "runScenario":
+            runScenario()
+        elif sys.argv[1] == "runCertificate":
+            runCertificate()
+        elif sys.argv[1] == "runAnytime":
+            runAnytime()
+        elif sys.argv[1] == "runParallel":
+            runParallel()
+        elif sys.argv[1] == "runDynamic":
+            runDynamic()
+        elif sys.argv[1] == "runWorkspace":
+            runWorkspace()
+        elif sys.argv[1] == "runForwardReverse":
+            runForwardReverse()
+        elif sys.argv[1] == "runMurty":
+            runMurty()
+        elif sys.argv[1] == "runCandidates":
+            runCandidates()
+        elif sys.argv[1] == "runLayout":
+            runLayout()
         else:
             print(f"unrecognized option {sys.argv[1]}")
             exit(-1)
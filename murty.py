@@ -0,0 +1,300 @@
+# Purpose: The k best assignments with Murty's method, for multi-hypothesis tracking.
+# The assignment problem with optional pairs is made square for the shortest augmenting path method of
+# assign2DBasic (minimizing): a row per measurement and a row per track (the track is unassigned), and a
+# column per track and a column per measurement (the measurement is unassigned). Unassigned costs 0, and so
+# does a track row against a measurement column. A hypothesis is the choice of every track, so the space is
+# partitioned on the track columns only: the child i of a solution keeps the choices of the first i free
+# tracks and forbids the choice of the next one. Forbidding "unassigned" forces the track to a measurement.
+# A child is one augmenting path away from its parent. The parent's dual variables u and v are still
+# feasible after one more edge is forbidden and some pairs are fixed, so only the column that lost its row
+# has to be assigned again, from the parent's solution and duals.
+# Forbidden edges and fixed rows are marked in scratch masks for the sub-problem being solved, and cleared
+# again after, so no cost matrix is ever copied. The children are put in a priority queue with their gain.
+# Only when a child is taken from the queue is its solution made again, so just the k solutions that are
+# returned are stored.
+
+import heapq
+
+import numpy as np
+
+from auction import trackAdjacency, trackOfEntries
+from backend import jit
+from observers import observerFor
+
+# Relative rounding error allowed when children are given up on, the loss of a child and the gains are not
+# summed the same way
+ROUNDING = 1e-9
+
+
+def squareCost(adjacency):
+    # The square cost matrix, see the top of this file, shifted to be non-negative like in assign2D
+    numMeas, numTracks = adjacency.shape
+    size = numMeas + numTracks
+    cost = np.full((size, size), np.inf)
+    cost[adjacency.measIdx, trackOfEntries(adjacency)] = -adjacency.rewards
+    cost[numMeas + np.arange(numTracks), np.arange(numTracks)] = 0
+    cost[np.arange(numMeas), numTracks + np.arange(numMeas)] = 0
+    cost[numMeas:, numTracks:] = 0
+    cost -= min(np.min(cost), 0)
+    # Column major, the augmenting paths scan a column at a time
+    return np.asfortranarray(cost)
+
+
+@jit
+def augment(C, forbidden, rowFixed, col4row, row4col, u, v, startCol, limit, pred, Row2Scan, shortestPathCost,
+            scannedRows, ScannedColIdx):
+    # One shortest augmenting path of assign2DBasicLoops, from the unassigned column startCol, skipping the
+    # forbidden edges and the fixed rows. u, v, col4row and row4col are updated. Returns False if there is
+    # no augmenting path, the sub-problem is infeasible, or if it would be longer than limit. Nothing is
+    # updated then
+    numRow = C.shape[0]
+    numRow2Scan = 0
+    for curRow in range(numRow):
+        scannedRows[curRow] = False
+        shortestPathCost[curRow] = np.inf
+        if not rowFixed[curRow]:
+            Row2Scan[numRow2Scan] = curRow
+            numRow2Scan += 1
+
+    sink = -1
+    delta = 0.0
+    curCol = startCol
+    numColsScanned = 0
+    while sink == -1:
+        ScannedColIdx[numColsScanned] = curCol
+        numColsScanned += 1
+
+        minVal = np.inf
+        closestRowScan = -1
+        for curRowScan in range(numRow2Scan):
+            curRow = Row2Scan[curRowScan]
+            if not forbidden[curRow, curCol]:
+                reducedCost = delta + C[curRow, curCol] - u[curCol] - v[curRow]
+                if reducedCost < shortestPathCost[curRow]:
+                    pred[curRow] = curCol
+                    shortestPathCost[curRow] = reducedCost
+            if shortestPathCost[curRow] < minVal:
+                minVal = shortestPathCost[curRow]
+                closestRowScan = curRowScan
+
+        if minVal == np.inf or minVal > limit:
+            return False
+
+        # The rows left to scan are not in any order, so the closest one is swapped out
+        closestRow = Row2Scan[closestRowScan]
+        scannedRows[closestRow] = True
+        numRow2Scan -= 1
+        Row2Scan[closestRowScan] = Row2Scan[numRow2Scan]
+
+        delta = shortestPathCost[closestRow]
+        if col4row[closestRow] == -1:
+            sink = closestRow
+        else:
+            curCol = col4row[closestRow]
+
+    # Update the dual variables of the path
+    u[startCol] = u[startCol] + delta
+    for i in range(1, numColsScanned):
+        curCol = ScannedColIdx[i]
+        u[curCol] = u[curCol] + delta - shortestPathCost[row4col[curCol]]
+    for curRow in range(numRow):
+        if scannedRows[curRow]:
+            v[curRow] = v[curRow] - delta + shortestPathCost[curRow]
+
+    curRow = sink
+    curCol = -1
+    while curCol != startCol:
+        curCol = pred[curRow]
+        col4row[curRow] = curCol
+        h = row4col[curCol]
+        row4col[curCol] = curRow
+        curRow = h
+    return True
+
+
+@jit
+def solveRoot(C, col4row, row4col, u, v, forbidden, rowFixed, scratch):
+    # The best assignment, column by column from zero duals like assign2DBasicLoops. The track and
+    # measurement rows and columns make it always feasible
+    pred, Row2Scan, shortestPathCost, scannedRows, ScannedColIdx = scratch
+    for col in range(C.shape[1]):
+        augment(C, forbidden, rowFixed, col4row, row4col, u, v, col, np.inf, pred, Row2Scan, shortestPathCost,
+                scannedRows, ScannedColIdx)
+
+
+@jit
+def hypothesisGain(rewards, row4col):
+    # The total reward of the tracks that got a measurement, summed in track order
+    numMeas, numTracks = rewards.shape
+    gain = 0.0
+    for track in range(numTracks):
+        if row4col[track] < numMeas:
+            gain += rewards[row4col[track], track]
+    return gain
+
+
+@jit
+def solveChild(C, rewards, forbidden, rowFixed, col4row, row4col, u, v, track, limit, warmStart, scratch):
+    # Solve, in place, the sub-problem where the row of track in col4row and row4col is forbidden for it,
+    # on top of what forbidden and rowFixed already mark. On entry col4row, row4col, u and v are the solution
+    # and duals of the parent. With the parent's duals the one augmenting path is as long as the gain the
+    # child loses, so a child that would lose more than limit is given up on early.
+    # Without warmStart the sub-problem is solved from zero duals, for comparison.
+    # Returns the gain, -inf if it is infeasible or loses more than limit
+    pred, Row2Scan, shortestPathCost, scannedRows, ScannedColIdx = scratch
+    row = row4col[track]
+    forbidden[row, track] = True
+
+    if warmStart:
+        col4row[row] = -1
+        row4col[track] = -1
+        feasible = augment(C, forbidden, rowFixed, col4row, row4col, u, v, track, limit, pred, Row2Scan,
+                           shortestPathCost, scannedRows, ScannedColIdx)
+    else:
+        # Keep only the fixed pairs and assign every other column again
+        u[:] = 0
+        v[:] = 0
+        for col in range(row4col.shape[0]):
+            if not rowFixed[row4col[col]]:
+                col4row[row4col[col]] = -1
+                row4col[col] = -1
+        feasible = True
+        for col in range(row4col.shape[0]):
+            if feasible and row4col[col] == -1:
+                feasible = augment(C, forbidden, rowFixed, col4row, row4col, u, v, col, np.inf, pred, Row2Scan,
+                                   shortestPathCost, scannedRows, ScannedColIdx)
+
+    forbidden[row, track] = False
+    if not feasible:
+        return -np.inf
+    return hypothesisGain(rewards, row4col)
+
+
+@jit
+def childGains(C, rewards, forbidden, rowFixed, col4row, row4col, u, v, freeTracks, limit, warmStart, scratch,
+               work):
+    # Murty's partition of a solution: child i keeps the rows of freeTracks[:i] and forbids the row of
+    # freeTracks[i]. Each child is solved in the work arrays, from a copy of the solution. forbidden and
+    # rowFixed mark the constraints of the solution itself and are left as they were. Returns the gains,
+    # -inf for the children that are infeasible or lose more than limit
+    workCol4row, workRow4col, workU, workV = work
+    gains = np.empty(freeTracks.shape[0])
+    for i in range(freeTracks.shape[0]):
+        if i > 0:
+            rowFixed[row4col[freeTracks[i - 1]]] = True
+        workCol4row[:] = col4row
+        workRow4col[:] = row4col
+        workU[:] = u
+        workV[:] = v
+        gains[i] = solveChild(C, rewards, forbidden, rowFixed, workCol4row, workRow4col, workU, workV,
+                              freeTracks[i], limit, warmStart, scratch)
+    for i in range(freeTracks.shape[0] - 1):
+        rowFixed[row4col[freeTracks[i]]] = False
+    return gains
+
+
+def markConstraints(solution, forbidden, rowFixed, value):
+    # Mark (value=True) or clear the forbidden edges and fixed rows of a solution in the masks
+    row4col, col4row, u, v, fixedTracks, forbiddenRows, forbiddenCols = solution
+    forbidden[forbiddenRows, forbiddenCols] = value
+    rowFixed[row4col[np.where(fixedTracks)[0]]] = value
+
+
+def murtyKBest(rewardMatrix, k=10, warmStart=True, debug=True, observer=None):
+    # The k best assignments, best first. Fewer if the problem does not have k.
+    # rewardMatrix can be dense, scipy.sparse or a TrackAdjacency. The square cost matrix is dense, so this
+    # is meant for gated clusters (see decomposition.py) of up to a few hundred tracks and measurements.
+    # warmStart=False solves every sub-problem from scratch instead of from the duals of its parent.
+    # Returns the gains, the assignments (k x numTracks, the measurement of each track or -1) and the number
+    # of sub-problems solved
+    # observer gets a message for every assignment found, see observers.py. debug=True prints them
+    observer = observerFor(observer, debug)
+    if observer is not None:
+        observer.phaseStart("murtyKBest")
+
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas, numTracks = adjacency.shape
+    if numTracks == 0:
+        # Without tracks the empty assignment is the only one
+        if observer is not None:
+            observer.phaseEnd("murtyKBest")
+        return np.zeros(min(k, 1)), np.empty((min(k, 1), 0), dtype=int), 0
+
+    size = numMeas + numTracks
+    C = squareCost(adjacency)
+    rewards = np.zeros((numMeas, numTracks), order='F')
+    rewards[adjacency.measIdx, trackOfEntries(adjacency)] = adjacency.rewards
+
+    # Scratch space of the augmenting paths, and the masks
+    scratch = (np.empty(size, dtype=np.int64), np.empty(size, dtype=np.int64), np.empty(size),
+               np.empty(size, dtype=np.bool_), np.empty(size, dtype=np.int64))
+    work = (np.empty(size, dtype=np.int64), np.empty(size, dtype=np.int64), np.empty(size), np.empty(size))
+    forbidden = np.zeros((size, size), dtype=np.bool_, order='F')
+    rowFixed = np.zeros(size, dtype=np.bool_)
+
+    col4row = np.full(size, -1, dtype=np.int64)
+    row4col = np.full(size, -1, dtype=np.int64)
+    u = np.zeros(size)
+    v = np.zeros(size)
+    solveRoot(C, col4row, row4col, u, v, forbidden, rowFixed, scratch)
+    root = (row4col, col4row, u, v, np.zeros(numTracks, dtype=bool), np.empty(0, dtype=int), np.empty(0, dtype=int))
+
+    # The queue holds (-gain, order, parent, i): child i of the solution parent, or the root if parent is None
+    queue = [(-hypothesisGain(rewards, row4col), 0, None, 0)]
+    pushed = 1
+    solved = 1
+    solutions = []
+    gains = []
+    while len(queue) > 0 and len(solutions) < k:
+        negGain, _, parent, i = heapq.heappop(queue)
+        if parent is None:
+            solution = root
+        else:
+            # Solve the child again, this time to keep its solution and duals
+            row4colP, col4rowP, uP, vP, fixedP, forbiddenRowsP, forbiddenColsP = solutions[parent]
+            freeTracks = np.where(~fixedP)[0]
+            track = freeTracks[i]
+            markConstraints(solutions[parent], forbidden, rowFixed, True)
+            rowFixed[row4colP[freeTracks[:i]]] = True
+            row4col = row4colP.copy()
+            col4row = col4rowP.copy()
+            u = uP.copy()
+            v = vP.copy()
+            solveChild(C, rewards, forbidden, rowFixed, col4row, row4col, u, v, track, np.inf, warmStart, scratch)
+            rowFixed[row4colP[freeTracks[:i]]] = False
+            markConstraints(solutions[parent], forbidden, rowFixed, False)
+            solved += 1
+
+            fixed = fixedP.copy()
+            fixed[freeTracks[:i]] = True
+            solution = (row4col, col4row, u, v, fixed, np.append(forbiddenRowsP, row4colP[track]),
+                        np.append(forbiddenColsP, track))
+        solutions.append(solution)
+        gains.append(-negGain)
+        if observer is not None:
+            observer.message(f"assignment {len(solutions)}: gain={-negGain}")
+
+        # Its children. If the queue already has enough candidates for the rest of the k, a child that would
+        # lose more than the worst of those is not needed
+        if len(solutions) < k:
+            row4col, col4row, u, v, fixed, _, _ = solution
+            freeTracks = np.where(~fixed)[0]
+            limit = np.inf
+            remaining = k - len(solutions)
+            if len(queue) >= remaining:
+                threshold = -heapq.nsmallest(remaining, queue)[-1][0]
+                limit = -negGain - threshold + ROUNDING * max(abs(negGain), 1)
+            markConstraints(solution, forbidden, rowFixed, True)
+            childGain = childGains(C, rewards, forbidden, rowFixed, col4row, row4col, u, v, freeTracks, limit,
+                                   warmStart, scratch, work)
+            markConstraints(solution, forbidden, rowFixed, False)
+            solved += len(freeTracks)
+            for i in np.where(childGain > -np.inf)[0]:
+                heapq.heappush(queue, (-childGain[i], pushed, len(solutions) - 1, i))
+                pushed += 1
+
+    assignments = np.array([solution[0][:numTracks] for solution in solutions], dtype=int).reshape(-1, numTracks)
+    assignments[assignments >= numMeas] = -1
+    if observer is not None:
+        observer.phaseEnd("murtyKBest")
+    return np.array(gains), assignments, solved
@@ -0,0 +1,194 @@
+# Purpose: Instrumentation of the solvers in auction.py.
+# A solver that is given an observer calls its hooks as it goes: when a phase starts and ends, when a
+# track bids, when a bid in the pipelined auction is accepted or rejected by the real prices, when a
+# track is evicted and at the end of every iteration. Without an observer the solvers run their
+# kernels, which have no hooks at all, so there is no overhead when nothing is observed.
+# debug=True on a solver is the same as passing a PrintObserver.
+
+import json
+import time
+
+
+class Observer:
+    # Every hook does nothing, override the ones you need
+
+    def phaseStart(self, name):
+        # A solver, or a phase of one (e.g. an epsilon of auctionEpsilonScaling), starts
+        pass
+
+    def phaseEnd(self, name):
+        pass
+
+    def bid(self, track, meas, price):
+        # track bids price for meas. For the reverse auction it is meas that bids for track
+        pass
+
+    def priceUpdate(self, meas, price, accepted, actual):
+        # A bid in the pipelined auction is checked against the real price actual. It is rejected if
+        # the real price has already reached it
+        pass
+
+    def evicted(self, track, meas):
+        # track lost meas to another track
+        pass
+
+    def released(self, meas):
+        # meas was left without a track and its price dropped to 0 (reverse auction)
+        pass
+
+    def iterationEnd(self, k, assignments, prices):
+        pass
+
+    def message(self, text):
+        # Anything else worth telling
+        pass
+
+
+class PrintObserver(Observer):
+    # Prints everything, this is what debug=True does
+
+    def phaseStart(self, name):
+        print(f"========================================")
+        print(f"Beginning {name}")
+
+    def phaseEnd(self, name):
+        print(f"Finished {name}")
+
+    def bid(self, track, meas, price):
+        print(f"track {track} bids {price} for measurement {meas}")
+
+    def priceUpdate(self, meas, price, accepted, actual):
+        if not accepted:
+            print(f"Failed to update price = {price} due to actual={actual}")
+
+    def evicted(self, track, meas):
+        print(f"track {track} was unassigned from measurement {meas}")
+
+    def released(self, meas):
+        print(f"measurement {meas} released")
+
+    def iterationEnd(self, k, assignments, prices):
+        print(f"k={k}")
+        print(f"assignments={assignments}")
+        print(f"prices={prices}")
+        print(f"=============================================")
+
+    def message(self, text):
+        print(text)
+
+
+class Counters(Observer):
+    # Counts the events and times the phases.
+    # The length of a price war is the number of times one measurement was taken from its track. It is
+    # counted per outermost phase, i.e. per problem when one Counters is passed to solver after solver.
+
+    def __init__(self):
+        self.iterations = 0
+        self.bids = 0
+        self.evictions = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.releases = 0
+        self.priceWars = []
+        self.evictionsOf = {}
+        self.phases = []
+        self.started = []
+
+    def phaseStart(self, name):
+        self.started.append((name, time.perf_counter()))
+
+    def phaseEnd(self, name):
+        name, start = self.started.pop()
+        self.phases.append({"name": name, "depth": len(self.started), "seconds": time.perf_counter() - start})
+        if len(self.started) == 0:
+            self.priceWars.extend(self.evictionsOf.values())
+            self.evictionsOf = {}
+
+    def bid(self, track, meas, price):
+        self.bids += 1
+
+    def priceUpdate(self, meas, price, accepted, actual):
+        if accepted:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+
+    def evicted(self, track, meas):
+        self.evictions += 1
+        self.evictionsOf[meas] = self.evictionsOf.get(meas, 0) + 1
+
+    def released(self, meas):
+        self.releases += 1
+
+    def iterationEnd(self, k, assignments, prices):
+        self.iterations += 1
+
+    def summary(self):
+        # Everything as a dict of plain Python types
+        wars = self.priceWars + list(self.evictionsOf.values())
+        return {
+            "iterations": self.iterations,
+            "bids": self.bids,
+            "evictions": self.evictions,
+            "priceUpdatesAccepted": self.accepted,
+            "priceUpdatesRejected": self.rejected,
+            "releases": self.releases,
+            "priceWars": len(wars),
+            "longestPriceWar": max(wars, default=0),
+            "meanPriceWar": sum(wars) / len(wars) if wars else 0,
+            "phases": self.phases,
+        }
+
+    def toJSON(self, path=None):
+        # The summary as JSON. Written to path if it is given
+        text = json.dumps(self.summary(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+
+class ObserverGroup(Observer):
+    # Pass every event on to several observers, e.g. a PrintObserver and Counters
+
+    def __init__(self, *observers):
+        self.observers = observers
+
+    def phaseStart(self, name):
+        for observer in self.observers:
+            observer.phaseStart(name)
+
+    def phaseEnd(self, name):
+        for observer in self.observers:
+            observer.phaseEnd(name)
+
+    def bid(self, track, meas, price):
+        for observer in self.observers:
+            observer.bid(track, meas, price)
+
+    def priceUpdate(self, meas, price, accepted, actual):
+        for observer in self.observers:
+            observer.priceUpdate(meas, price, accepted, actual)
+
+    def evicted(self, track, meas):
+        for observer in self.observers:
+            observer.evicted(track, meas)
+
+    def released(self, meas):
+        for observer in self.observers:
+            observer.released(meas)
+
+    def iterationEnd(self, k, assignments, prices):
+        for observer in self.observers:
+            observer.iterationEnd(k, assignments, prices)
+
+    def message(self, text):
+        for observer in self.observers:
+            observer.message(text)
+
+
+def observerFor(observer, debug):
+    # The observer a solver should use. debug=True without an observer prints everything
+    if observer is None and debug:
+        return PrintObserver()
+    return observer
@@ -0,0 +1,240 @@
+# Purpose: Block parallel auction on several cores, the software version of what auctionPipelined models.
+# Every round the unassigned tracks are split into one block per worker process and each worker computes
+# the bids of its block against the prices of the round before. The bids are then reconciled in this
+# process: every measurement goes to its highest bidder (like auctionJacobi), the prices are raised and
+# the tracks that were outbid bid again next round. Both the bids and the reconciling are compiled.
+# The reward adjacency, the prices and the bids live in multiprocessing.shared_memory, so nothing is
+# copied between the processes. Two barriers per round keep the bidding and the reconciling apart.
+
+import os
+from multiprocessing import Barrier, Process
+from multiprocessing.shared_memory import SharedMemory
+from threading import BrokenBarrierError
+
+import numpy as np
+
+from auction import auctionResult, bestTwo, ownersOf, trackAdjacency
+from backend import jit
+from observers import observerFor
+
+# Rounds with fewer bidders per worker than this are bid in this process alone, the workers are not woken.
+# Towards the end of an auction only a few tracks are left and the barriers would cost more than the bids
+MIN_BLOCK = 256
+
+
+@jit
+def computeBids(trackPtr, measIdx, rewards, prices, tracks, bidMeas, bidPrice, epsilon):
+    # The bid of each track in tracks, bidMeas is -1 for a track without a measurement with net value
+    for i in range(tracks.shape[0]):
+        track = tracks[i]
+        bidMeas[i] = -1
+        if trackPtr[track] == trackPtr[track + 1]:
+            continue
+        maxIdx, maxValue, nextBest = bestTwo(trackPtr, measIdx, rewards, prices, track)
+        if maxValue > 0:
+            bidMeas[i] = measIdx[maxIdx]
+            bidPrice[i] = prices[measIdx[maxIdx]] + maxValue - max(nextBest, 0) + epsilon
+
+
+@jit
+def reconcileBids(bidders, bidMeas, bidPrice, numBidders, prices, owners, assignments, winner):
+    # Give every measurement to its highest bidder, ties go to the first bid. The tracks that were outbid
+    # and then the tracks that were evicted, in the order of the bids, are the bidders of the next round.
+    # They are written over bidders and their number is returned. Tracks without a bid drop out for good,
+    # the prices will only rise. winner is scratch space, all -1, and is left that way
+    for i in range(numBidders):
+        meas = bidMeas[i]
+        if meas != -1 and (winner[meas] == -1 or bidPrice[i] > bidPrice[winner[meas]]):
+            winner[meas] = i
+
+    nextBidders = np.empty(numBidders, dtype=np.int64)
+    numNext = 0
+    for i in range(numBidders):
+        meas = bidMeas[i]
+        if meas != -1 and winner[meas] != i:
+            nextBidders[numNext] = bidders[i]
+            numNext += 1
+    for i in range(numBidders):
+        meas = bidMeas[i]
+        if meas != -1 and winner[meas] == i:
+            trackOld = owners[meas]
+            if trackOld != -1:
+                assignments[trackOld] = -1
+                nextBidders[numNext] = trackOld
+                numNext += 1
+            assignments[bidders[i]] = meas
+            owners[meas] = bidders[i]
+            prices[meas] = bidPrice[i]
+            winner[meas] = -1
+
+    bidders[:numNext] = nextBidders[:numNext]
+    return numNext
+
+
+def reconcileObserved(bidders, bidMeas, bidPrice, numBidders, prices, owners, assignments, observer):
+    # reconcileBids with whole-array numpy operations and the observer hooks. The same steps in the same order
+    bidding = np.where(bidMeas[:numBidders] != -1)[0]
+    tracks = bidders[bidding]
+    meas = bidMeas[bidding]
+    bids = bidPrice[bidding]
+    for track, bidMeasurement, bid in zip(tracks, meas, bids):
+        observer.bid(track, bidMeasurement, bid)
+
+    # Sort bids on measurement and then descending bid, the first bid for each measurement wins
+    order = np.lexsort((-bids, meas))
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = meas[order][1:] != meas[order][:-1]
+    winners = np.sort(order[first])
+    isWinner = np.zeros(order.size, dtype=bool)
+    isWinner[winners] = True
+
+    wonMeas = meas[winners]
+    trackOld = owners[wonMeas]
+    for track, wonMeasurement in zip(trackOld, wonMeas):
+        if track != -1:
+            observer.evicted(track, wonMeasurement)
+    trackOld = trackOld[trackOld != -1]
+    assignments[trackOld] = -1
+    assignments[tracks[winners]] = wonMeas
+    owners[wonMeas] = tracks[winners]
+    prices[wonMeas] = bids[winners]
+
+    nextBidders = np.concatenate((tracks[~isWinner], trackOld))
+    bidders[:nextBidders.size] = nextBidders
+    return nextBidders.size
+
+
+def sharedArray(shape, dtype):
+    # A new shared memory block and an array on it
+    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    shm = SharedMemory(create=True, size=size)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def attachArrays(specs):
+    # Open the shared arrays described by specs, a list of (name, shape, dtype)
+    blocks = [SharedMemory(name=name) for name, shape, dtype in specs]
+    arrays = [np.ndarray(shape, dtype=dtype, buffer=shm.buf) for shm, (name, shape, dtype) in zip(blocks, specs)]
+    return blocks, arrays
+
+
+def blockOf(numBidders, worker, workers):
+    # The bidders of worker, the blocks are as even as possible
+    return numBidders * worker // workers, numBidders * (worker + 1) // workers
+
+
+def bidWorker(specs, worker, workers, barrier, epsilon):
+    # The loop of a worker process. control[0] is the number of bidders this round and control[1] tells
+    # the workers to stop
+    blocks, (trackPtr, measIdx, rewards, prices, bidders, bidMeas, bidPrice, control) = attachArrays(specs)
+    try:
+        while True:
+            barrier.wait()
+            if control[1]:
+                break
+            start, end = blockOf(control[0], worker, workers)
+            computeBids(trackPtr, measIdx, rewards, prices, bidders[start:end], bidMeas[start:end],
+                        bidPrice[start:end], epsilon)
+            barrier.wait()
+    except BrokenBarrierError:
+        # The main process gave up
+        pass
+    finally:
+        del trackPtr, measIdx, rewards, prices, bidders, bidMeas, bidPrice, control
+        for shm in blocks:
+            shm.close()
+
+
+def auctionParallel(rewardMatrix, workers=None, debug=True, epsilon=0.01, prices=None, assignments=None,
+                    observer=None, duals=False):
+    # Solve with workers processes bidding in parallel, os.cpu_count() if None. This process computes the
+    # bids of the first block itself, so workers=1 needs no other processes at all.
+    # prices and assignments can be passed to warm start the auction. They are updated in place.
+    # rewardMatrix can be dense, scipy.sparse or a TrackAdjacency.
+    # Returns gain, assignments and n rounds (and prices and profits with duals=True, see auctionImproved)
+    # observer gets the events of the auction, see observers.py. debug=True prints them
+    observer = observerFor(observer, debug)
+    if observer is not None:
+        observer.phaseStart("auctionParallel")
+
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas, numTracks = adjacency.shape
+    if workers is None:
+        workers = os.cpu_count()
+    workers = max(min(workers, numTracks), 1)
+
+    if prices is None:
+        prices = np.zeros(numMeas)
+    if assignments is None:
+        assignments = np.full(numTracks, fill_value=-1, dtype=int)
+    owners = ownersOf(assignments, numMeas)
+
+    # Everything the workers read or write is shared
+    shared = [sharedArray(array.shape, array.dtype) for array in
+              [adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, prices]]
+    shared += [sharedArray(numTracks, np.int64), sharedArray(numTracks, np.int64),
+               sharedArray(numTracks, prices.dtype), sharedArray(2, np.int64)]
+    blocks = [shm for shm, array in shared]
+    trackPtr, measIdx, rewards, sharedPrices, bidders, bidMeas, bidPrice, control = [array for shm, array in shared]
+    trackPtr[:] = adjacency.trackPtr
+    measIdx[:] = adjacency.measIdx
+    rewards[:] = adjacency.rewards
+    sharedPrices[:] = prices
+    control[:] = 0
+    specs = [(shm.name, array.shape, array.dtype) for shm, array in shared]
+
+    barrier = Barrier(workers)
+    processes = [Process(target=bidWorker, args=(specs, worker, workers, barrier, epsilon), daemon=True)
+                 for worker in range(1, workers)]
+    finished = False
+    try:
+        for process in processes:
+            process.start()
+
+        unassigned = np.where(assignments == -1)[0]
+        numBidders = unassigned.size
+        bidders[:numBidders] = unassigned
+        winner = np.full(numMeas, fill_value=-1, dtype=np.int64)
+        k = 0
+        while numBidders > 0:
+            k = k + 1
+
+            # Bidding, this process takes the first block
+            control[0] = numBidders
+            wake = workers > 1 and numBidders >= MIN_BLOCK * workers
+            if wake:
+                barrier.wait()
+            start, end = blockOf(numBidders, 0, workers if wake else 1)
+            computeBids(trackPtr, measIdx, rewards, sharedPrices, bidders[start:end], bidMeas[start:end],
+                        bidPrice[start:end], epsilon)
+            if wake:
+                barrier.wait()
+
+            # Reconciling
+            if observer is None:
+                numBidders = reconcileBids(bidders, bidMeas, bidPrice, numBidders, sharedPrices, owners, assignments,
+                                           winner)
+            else:
+                numBidders = reconcileObserved(bidders, bidMeas, bidPrice, numBidders, sharedPrices, owners,
+                                               assignments, observer)
+                observer.iterationEnd(k, assignments, sharedPrices)
+        finished = True
+    finally:
+        # Tell the workers to stop, or if something went wrong break the barrier they wait at
+        if workers > 1 and finished:
+            control[1] = 1
+            barrier.wait()
+        else:
+            barrier.abort()
+        for process in processes:
+            process.join()
+        prices[:] = sharedPrices
+        del trackPtr, measIdx, rewards, sharedPrices, bidders, bidMeas, bidPrice, control, shared
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    result = auctionResult(adjacency, assignments, k, prices, duals)
+    if observer is not None:
+        observer.phaseEnd("auctionParallel")
+    return result
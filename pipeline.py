@@ -0,0 +1,151 @@
+# Purpose: Cycle level model of a pipelined auction, to size the hardware pipeline before synthesis.
+# A bid goes through three stages. It is issued, after readLatency cycles it reads the prices of the
+# measurements of its track and computes its bid, and computeLatency + writeLatency cycles later it is
+# written back. One bid is issued per cycle and up to depth bids are in flight at once, so a bid reads
+# prices that the bids ahead of it have not written yet. At write back the bid is rejected if the real
+# price has already reached it, and the track goes back in the queue.
+# The bids in flight are kept in a ring buffer, there is one array of prices and nothing is copied.
+
+from collections import namedtuple
+
+import numpy as np
+
+from auction import assignmentGain, bestTwo, ownersOf, trackAdjacency
+from backend import jit
+
+# cycles         cycles until the auction converged
+# issued         bids issued. Tracks without any measurement with net value are issued but not counted as bids
+# accepted       bids accepted at write back
+# rejected       bids rejected at write back, because the price they read was stale
+# dropped        tracks that found no measurement with net value and stay unassigned
+# bidsPerCycle   issued / cycles
+# rejectRate     rejected / (accepted + rejected)
+# meanStaleness  the mean number of prices written between the read and the write back of a bid
+PipelineStats = namedtuple('PipelineStats', ['cycles', 'issued', 'accepted', 'rejected', 'dropped', 'bidsPerCycle',
+                                             'rejectRate', 'meanStaleness'])
+
+
+@jit
+def simulatePipelineKernel(trackPtr, measIdx, rewards, prices, assignments, owners, epsilon, depth, readLatency,
+                           computeLatency, writeLatency):
+    # The cycle by cycle loop of simulatePipeline. prices, assignments and owners are updated in place.
+    # Returns cycles, issued, accepted, rejected, dropped and the summed staleness
+    numTracks = assignments.shape[0]
+    queue = np.empty(max(numTracks, 1), dtype=np.int64)
+    queueHead = 0
+    queueSize = 0
+    for track in range(numTracks):
+        if assignments[track] == -1:
+            queue[queueSize] = track
+            queueSize += 1
+
+    # The bids in flight, oldest first. The first numRead of them have read their prices
+    bidTrack = np.empty(depth, dtype=np.int64)
+    bidMeas = np.empty(depth, dtype=np.int64)
+    bidPrice = np.empty(depth)
+    bidIssued = np.empty(depth, dtype=np.int64)
+    bidWrites = np.empty(depth, dtype=np.int64)
+    head = 0
+    size = 0
+    numRead = 0
+
+    writeOffset = readLatency + computeLatency + writeLatency
+    cycle = 0
+    writes = 0
+    issued = 0
+    accepted = 0
+    rejected = 0
+    dropped = 0
+    staleness = 0
+    while queueSize > 0 or size > 0:
+        # Write back of the oldest bid
+        if size > 0 and bidIssued[head] + writeOffset == cycle:
+            track = bidTrack[head]
+            meas = bidMeas[head]
+            price = bidPrice[head]
+            staleness += writes - bidWrites[head]
+            head = (head + 1) % depth
+            size -= 1
+            numRead -= 1
+            if meas == -1:
+                dropped += 1
+            elif prices[meas] >= price:
+                rejected += 1
+                queue[(queueHead + queueSize) % numTracks] = track
+                queueSize += 1
+            else:
+                accepted += 1
+                prices[meas] = price
+                writes += 1
+                trackOld = owners[meas]
+                if trackOld != -1:
+                    assignments[trackOld] = -1
+                    queue[(queueHead + queueSize) % numTracks] = trackOld
+                    queueSize += 1
+                assignments[track] = meas
+                owners[meas] = track
+
+        # Issue the next unassigned track
+        if queueSize > 0 and size < depth:
+            slot = (head + size) % depth
+            bidTrack[slot] = queue[queueHead]
+            bidIssued[slot] = cycle
+            queueHead = (queueHead + 1) % numTracks
+            queueSize -= 1
+            size += 1
+            issued += 1
+
+        # The oldest bid that has not read yet reads the prices and computes its bid
+        if numRead < size:
+            slot = (head + numRead) % depth
+            if bidIssued[slot] + readLatency == cycle:
+                track = bidTrack[slot]
+                bidMeas[slot] = -1
+                if trackPtr[track] != trackPtr[track + 1]:
+                    maxIdx, maxValue, nextBest = bestTwo(trackPtr, measIdx, rewards, prices, track)
+                    if maxValue > 0:
+                        bidMeas[slot] = measIdx[maxIdx]
+                        bidPrice[slot] = prices[measIdx[maxIdx]] + maxValue - max(nextBest, 0) + epsilon
+                bidWrites[slot] = writes
+                numRead += 1
+
+        # Skip ahead over the cycles where nothing happens
+        nextCycle = cycle + 1
+        if not (queueSize > 0 and size < depth) and size > 0:
+            nextCycle = bidIssued[head] + writeOffset
+            if numRead < size:
+                nextCycle = min(nextCycle, bidIssued[(head + numRead) % depth] + readLatency)
+        cycle = max(nextCycle, cycle + 1)
+
+    return cycle, issued, accepted, rejected, dropped, staleness
+
+
+def simulatePipeline(rewardMatrix, depth=4, latencies=(1, 2, 1), epsilon=0.01, prices=None, assignments=None):
+    # Run the auction on the cycle level model of the pipeline, see the top of this file.
+    # latencies are the (read, compute, write) latencies in cycles. With one bid issued per cycle there are
+    # never more than read + compute + write bids in flight, whatever depth is.
+    # With depth=1 it is the same auction as auctionImproved, the bids just take longer.
+    # prices and assignments can be passed to warm start the auction. They are updated in place.
+    # Returns gain, assignments, cycles and the PipelineStats
+    readLatency, computeLatency, writeLatency = latencies
+    if depth < 1 or min(latencies) < 0 or computeLatency + writeLatency < 1:
+        raise ValueError("depth must be at least 1 and a bid must take at least a cycle from read to write back")
+
+    adjacency = trackAdjacency(rewardMatrix)
+    numMeas = adjacency.shape[0]
+    numTracks = adjacency.shape[1]
+
+    if prices is None:
+        prices = np.zeros(numMeas)
+    if assignments is None:
+        assignments = np.full(numTracks, fill_value=-1, dtype=int)
+    owners = ownersOf(assignments, numMeas)
+
+    cycles, issued, accepted, rejected, dropped, staleness = simulatePipelineKernel(
+        adjacency.trackPtr, adjacency.measIdx, adjacency.rewards, prices, assignments, owners, epsilon, depth,
+        readLatency, computeLatency, writeLatency)
+
+    bids = accepted + rejected
+    stats = PipelineStats(cycles, issued, accepted, rejected, dropped, issued / max(cycles, 1),
+                          rejected / max(bids, 1), staleness / max(issued, 1))
+    return assignmentGain(adjacency, assignments), assignments, cycles, stats
@@ -0,0 +1,164 @@
+# Purpose: Synthetic tracking scenarios, to get workloads as large as the real scenes.
+# Targets move with a (nearly) constant velocity in a square area. Each frame a target is detected with
+# probability pD, with Gaussian measurement noise, and clutter measurements fall uniformly over the area.
+# Targets are born and die. The tracker has a track for every target it has seen, and keeps a track
+# coasting for a few frames after its target is gone. The uncertainty of a track grows with every frame
+# it is not updated.
+# The reward of measurement i for track j is the log-likelihood ratio of "i comes from the target of j"
+# against "i is clutter". Pairs outside the gate of the track are forbidden.
+#
+# scenarioFrames is a generator. Only the targets and tracks of the current frame are kept, so runs with
+# thousands of targets and thousands of frames never need more memory than one frame. The same seed
+# always gives the same frames.
+
+from collections import namedtuple
+
+import numpy as np
+import scipy.sparse
+import scipy.spatial
+
+# rewards       (numMeas, numTracks) reward matrix. scipy.sparse (csc) with only the gated pairs stored,
+#               or a dense array with -inf for the pairs outside the gate
+# trackIds      id of each track (column). Ids are never reused, see trackOrigin
+# measTargets   id of the target that made each measurement (row), -1 for clutter
+Frame = namedtuple('Frame', ['rewards', 'trackIds', 'measTargets'])
+
+
+def scenarioFrames(numTargets=1000, numFrames=100, seed=0, dense=False, spacing=30.0, speed=5.0,
+                   processNoise=1.0, measurementNoise=5.0, pD=0.9, clutterPerTarget=0.2, survival=0.99,
+                   coastFrames=3, gate=9.21):
+    # Yield numFrames Frames of a scenario that starts out with numTargets targets.
+    # spacing        mean distance between targets, the area is sized after it
+    # speed          standard deviation of the target velocity, per frame
+    # processNoise   standard deviation of the random acceleration, per frame
+    # measurementNoise  standard deviation of the measurement noise
+    # pD             probability of detection
+    # clutterPerTarget  mean number of clutter measurements per frame, per initial target
+    # survival       probability that a target survives a frame. Births keep the number of targets steady
+    # coastFrames    frames a track is kept without a measurement before it is deleted
+    # gate           squared Mahalanobis distance of the gate, 9.21 keeps 99% of the true pairs
+    # dense          yield dense matrices (with -inf) instead of scipy.sparse
+    rng = np.random.default_rng(seed)
+    side = spacing * np.sqrt(numTargets)
+    clutterDensity = clutterPerTarget * numTargets / side ** 2
+
+    # Targets: position, velocity and id
+    position = rng.uniform(0, side, size=(numTargets, 2))
+    velocity = rng.normal(0, speed, size=(numTargets, 2))
+    targetIds = np.arange(numTargets)
+    nextTargetId = numTargets
+
+    # Tracks: the target they follow (-1 once it is gone), the frames since their last update and id.
+    # To start with, every target has a track
+    trackTarget = targetIds.copy()
+    trackMissed = np.zeros(numTargets, dtype=int)
+    trackIds = np.arange(numTargets)
+    trackPosition = position.copy()
+    nextTrackId = numTargets
+
+    for frame in range(numFrames):
+        # Move the targets. The ones that leave the area, or do not survive, are gone
+        velocity += rng.normal(0, processNoise, size=velocity.shape)
+        position += velocity
+        alive = np.all((position >= 0) & (position <= side), axis=1) & (rng.random(len(targetIds)) < survival)
+        position = position[alive]
+        velocity = velocity[alive]
+        targetIds = targetIds[alive]
+
+        # New targets replace the ones that are gone, on average
+        numBorn = rng.poisson(max(numTargets - len(targetIds), 0) * 0.5 + numTargets * (1 - survival))
+        position = np.vstack((position, rng.uniform(0, side, size=(numBorn, 2))))
+        velocity = np.vstack((velocity, rng.normal(0, speed, size=(numBorn, 2))))
+        targetIds = np.append(targetIds, np.arange(nextTargetId, nextTargetId + numBorn))
+        nextTargetId += numBorn
+
+        # Tracks of targets that are gone coast
+        trackTarget[~np.isin(trackTarget, targetIds)] = -1
+
+        # The predicted position of a track is the position of its target plus the prediction error. The
+        # prediction error grows with every frame without an update. Tracks that lost their target stay
+        # where they were
+        trackVariance = processNoise ** 2 * (1 + trackMissed) ** 2 + measurementNoise ** 2
+        following = np.where(trackTarget != -1)[0]
+        predictionError = rng.normal(0, 1, size=(len(following), 2)) * processNoise * (1 + trackMissed[following,
+                                                                                                      np.newaxis])
+        trackPosition[following] = position[np.searchsorted(targetIds, trackTarget[following])] + predictionError
+        predicted = trackPosition
+
+        # Measurements: detections of the targets and clutter
+        detected = rng.random(len(targetIds)) < pD
+        numClutter = rng.poisson(clutterDensity * side ** 2)
+        measurements = np.vstack((position[detected] + rng.normal(0, measurementNoise,
+                                                                  size=(np.count_nonzero(detected), 2)),
+                                  rng.uniform(0, side, size=(numClutter, 2))))
+        measTargets = np.append(targetIds[detected], np.full(numClutter, -1))
+
+        # Gating. The gate of a track is a circle, find the measurements inside the largest one and then
+        # drop the ones that are outside the gate of their own track
+        maxRadius = np.sqrt(gate * np.max(trackVariance, initial=0))
+        pairs = scipy.spatial.cKDTree(measurements).sparse_distance_matrix(
+            scipy.spatial.cKDTree(predicted), maxRadius, output_type='ndarray')
+        meas = pairs['i'].astype(int)
+        tracks = pairs['j'].astype(int)
+        distance2 = pairs['v'] ** 2 / trackVariance[tracks]
+        inside = distance2 <= gate
+        meas = meas[inside]
+        tracks = tracks[inside]
+        distance2 = distance2[inside]
+
+        # Log-likelihood ratio of target against clutter
+        rewards = (np.log(pD) - np.log(clutterDensity) - np.log(2 * np.pi * trackVariance[tracks])
+                   - 0.5 * distance2)
+
+        shape = (len(measurements), len(trackIds))
+        if dense:
+            mat = np.full(shape, -np.inf)
+            mat[meas, tracks] = rewards
+        else:
+            mat = scipy.sparse.csc_matrix((rewards, (meas, tracks)), shape=shape)
+        yield Frame(mat, trackIds.copy(), measTargets)
+
+        # Update the tracks for the next frame. A track is updated if its target was detected, tracks
+        # that coasted too long are deleted and the targets without a track get one
+        updated = np.isin(trackTarget, targetIds[detected])
+        trackMissed = np.where(updated, 0, trackMissed + 1)
+        keep = trackMissed <= coastFrames
+        trackTarget = trackTarget[keep]
+        trackMissed = trackMissed[keep]
+        trackIds = trackIds[keep]
+        trackPosition = trackPosition[keep]
+
+        newTargets = detected & ~np.isin(targetIds, trackTarget)
+        trackPosition = np.vstack((trackPosition, position[newTargets]))
+        newTargets = targetIds[newTargets]
+        trackTarget = np.append(trackTarget, newTargets)
+        trackMissed = np.append(trackMissed, np.zeros(len(newTargets), dtype=int))
+        trackIds = np.append(trackIds, np.arange(nextTrackId, nextTrackId + len(newTargets)))
+        nextTrackId += len(newTargets)
+
+
+def trackOrigin(previousIds, trackIds):
+    # The index in the previous frame of every track, -1 for new tracks. To be used with remapWarmStart.
+    # The track ids of a frame are always sorted
+    origin = np.full(len(trackIds), fill_value=-1, dtype=int)
+    if len(previousIds) == 0:
+        return origin
+    idx = np.minimum(np.searchsorted(previousIds, trackIds), len(previousIds) - 1)
+    known = previousIds[idx] == trackIds
+    origin[known] = idx[known]
+    return origin
+
+
+def measurementOrigin(previousTargets, measTargets):
+    # The index in the previous frame of the measurement of the same target, -1 for clutter and for targets
+    # that were not detected in the previous frame. Only a simulation knows this, a tracker would use the
+    # track the measurement was assigned to. To be used with remapWarmStart
+    origin = np.full(len(measTargets), fill_value=-1, dtype=int)
+    detections = np.where(previousTargets != -1)[0]
+    order = detections[np.argsort(previousTargets[detections])]
+    if len(order) == 0:
+        return origin
+    idx = np.minimum(np.searchsorted(previousTargets[order], measTargets), len(order) - 1)
+    known = (measTargets != -1) & (previousTargets[order[idx]] == measTargets)
+    origin[known] = order[idx[known]]
+    return origin
@@ -1,7 +1,9 @@
 import numpy
 
+from backend import BACKEND, jit
 
-def assign2D(C, maximize=False):
+
+def assign2D(C, maximize=False, workspace=None, out=None):
     # ASSIGN2D:
     # Solve the two-dimensional assignment problem with a rectangular
     # cost matrix C, scanning row-wise. The problem being solved can
@@ -92,6 +94,14 @@ def assign2D(C, maximize=False):
     # is in [3]. However, the assigned tuples is NOT obtained by attaching
     # col4row to row4col.
     #
+    # workspace     A workspace.Workspace. The shifted copy of C and the
+    #               arrays of the algorithm are then taken from it instead
+    #               of being allocated, and col4row and row4col are views of
+    #               its buffers that the next call overwrites.
+    # out           A tuple (col4row, row4col) of int64 arrays of length
+    #               numRow and numCol to write the assignment into. They
+    #               are then also what is returned.
+    #
     # REFERENCES:
     # [1]   D. F. Crouse, "On Implementing 2D Rectangular Assignment
     #       Algorithms," IEEE Transactions on Aerospace and Electronic
@@ -109,10 +119,10 @@ def assign2D(C, maximize=False):
     # This work was supported by the Office of Naval Research through the
     # Naval Research Laboratory 6.1 Base Program
 
-    C = C.copy()
+    # The shift below makes a new array (or writes into the workspace), so the caller's C is never modified.
+    # C can be in any memory order, of any float or integer type and read-only
     numRow = C.shape[0]
     numCol = C.shape[1]
-    totalNumElsInC = C.size
 
     didFlip = False
 
@@ -127,41 +137,36 @@ def assign2D(C, maximize=False):
     # assignment algorithm to work. This forces all of the elements to be
     # positive. The delta is added back in when computing the gain in the
     # end.
-    if not maximize:
-        CDelta = numpy.inf
-        idxs = numpy.unravel_index([i for i in range(totalNumElsInC)], C.shape)
-        for i in range(0, totalNumElsInC):
-            idx = (idxs[0][i], idxs[1][i])
-            if C[idx] < CDelta:
-                CDelta = C[idx]
+    buffers = None
+    if workspace is not None:
+        # The same shift, written into the workspace by a compiled loop. numpy would buffer the copy
+        shifted, buffers = workspace.assign2DBuffers(numRow, numCol)
+        CDelta = shiftCost(C, maximize, shifted)
+        C = shifted
+
+    elif not maximize:
+        CDelta = float(numpy.min(C, initial=numpy.inf))
 
         # If C is all positive, do not shift.
         if CDelta > 0:
             CDelta = 0
 
-        for i in range(0, totalNumElsInC):
-            idx = (idxs[0][i], idxs[1][i])
-            C[idx] = C[idx] - CDelta
+        # The shifted copy is the only one made. It is float64 whatever C
+        # is, and column major as assign2DBasic scans it a column at a time
+        C = numpy.subtract(C, CDelta, dtype=numpy.float64, order='F')
 
     else:
-        CDelta = -numpy.inf
-        idxs = numpy.unravel_index([i for i in range(totalNumElsInC)], C.shape)
-        for i in range(0, totalNumElsInC):
-            idx = (idxs[0][i], idxs[1][i])
-            if C[idx] > CDelta:
-                CDelta = C[idx]
+        CDelta = float(numpy.max(C, initial=-numpy.inf))
 
         # If C is all negative, do not shift.
         if CDelta < 0:
             CDelta = 0
 
-        for i in range(0, totalNumElsInC):
-            idx = (idxs[0][i], idxs[1][i])
-            C[idx] = -C[idx] + CDelta
+        C = numpy.subtract(CDelta, C, dtype=numpy.float64, order='F')
 
     CDelta = CDelta * numCol
 
-    gain, col4row, row4col = assign2DBasic(C)
+    gain, col4row, row4col = assign2DBasic(C, buffers)
 
     if gain == -1:
         # The problem is infeasible
@@ -181,23 +186,69 @@ def assign2D(C, maximize=False):
         col4row = row4col
         row4col = temp
 
+    if out is not None:
+        out[0][:] = col4row
+        out[1][:] = row4col
+        col4row, row4col = out
+
     return gain, col4row, row4col
 
 
-def assign2DBasic(C):
-    #print(C)
+@jit
+def shiftCost(C, maximize, out):
+    # The shift of assign2D, written into out. Returns the shift CDelta
+    if not maximize:
+        CDelta = numpy.inf
+        for curRow in range(C.shape[0]):
+            for curCol in range(C.shape[1]):
+                CDelta = min(CDelta, C[curRow, curCol])
+        # If C is all positive, do not shift.
+        if CDelta > 0:
+            CDelta = 0.0
+    else:
+        CDelta = -numpy.inf
+        for curRow in range(C.shape[0]):
+            for curCol in range(C.shape[1]):
+                CDelta = max(CDelta, C[curRow, curCol])
+        # If C is all negative, do not shift.
+        if CDelta < 0:
+            CDelta = 0.0
+
+    for curCol in range(C.shape[1]):
+        for curRow in range(C.shape[0]):
+            if not maximize:
+                out[curRow, curCol] = C[curRow, curCol] - CDelta
+            else:
+                out[curRow, curCol] = -C[curRow, curCol] + CDelta
+    return CDelta
+
+
+@jit
+def assign2DBasicBuffers(numRow, numCol):
+    # The arrays assign2DBasic works in, for a numRow x numCol problem:
+    # col4row, row4col, u, v, ScannedColIdx, pred, Row2Scan, shortestPathCost and scannedRows
+    return (numpy.empty(numRow, dtype=numpy.int64), numpy.empty(numCol, dtype=numpy.int64),
+            numpy.empty(numCol), numpy.empty(numRow), numpy.empty(numCol, dtype=numpy.int64),
+            numpy.empty(numRow, dtype=numpy.int64), numpy.empty(numRow, dtype=numpy.int64),
+            numpy.empty(numRow), numpy.empty(numRow, dtype=numpy.bool_))
+
+
+@jit
+def assign2DBasicLoops(C, buffers=None):
+    # The scalar version, one row at a time. It is the one compiled with numba.
+    # buffers are the arrays to work in, see assign2DBasicBuffers. They are allocated if not given
     numRow = C.shape[0]
     numCol = C.shape[1]
 
-    col4row = numpy.full(numRow, -1, dtype=int)
-    row4col = numpy.full(numCol, -1, dtype=int)
-    u = numpy.zeros(numCol)
-    v = numpy.zeros(numRow)
-
-    ScannedColIdx = numpy.empty(numCol, dtype=int)
-    pred = numpy.empty(numRow, dtype=int)
-    Row2Scan = numpy.empty(numRow, dtype=int)
-    shortestPathCost = numpy.empty(numRow)
+    if buffers is None:
+        work = assign2DBasicBuffers(numRow, numCol)
+    else:
+        work = buffers
+    col4row, row4col, u, v, ScannedColIdx, pred, Row2Scan, shortestPathCost, scannedRows = work
+    col4row[:] = -1
+    row4col[:] = -1
+    u[:] = 0
+    v[:] = 0
 
     for curUnassignedCol in range(0, numCol):
         # First, find the shortest augmenting path starting at
@@ -206,9 +257,9 @@ def assign2DBasic(C):
         # Mark everything as not yet scanned. A 1 will be placed in each
         # row entry as it is scanned.
         numColsScanned = 0
-        scannedRows = numpy.zeros(numRow, dtype=bool)
 
         for curRow in range(0, numRow):
+            scannedRows[curRow] = False
             Row2Scan[curRow] = curRow
             # Initially, the cost of the shortest path to each row is not
             # known and will be made infinite.
@@ -303,6 +354,86 @@ def assign2DBasic(C):
 
     return gain, col4row, row4col
 
+
+def assign2DBasicVectorized(C, buffers=None):
+    # The same algorithm as assign2DBasicLoops, but each scan of the unscanned rows is done with
+    # whole-array operations. Instead of compacting a list of rows to scan, the scanned rows are
+    # masked out. argmin returns the first minimum, which is the row the scalar scan picks, so the
+    # results are identical
+    numRow = C.shape[0]
+    numCol = C.shape[1]
+
+    if buffers is None:
+        buffers = assign2DBasicBuffers(numRow, numCol)
+    col4row, row4col, u, v, ScannedColIdx, pred, _, shortestPathCost, scannedRows = buffers
+    col4row[:] = -1
+    row4col[:] = -1
+    u[:] = 0
+    v[:] = 0
+
+    for curUnassignedCol in range(0, numCol):
+        numColsScanned = 0
+        scannedRows[:] = False
+        shortestPathCost[:] = numpy.inf
+
+        sink = -1
+        delta = 0
+        curCol = curUnassignedCol
+
+        while sink == -1:
+            ScannedColIdx[numColsScanned] = curCol
+            numColsScanned = numColsScanned + 1
+
+            # Reduced costs through curCol, kept only where they shorten the path to an unscanned row
+            reducedCost = delta + C[:, curCol] - u[curCol] - v
+            improved = reducedCost < shortestPathCost
+            improved &= ~scannedRows
+            pred[improved] = curCol
+            shortestPathCost[improved] = reducedCost[improved]
+
+            rowCost = numpy.where(scannedRows, numpy.inf, shortestPathCost)
+            closestRow = numpy.argmin(rowCost)
+            if rowCost[closestRow] == numpy.inf:
+                # If the minimum cost row is not finite, then the
+                # problem is not feasible.
+                return -1, col4row, row4col
+
+            scannedRows[closestRow] = True
+            delta = shortestPathCost[closestRow]
+            if col4row[closestRow] == -1:
+                sink = closestRow
+            else:
+                curCol = col4row[closestRow]
+
+        # Update the dual variables of the columns and rows in the augmenting path
+        u[curUnassignedCol] = u[curUnassignedCol] + delta
+        scannedCols = ScannedColIdx[1:numColsScanned]
+        u[scannedCols] = u[scannedCols] + delta - shortestPathCost[row4col[scannedCols]]
+        v[scannedRows] = v[scannedRows] - delta + shortestPathCost[scannedRows]
+
+        curRow = sink
+        curCol = -1
+        while curCol != curUnassignedCol:
+            curCol = pred[curRow]
+            col4row[curRow] = curCol
+            h = row4col[curCol]
+            row4col[curCol] = curRow
+            curRow = h
+
+    # Summed in column order like the scalar version so the gain is the same to the last bit
+    gain = 0
+    for cost in C[row4col, numpy.arange(numCol)]:
+        gain = gain + cost
+
+    return gain, col4row, row4col
+
+
+# Compiled, the scalar loops are faster than the array operations. In plain Python it is the other way round
+if BACKEND == "numba":
+    assign2DBasic = assign2DBasicLoops
+else:
+    assign2DBasic = assign2DBasicVectorized
+
 # LICENSE:
 #
 # The source code is in the public domain and not licensed or under
@@ -0,0 +1,113 @@
+# Purpose: Solve many problems of the same size without allocating, for the high rate loop of a tracker.
+# A Workspace holds every array assign2D and auctionImproved work in, allocated once for the largest
+# problem it has to take (maxMeas measurements and maxTracks tracks). Each solve takes views of the start
+# of those buffers, so after the first solve (and the numba compilation) a solve allocates no arrays.
+# The results are views of the buffers too and are overwritten by the next solve, unless out= is given.
+# A dense float reward matrix, of any memory order and float precision, is converted into the adjacency
+# buffers of the workspace. A TrackAdjacency is used as it is, anything else (scipy.sparse, integer rewards)
+# is converted with trackAdjacency, which allocates.
+
+import numpy as np
+
+import stonesoup_auction
+from auction import auctionImproved, denseAdjacency, trackAdjacency
+
+
+class Workspace:
+
+    def __init__(self, maxMeas, maxTracks, maxPairs=None):
+        # Buffers for problems of up to maxMeas measurements, maxTracks tracks and maxPairs feasible pairs
+        # (every pair if None). For assign2D the measurements and tracks may also be the other way round
+        self.maxMeas = maxMeas
+        self.maxTracks = maxTracks
+        if maxPairs is None:
+            maxPairs = maxMeas * maxTracks
+
+        # The adjacency of a dense reward matrix
+        self.trackPtr = np.zeros(maxTracks + 1, dtype=np.int64)
+        self.measIdx = np.empty(maxPairs, dtype=np.int64)
+        self.rewards = np.empty(maxPairs)
+
+        # auctionImproved
+        self.prices = np.zeros(maxMeas)
+        self.assignments = np.empty(maxTracks, dtype=np.int64)
+        self.owners = np.empty(maxMeas, dtype=np.int64)
+        self.queue = np.empty(max(maxTracks, 1), dtype=np.int64)
+        self.queueState = np.zeros(2, dtype=np.int64)
+        self.held = np.empty(maxTracks)
+
+        # assign2D. It transposes the problem so it has at least as many rows as columns
+        maxRow = max(maxMeas, maxTracks)
+        maxCol = min(maxMeas, maxTracks)
+        self.cost = np.empty(maxMeas * maxTracks)
+        self.basic = stonesoup_auction.assign2DBasicBuffers(maxRow, maxCol)
+        self.assign2DShape = None
+        self.assign2DViews = None
+
+    def checkSize(self, numMeas, numTracks):
+        if numMeas > self.maxMeas or numTracks > self.maxTracks:
+            raise ValueError(f"A {numMeas}x{numTracks} problem does not fit a {self.maxMeas}x{self.maxTracks} "
+                             f"workspace")
+
+    def adjacency(self, rewardMatrix):
+        # The TrackAdjacency of rewardMatrix, in the buffers if it is a dense float matrix
+        if isinstance(rewardMatrix, np.ndarray) and rewardMatrix.ndim == 2 \
+                and np.issubdtype(rewardMatrix.dtype, np.floating):
+            numMeas, numTracks = rewardMatrix.shape
+            self.checkSize(numMeas, numTracks)
+            if numMeas * numTracks > len(self.rewards):
+                raise ValueError(f"A {numMeas}x{numTracks} problem may have more than the {len(self.rewards)} "
+                                 f"feasible pairs of the workspace")
+            return denseAdjacency(rewardMatrix, self.trackPtr[:numTracks + 1], self.measIdx, self.rewards)
+        adjacency = trackAdjacency(rewardMatrix)
+        self.checkSize(*adjacency.shape)
+        return adjacency
+
+    def auctionBuffers(self, numMeas, numTracks, prices=None, assignments=None):
+        # prices, assignments, owners, queue and queueState for auctionImproved. prices and assignments are
+        # the ones given, or the buffers reset to a cold start
+        self.checkSize(numMeas, numTracks)
+        if prices is None:
+            prices = self.prices[:numMeas]
+            prices[:] = 0
+        if assignments is None:
+            assignments = self.assignments[:numTracks]
+            assignments[:] = -1
+        return prices, assignments, self.owners[:numMeas], self.queue, self.queueState
+
+    def gainBuffer(self, numTracks):
+        # Room for the rewards of the assigned pairs, see assignmentGain
+        return self.held[:numTracks]
+
+    def assign2DBuffers(self, numRow, numCol):
+        # The shifted cost matrix and the buffers of assign2DBasic for a numRow x numCol problem. The cost
+        # matrix is column major, assign2DBasic scans it a column at a time. The views of the last shape are
+        # kept, as the next problem usually has the same shape
+        if self.assign2DShape == (numRow, numCol):
+            return self.assign2DViews
+        if numRow * numCol > len(self.cost) or numRow > len(self.basic[0]) or numCol > len(self.basic[1]):
+            raise ValueError(f"A {numRow}x{numCol} problem does not fit a {self.maxMeas}x{self.maxTracks} "
+                             f"workspace")
+        col4row, row4col, u, v, scannedColIdx, pred, row2Scan, shortestPathCost, scannedRows = self.basic
+        buffers = (col4row[:numRow], row4col[:numCol], u[:numCol], v[:numRow], scannedColIdx[:numCol],
+                   pred[:numRow], row2Scan[:numRow], shortestPathCost[:numRow], scannedRows[:numRow])
+        self.assign2DShape = (numRow, numCol)
+        self.assign2DViews = self.cost[:numRow * numCol].reshape((numRow, numCol), order='F'), buffers
+        return self.assign2DViews
+
+    def auction(self, rewardMatrix, debug=True, epsilon=0.01, prices=None, assignments=None, observer=None,
+                duals=False, out=None):
+        # auctionImproved in the workspace. prices and assignments warm start it like in auctionImproved.
+        # out is an array of numTracks ints to write the assignments into, instead of the workspace buffer. A
+        # warm start in assignments is copied into it, without one it starts out unassigned.
+        # Returns the same as auctionImproved
+        adjacency = self.adjacency(rewardMatrix)
+        if out is not None:
+            out[:] = -1 if assignments is None else assignments
+            assignments = out
+        return auctionImproved(adjacency, debug=debug, epsilon=epsilon, prices=prices, assignments=assignments,
+                               observer=observer, duals=duals, workspace=self)
+
+    def assign2D(self, C, maximize=False, out=None):
+        # stonesoup_auction.assign2D in the workspace, out is a tuple (col4row, row4col) to write the result into
+        return stonesoup_auction.assign2D(C, maximize, workspace=self, out=out)